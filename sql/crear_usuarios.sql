@@ -1,9 +1,43 @@
 CREATE TABLE Users (
     id VARCHAR(20) NOT NULL PRIMARY KEY,
-    age VARCHAR(2) NOT NULL,
+    age SMALLINT NOT NULL,
     marital_status TEXT NOT NULL,
-    spouse_age VARCHAR(2),
+    spouse_age SMALLINT,
     spouse_gender TEXT,
-    property_value VARCHAR(20) NOT NULL,
-    interest_rate VARCHAR(4) NOT NULL
+    property_value NUMERIC(20, 2) NOT NULL,
+    interest_rate NUMERIC(5, 2) NOT NULL,
+    gender TEXT,
+    quotas SMALLINT,
+    monthly_rate DOUBLE PRECISION,
+    monthly_fee NUMERIC(20, 2),
+    computed_at TIMESTAMPTZ,
+    version BIGINT,
+    updated_at TIMESTAMPTZ
+);
+
+CREATE INDEX users_age_interest_rate_idx ON Users (age, interest_rate);
+CREATE INDEX users_interest_rate_idx ON Users (interest_rate);
+CREATE INDEX users_stale_quotes_idx ON Users (id) WHERE computed_at IS NULL;
+CREATE INDEX users_marital_status_id_idx ON Users (marital_status, id);
+CREATE INDEX users_version_idx ON Users (version, id);
+
+-- Cada escritura de los datos del cliente le da a la fila el ID de su transacción como versión
+CREATE FUNCTION users_track_change() RETURNS trigger AS $$
+BEGIN
+    NEW.version := txid_current();
+    NEW.updated_at := now();
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER users_track_change BEFORE INSERT OR UPDATE OF
+    id, age, marital_status, spouse_age, spouse_gender, property_value, interest_rate, gender ON Users
+FOR EACH ROW EXECUTE FUNCTION users_track_change();
+
+-- Posición de los procesos que recalculan las cuotas de los clientes modificados
+CREATE TABLE change_checkpoints (
+    worker TEXT NOT NULL PRIMARY KEY,
+    version BIGINT NOT NULL,
+    id VARCHAR(20) NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
 );
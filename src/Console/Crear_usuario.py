@@ -42,6 +42,7 @@ def desiciones(opcion):
                 print("DATOS PERSONALES")
                 cedula = int(input("Por favor ingrese su cédula: "))
                 edad = int(input("Por favor ingrese su edad actual: "))
+                genero = input("Por favor ingrese su género: ")
                 estado_civil = input("Por favor ingrese su estado civil: ").title()
                 
                 # Verificar si está casado
@@ -60,7 +61,7 @@ def desiciones(opcion):
                 print("-------------------------------------------------------------------------")
                 try:
                     # Crear el usuario con los nuevos datos
-                    usuario = User(cedula, edad, estado_civil, edad_conyugue, sexo_conyugue, valor_propiedad, tasa_interes)
+                    usuario = User(cedula, edad, estado_civil, edad_conyugue, sexo_conyugue, valor_propiedad, tasa_interes, genero)
                     ClientController.insert_client(usuario)
                 finally:
                     print("CLIENT INSERTED SUCCESSFULLY\n")
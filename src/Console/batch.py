@@ -0,0 +1,208 @@
+import sys
+sys.path.append('src')
+sys.path.append('.')
+
+import argparse
+import csv
+import json
+import time
+from itertools import islice
+from typing import NamedTuple
+
+import numpy as np
+
+from ReverseMortgage.ClientBatch import ClientBatch
+from ReverseMortgage.MonthlyPayment import ERROR_MESSAGES, VALID
+from controller.Quotes import ENGINE_GENDERS, ENGINE_MARITAL_STATUS, USER_COLUMNS
+
+# Applicants read, validated and priced at a time; memory does not grow with the size of the input
+CHUNK_SIZE = 10000
+
+FORMATS = ('csv', 'jsonl')
+
+# Columns appended to every applicant in the output, empty when the applicant is rejected
+RESULT_COLUMNS = ('quotas', 'monthly_rate', 'monthly_fee', 'error')
+
+NOT_A_NUMBER = 'Property value and interest must be numbers'
+NOT_JSON = 'The line is not valid JSON'
+NOT_AN_OBJECT = 'The applicant must be a JSON object'
+
+
+class BatchReport(NamedTuple):
+    """
+    Applicants read by price_stream, how many of them were rejected and the time it took
+    """
+    rows: int
+    rejected: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+def is_number(value) -> bool:
+    try:
+        float(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def client_batch(rows: list, columns: tuple) -> ClientBatch:
+    return ClientBatch.from_rows(rows, columns=columns, gender_aliases=ENGINE_GENDERS,
+                                 marital_status_aliases=ENGINE_MARITAL_STATUS)
+
+
+def price_chunk(rows: list, columns: tuple = USER_COLUMNS) -> list:
+    """
+    Validates and prices at once rows holding the values of columns, which name at least the USER_COLUMNS
+
+    Returns one (quotas, monthly_rate, monthly_fee, error) tuple per row, error being None for priced rows
+    and the other values None for rejected ones
+    """
+    results = [(None, None, None, NOT_A_NUMBER)] * len(rows)
+    positions = np.arange(len(rows))
+    try:
+        batch = client_batch(rows, columns)
+    except ValueError:
+        # Only a chunk holding text where a number goes takes the slow path, checking row by row
+        property_value, interest_rate = columns.index('property_value'), columns.index('interest_rate')
+        positions = np.array([index for index, row in enumerate(rows)
+                              if is_number(row[property_value]) and is_number(row[interest_rate])], dtype=np.intp)
+        batch = client_batch([rows[index] for index in positions], columns)
+
+    # Missing values are read as NaN
+    numbers = np.isfinite(batch.property_values) & np.isfinite(batch.interests)
+    batch, positions = batch[numbers], positions[numbers]
+
+    error_codes = batch.validate()
+    for index, code in zip(positions.tolist(), error_codes.tolist()):
+        if code != VALID:
+            results[index] = (None, None, None, ERROR_MESSAGES[code])
+
+    valid = error_codes == VALID
+    if valid.any():
+        monthly_fees, quotas, monthly_rates = batch[valid].calculate_monthly_fees()
+        for index, fee, quota, rate in zip(positions[valid].tolist(), monthly_fees.tolist(), quotas.tolist(),
+                                           monthly_rates.tolist()):
+            results[index] = (quota, rate, fee, None)
+    return results
+
+
+def chunks(records, chunk_size: int):
+    records = iter(records)
+    while chunk := list(islice(records, chunk_size)):
+        yield chunk
+
+
+def price_csv(input, output, chunk_size: int) -> tuple:
+    """
+    Prices a CSV file whose header names the USER_COLUMNS, writing it back with the RESULT_COLUMNS appended
+    """
+    reader = csv.reader(input)
+    header = [name.strip() for name in next(reader, [])]
+    missing = [name for name in USER_COLUMNS if name not in header and not name.startswith('spouse_')]
+    if missing:
+        raise ValueError(f'Missing columns: {", ".join(missing)}')
+    columns, width = tuple(header), len(header)
+
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(header + list(RESULT_COLUMNS))
+    rows = rejected = 0
+    for chunk in chunks((record for record in reader if record), chunk_size):
+        # Short records are completed with empty values, the chunk is read by column
+        chunk = [record if len(record) >= width else record + [''] * (width - len(record)) for record in chunk]
+        results = price_chunk(chunk, columns)
+        writer.writerows(record + ['' if value is None else value for value in result]
+                         for record, result in zip(chunk, results))
+        rows += len(chunk)
+        rejected += sum(1 for result in results if result[3] is not None)
+    return rows, rejected
+
+
+def read_jsonl(input):
+    """
+    Yields a (record, error) pair per non-blank line, error being None for applicant objects
+
+    A line that is not valid JSON or not an object is yielded as {"line": <the line>} with the reason
+    """
+    for line in input:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield {'line': line.rstrip('\r\n')}, f'{NOT_JSON}: {e}'
+            continue
+        if isinstance(record, dict):
+            yield record, None
+        else:
+            yield {'line': line.rstrip('\r\n')}, NOT_AN_OBJECT
+
+
+def price_jsonl(input, output, chunk_size: int) -> tuple:
+    """
+    Prices a JSON Lines file of applicant objects keyed by the USER_COLUMNS, writing each object back with the RESULT_COLUMNS added
+
+    Lines that are not applicant objects are written back as rejected, in their place
+    """
+    rows = rejected = 0
+    for chunk in chunks(read_jsonl(input), chunk_size):
+        applicants = [tuple(record.get(name) for name in USER_COLUMNS) for record, error in chunk if error is None]
+        priced = iter(price_chunk(applicants) if applicants else [])
+        results = [next(priced) if error is None else (None, None, None, error) for _, error in chunk]
+        for (record, _), result in zip(chunk, results):
+            record.update(zip(RESULT_COLUMNS, result))
+            output.write(json.dumps(record, ensure_ascii=False))
+            output.write('\n')
+        rows += len(chunk)
+        rejected += sum(1 for result in results if result[3] is not None)
+    return rows, rejected
+
+
+def price_stream(input, output, format='csv', chunk_size=CHUNK_SIZE) -> BatchReport:
+    """
+    Prices every applicant of input, streaming the results to output in the same format, chunk_size applicants at a time
+
+    Rejected applicants are written with the reason in the error column instead of stopping the run
+    """
+    if chunk_size <= 0:
+        raise ValueError(f'Invalid chunk size: {chunk_size}')
+    started = time.perf_counter()
+    rows, rejected = (price_csv if format == 'csv' else price_jsonl)(input, output, chunk_size)
+    return BatchReport(rows, rejected, time.perf_counter() - started)
+
+
+def input_format(path: str, format: str | None) -> str:
+    """
+    Returns the given format, or the one of the file extension; standard input is read as CSV by default
+    """
+    if format:
+        return format
+    return 'jsonl' if path.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Calcula la hipoteca inversa de los solicitantes de un archivo CSV o JSONL')
+    parser.add_argument('input', nargs='?', default='-', help='archivo de solicitantes, - para la entrada estándar')
+    parser.add_argument('--format', choices=FORMATS, help='formato de la entrada y la salida, por defecto según la extensión')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='solicitantes calculados a la vez')
+    arguments = parser.parse_args(arguments)
+
+    format = input_format(arguments.input, arguments.format)
+    try:
+        if arguments.input == '-':
+            report = price_stream(sys.stdin, sys.stdout, format, arguments.chunk_size)
+        else:
+            with open(arguments.input, newline='' if format == 'csv' else None, encoding='utf-8') as input:
+                report = price_stream(input, sys.stdout, format, arguments.chunk_size)
+    except (OSError, ValueError) as e:
+        parser.exit(2, f'Error: {e}\n')
+
+    print(f'Priced {report.rows} rows ({report.rejected} rejected) in {report.seconds:.2f} s: '
+          f'{report.rows_per_second:.0f} rows/s', file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,106 @@
+import numbers
+
+
+def parse_int(value):
+    """
+    Parses a whole number as stored in the users table, keeping None, empty and unparseable values as they are
+
+    Only integers, floats without decimals and strings of digits are whole numbers; 70.9 is kept as it is
+    instead of being truncated, so the checks of the controller reject it
+    """
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    if isinstance(value, str):
+        text = value.strip()
+        if text == "":
+            return None
+        digits = text[1:] if text[0] in "+-" else text
+        return int(text) if digits.isdecimal() else value
+    return value
+
+
+def parse_float(value):
+    """
+    Parses a decimal number as stored in the users table, keeping None, empty and unparseable values as they are
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value if value != "" else None
+
+
 class User:
     """
     Belongs to the Business Rules Layer (Model)
 
     Represents a Reverse Mortgage user in the application
+
+    The numeric attributes are parsed once when the user is created: age and spouse_age as int,
+    property_value and interest_rate as float. Values that are not numbers are kept as they are, so the
+    checks of the controller can reject them. Users are equal when all their attributes are equal.
+    The id can not change once the user is created and users are hashed by it, so they can be kept
+    in sets and used as dict keys while their other attributes change
     """
-    def __init__(self, id, age, marital_status, spouse_age, spouse_gender, property_value, interest_rate):
-        self.id = id
-        self.age = age
+    __slots__ = ("_id", "age", "marital_status", "spouse_age", "spouse_gender", "property_value", "interest_rate", "gender")
+
+    def __init__(self, id, age, marital_status, spouse_age, spouse_gender, property_value, interest_rate, gender=None):
+        self._id = id
+        self.age = parse_int(age)
         self.marital_status = marital_status
-        self.spouse_age = spouse_age
+        self.spouse_age = parse_int(spouse_age)
         self.spouse_gender = spouse_gender
-        self.property_value = property_value
-        self.interest_rate = interest_rate
+        self.property_value = parse_float(property_value)
+        self.interest_rate = parse_float(interest_rate)
+        self.gender = gender
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Builds a user straight from a row of the users table read in USER_COLUMNS order, without parsing its values again
+
+        The row factory of the storage backends; the NUMERIC columns are read as float
+        """
+        user = cls.__new__(cls)
+        (user._id, user.age, user.marital_status, user.spouse_age, user.spouse_gender,
+         property_value, interest_rate, user.gender) = row
+        user.property_value = float(property_value)
+        user.interest_rate = float(interest_rate)
+        return user
+
+    @property
+    def id(self):
+        """
+        Identity number of the user, read-only
+        """
+        return self._id
+
+    def as_tuple(self):
+        """
+        Returns the attributes of the user in the column order of the users table
+        """
+        return (self.id, self.age, self.marital_status, self.spouse_age, self.spouse_gender,
+                self.property_value, self.interest_rate, self.gender)
+
+    def __copy__(self):
+        user = User.__new__(User)
+        (user._id, user.age, user.marital_status, user.spouse_age, user.spouse_gender,
+         user.property_value, user.interest_rate, user.gender) = self.as_tuple()
+        return user
+
+    def __eq__(self, other):
+        # Compared by attributes rather than class, the model may be imported as Model.User and src.Model.User
+        as_tuple = getattr(other, "as_tuple", None)
+        if as_tuple is None:
+            return NotImplemented
+        return self.as_tuple() == as_tuple()
+
+    def __hash__(self):
+        # Only the id, which can not change; users that are equal have the same id
+        return hash(self._id)
 
     def __repr__(self):
         """
@@ -30,14 +119,7 @@ class User:
         """
         Compares the current object with another instance of the User class
         Returns True if all attributes match, otherwise False
-        """
-        return (
-            self.id == compare_with.id and
-            self.age == compare_with.age and
-            self.marital_status == compare_with.marital_status and
-            self.spouse_age == compare_with.spouse_age and
-            self.spouse_gender == compare_with.spouse_gender and
-            self.property_value == compare_with.property_value and
-            self.interest_rate == compare_with.interest_rate
-        )
 
+        Numeric attributes are compared by value, so "65" matches the 65 read from the database
+        """
+        return self == compare_with
@@ -0,0 +1,293 @@
+import csv
+
+import numpy as np
+
+from ReverseMortgage.MonthlyPayment import (AVAILABLE_GENDERS, AVAILABLE_MARITAL_STATUS, INVALID_AGE_CODE, MARRIED_CODE,
+                                            UNKNOWN_CODE, _calculate_prepared, _parse_ages, _prepare_codes)
+from ReverseMortgage.MortalityTable import MortalityTable
+
+# Names of the columns read by ClientBatch.from_rows and ClientBatch.from_csv, as in the users table
+COLUMNS = ('id', 'age', 'marital_status', 'spouse_age', 'spouse_gender', 'property_value', 'interest_rate', 'gender')
+
+# Variable-width strings stored inside the array, without one Python object per row
+ID_DTYPE = np.dtypes.StringDType()
+
+
+def _encode(values, categories: list, aliases: dict | None) -> np.ndarray:
+    """
+    Converts a column of categories to int8 codes, their position in categories or UNKNOWN_CODE.
+
+    Convierte una columna de categorías a códigos int8, su posición en categories o UNKNOWN_CODE.
+
+    Values are compared without case or surrounding spaces, after translating them with aliases.
+    Each distinct value is looked up once.
+    """
+    aliases = aliases or {}
+    codes = {}
+
+    def code(value):
+        found = codes.get(value)
+        if found is None:
+            name = '' if value is None else str(value).strip().lower()
+            name = str(aliases.get(name, name)).lower()
+            found = codes[value] = categories.index(name) if name in categories else UNKNOWN_CODE
+        return found
+
+    return np.fromiter((code(value) for value in values), dtype=np.int8)
+
+
+def _whole_numbers(values) -> list:
+    """
+    Converts the strings of digits of a column, such as ages read from a file, to int; other values are kept as they are.
+
+    Convierte las cadenas de dígitos de una columna, como edades leídas de un archivo, a int; los demás valores se mantienen.
+
+    "65.0" is not converted, each distinct string is parsed once.
+    """
+    parsed = {}
+
+    def whole(value):
+        if not isinstance(value, str):
+            return value
+        found = parsed.get(value)
+        if found is None:
+            text = value.strip()
+            digits = text[1:] if text[:1] in '+-' else text
+            found = parsed[value] = int(text) if digits.isdecimal() else value
+        return found
+
+    return [whole(value) for value in values]
+
+
+def _encode_ages(values, rows: np.ndarray) -> np.ndarray:
+    """
+    Converts a column of ages to int8, INVALID_AGE_CODE for the rows (among the given ones) that are not integers.
+
+    Convierte una columna de edades a int8, INVALID_AGE_CODE en las filas (entre las indicadas) que no son enteros.
+
+    Strings of digits are read as integers; other values follow the rule of the engine. Ages out of the
+    int8 range are clipped, which keeps the error the engine reports for them.
+    """
+    if not (isinstance(values, np.ndarray) and values.dtype.kind in 'iu'):
+        values = _whole_numbers(values)
+    ages, invalid = _parse_ages(values, rows)
+    ages = np.clip(ages, INVALID_AGE_CODE + 1, np.iinfo(np.int8).max).astype(np.int8)
+    ages[invalid] = INVALID_AGE_CODE
+    return ages
+
+
+def _numbers(values) -> np.ndarray:
+    """
+    Converts a column of property values or interests to float64.
+
+    Convierte una columna de valores de propiedad o de intereses a float64.
+
+    Values that are not scalars, such as a dict or a list read from JSON, raise ValueError like a text would.
+    """
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except TypeError as e:
+        raise ValueError(f'Property values and interests must be numbers: {e}') from e
+
+
+class ClientBatch:
+    """
+    Applicants stored by column in typed NumPy arrays, priced without creating an object per row.
+
+    Solicitantes guardados por columna en arreglos tipados de NumPy, calculados sin crear un objeto por fila.
+
+    Ages are int8 and genders and marital statuses int8 codes, their position in AVAILABLE_GENDERS and
+    AVAILABLE_MARITAL_STATUS (UNKNOWN_CODE when not recognised). Ages that are not whole numbers are kept as
+    INVALID_AGE_CODE. Property values and interests are float64. A row takes about 37 bytes.
+    """
+
+    __slots__ = ('ids', 'ages', 'genders', 'marital_statuses', 'spouses_ages', 'spouses_genders', 'property_values',
+                 'interests')
+
+    def __init__(self, ids, ages, genders, marital_statuses, spouses_ages, spouses_genders, property_values, interests):
+        """
+        Wraps columns that are already typed; arrays of the right dtype are used without copying them.
+
+        Envuelve columnas que ya están tipadas; los arreglos del dtype correcto se usan sin copiarlos.
+
+        Parameters
+        ----------
+        ids : array_like of str
+            The ID numbers of the clients / Números de identificación de los clientes
+        ages, spouses_ages : array_like of int8
+            The ages of the clients and their spouses / Edades de los clientes y sus cónyuges
+        genders, spouses_genders, marital_statuses : array_like of int8
+            Codes of the genders and marital statuses / Códigos de los géneros y estados civiles
+        property_values, interests : array_like of float64
+            The values of the properties and the annual interest rates / Valores de las propiedades y tasas de interés anuales
+        """
+        # Each StringDType array may own its own string storage, so any of them is taken as it is
+        self.ids = ids if isinstance(getattr(ids, 'dtype', None), np.dtypes.StringDType) else np.asarray(ids, dtype=ID_DTYPE)
+        self.ages = np.asarray(ages, dtype=np.int8)
+        self.genders = np.asarray(genders, dtype=np.int8)
+        self.marital_statuses = np.asarray(marital_statuses, dtype=np.int8)
+        self.spouses_ages = np.asarray(spouses_ages, dtype=np.int8)
+        self.spouses_genders = np.asarray(spouses_genders, dtype=np.int8)
+        self.property_values = np.asarray(property_values, dtype=np.float64)
+        self.interests = np.asarray(interests, dtype=np.float64)
+
+        if len({column.shape for column in self.columns()}) != 1:
+            raise ValueError('Every column of a client batch must have the same length')
+
+    @classmethod
+    def from_columns(cls, ids, ages, genders, marital_statuses, spouses_ages, spouses_genders, property_values, interests,
+                     gender_aliases: dict | None = None, marital_status_aliases: dict | None = None) -> 'ClientBatch':
+        """
+        Builds a batch from columns of raw values, such as strings read from a file or values read from a database.
+
+        Construye un lote a partir de columnas de valores sin procesar, como cadenas leídas de un archivo o valores leídos de una base de datos.
+
+        Parameters
+        ----------
+        gender_aliases, marital_status_aliases : dict | None
+            Lowercase names translated to the names of the engine, e.g. {'hombre': 'M'} /
+            Nombres en minúsculas traducidos a los nombres del motor, p. ej. {'hombre': 'M'}
+
+        Raises
+        ------
+        ValueError
+            If a property value or interest is not a number / Si un valor de la propiedad o un interés no es un número
+        """
+        marital_statuses = _encode(marital_statuses, AVAILABLE_MARITAL_STATUS, marital_status_aliases)
+        married = marital_statuses == MARRIED_CODE
+        return cls(
+            ids=np.asarray(ids, dtype=ID_DTYPE),
+            ages=_encode_ages(ages, np.ones(married.shape, dtype=bool)),
+            genders=_encode(genders, AVAILABLE_GENDERS, gender_aliases),
+            marital_statuses=marital_statuses,
+            spouses_ages=_encode_ages(spouses_ages, married),
+            spouses_genders=_encode(spouses_genders, AVAILABLE_GENDERS, gender_aliases),
+            property_values=_numbers(property_values),
+            interests=_numbers(interests),
+        )
+
+    @classmethod
+    def from_rows(cls, rows, columns: tuple = COLUMNS, **aliases) -> 'ClientBatch':
+        """
+        Builds a batch from rows such as the ones returned by a database cursor.
+
+        Construye un lote a partir de filas como las que devuelve un cursor de base de datos.
+
+        Parameters
+        ----------
+        rows : iterable of sequence
+            Rows holding the values of columns, in that order / Filas con los valores de columns, en ese orden
+        columns : tuple of str
+            Names of the values of each row, among COLUMNS / Nombres de los valores de cada fila, entre COLUMNS
+        aliases :
+            gender_aliases and marital_status_aliases, as in from_columns / gender_aliases y marital_status_aliases, como en from_columns
+        """
+        values = list(zip(*rows)) or [()] * len(columns)
+        return cls._from_named_columns(dict(zip(columns, values)), **aliases)
+
+    @classmethod
+    def from_csv(cls, file, **aliases) -> 'ClientBatch':
+        """
+        Builds a batch from a CSV file whose header names the COLUMNS, reading it row by row.
+
+        Construye un lote a partir de un archivo CSV cuyo encabezado nombra las COLUMNS, leyéndolo fila por fila.
+
+        Parameters
+        ----------
+        file : str or file object
+            Path of the file or an open text file / Ruta del archivo o un archivo de texto abierto
+        aliases :
+            gender_aliases and marital_status_aliases, as in from_columns / gender_aliases y marital_status_aliases, como en from_columns
+        """
+        if isinstance(file, str):
+            with open(file, newline='', encoding='utf-8') as opened:
+                return cls.from_csv(opened, **aliases)
+
+        reader = csv.reader(file)
+        header = [name.strip() for name in next(reader, [])]
+        values = {name: [] for name in header}
+        appends = [values[name].append for name in header]
+        for row in reader:
+            if row:
+                for append, value in zip(appends, row):
+                    append(value)
+        return cls._from_named_columns(values, **aliases)
+
+    @classmethod
+    def _from_named_columns(cls, values: dict, **aliases) -> 'ClientBatch':
+        """
+        Builds a batch from a dict of raw columns named as in COLUMNS; spouse columns may be missing.
+
+        Construye un lote a partir de un dict de columnas sin procesar nombradas como en COLUMNS; las columnas del cónyuge pueden faltar.
+        """
+        missing = [name for name in COLUMNS if name not in values and not name.startswith('spouse_')]
+        if missing:
+            raise ValueError(f'Missing client batch columns: {", ".join(missing)}')
+        size = len(values['id'])
+        return cls.from_columns(
+            values['id'], values['age'], values['gender'], values['marital_status'],
+            values.get('spouse_age', [None] * size), values.get('spouse_gender', [None] * size),
+            values['property_value'], values['interest_rate'],
+            **aliases)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, rows) -> 'ClientBatch':
+        """
+        Returns the batch of the selected rows, given by a boolean mask, indexes or a slice.
+
+        Devuelve el lote de las filas seleccionadas, dadas por una máscara booleana, índices o un rango.
+        """
+        return ClientBatch(*(column[rows] for column in self.columns()))
+
+    def columns(self) -> tuple:
+        """
+        Returns the column arrays in the order of the constructor.
+
+        Devuelve los arreglos de columnas en el orden del constructor.
+        """
+        return (self.ids, self.ages, self.genders, self.marital_statuses, self.spouses_ages, self.spouses_genders,
+                self.property_values, self.interests)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Memory taken by the columns, without the characters of ID numbers longer than 15 characters.
+
+        Memoria ocupada por las columnas, sin los caracteres de los números de identificación de más de 15 caracteres.
+        """
+        return sum(column.nbytes for column in self.columns())
+
+    def _prepare(self) -> dict:
+        married = self.marital_statuses == MARRIED_CODE
+        return _prepare_codes(self.ages, self.ages == INVALID_AGE_CODE, self.genders, self.marital_statuses,
+                              self.spouses_ages, married & (self.spouses_ages == INVALID_AGE_CODE), self.spouses_genders,
+                              self.property_values, self.interests)
+
+    def validate(self) -> np.ndarray:
+        """
+        Validates every row at once, as validate_batch does, without raising exceptions.
+
+        Valida todas las filas a la vez, como lo hace validate_batch, sin lanzar excepciones.
+
+        Returns
+        -------
+        np.ndarray of int8
+            The error code of every row, VALID (0) when the row can be priced / El código de error de cada fila, VALID (0) cuando la fila se puede calcular
+        """
+        return self._prepare()['error_codes']
+
+    def calculate_monthly_fees(self, mortality_table: MortalityTable | None = None) -> tuple:
+        """
+        Calculates the monthly fee of every row, as calculate_monthly_fees does, reading the typed columns directly.
+
+        Calcula la cuota mensual de cada fila, como lo hace calculate_monthly_fees, leyendo directamente las columnas tipadas.
+
+        Returns
+        -------
+        tuple of np.ndarray
+            The monthly fees rounded to two decimals, the quotas and the monthly rates /
+            Las cuotas mensuales redondeadas a dos decimales, el número de cuotas y las tasas mensuales
+        """
+        return _calculate_prepared(self._prepare(), mortality_table)
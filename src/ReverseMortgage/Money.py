@@ -0,0 +1,177 @@
+from typing import Iterator, NamedTuple
+
+import numpy as np
+
+from ReverseMortgage.MonthlyPayment import ReverseMortgage, ScheduleRow, _round_cents, calculate_monthly_fees
+from ReverseMortgage.MortalityTable import MortalityTable
+
+# Rounding policy of the money mode: amounts are rounded half to even on their exact
+# value, the same as the built-in round(amount, 2) used by the float engine
+ROUNDING_POLICY = 'half-even'
+
+
+class ReconciliationReport(NamedTuple):
+    """
+    Differences between amounts kept as floats and the same amounts kept as integer cents.
+
+    Diferencias entre montos guardados como flotantes y los mismos montos guardados como centavos enteros.
+    """
+    rows: np.ndarray
+    float_cents: np.ndarray
+    exact_cents: np.ndarray
+    float_total_cents: int
+    exact_total_cents: int
+
+    @property
+    def drift_cents(self) -> int:
+        """
+        Cents the float total drifted from the exact total.
+
+        Centavos que el total flotante se desvió del total exacto.
+        """
+        return self.float_total_cents - self.exact_total_cents
+
+    def summary(self, limit: int = 20) -> str:
+        """
+        Returns a plain-text summary of the reconciliation, listing up to limit differing rows.
+
+        Devuelve un resumen en texto plano de la conciliación, listando hasta limit filas con diferencias.
+        """
+        lines = [
+            f'Rows with differences: {self.rows.shape[0]}',
+            f'Float total: {format_cents(self.float_total_cents)}',
+            f'Exact total: {format_cents(self.exact_total_cents)}',
+            f'Drift: {format_cents(self.drift_cents)}',
+        ]
+        for row, float_cents, exact_cents in zip(self.rows[:limit].tolist(), self.float_cents[:limit].tolist(), self.exact_cents[:limit].tolist()):
+            lines.append(f'  {row}: float {format_cents(float_cents)} exact {format_cents(exact_cents)}')
+        return '\n'.join(lines)
+
+
+def to_cents(amounts):
+    """
+    Converts amounts to integer cents with the ROUNDING_POLICY, an int for scalars and an int64 array otherwise.
+
+    Convierte montos a centavos enteros con la ROUNDING_POLICY, un int para escalares y un arreglo int64 en otro caso.
+    """
+    if np.ndim(amounts) == 0:
+        return int(round(round(float(amounts), 2) * 100))
+    return np.rint(_round_cents(amounts) * 100).astype(np.int64)
+
+
+def from_cents(cents):
+    """
+    Converts integer cents back to amounts, a float for scalars and a float64 array otherwise.
+
+    Convierte centavos enteros de vuelta a montos, un float para escalares y un arreglo float64 en otro caso.
+    """
+    if np.ndim(cents) == 0:
+        return int(cents) / 100
+    return np.asarray(cents, dtype=np.int64) / 100
+
+
+def format_cents(cents: int) -> str:
+    """
+    Formats integer cents as a currency amount without going through floats.
+
+    Da formato de moneda a centavos enteros sin pasar por flotantes.
+    """
+    sign = '-' if cents < 0 else ''
+    units, remainder = divmod(abs(int(cents)), 100)
+    return f'{sign}${units:,}.{remainder:02d}'
+
+
+def monthly_fee_cents(mortgage: ReverseMortgage) -> int:
+    """
+    Returns the monthly fee of a reverse mortgage in integer cents.
+
+    Devuelve la cuota mensual de una hipoteca inversa en centavos enteros.
+    """
+    return to_cents(mortgage.calculate_monthly_fee())
+
+
+def calculate_monthly_fees_cents(ages, genders, marital_statuses, spouses_ages, spouses_genders, property_values, interests,
+                                 mortality_table: MortalityTable | None = None):
+    """
+    Same as calculate_monthly_fees, with the monthly fees returned as int64 cents.
+
+    Igual que calculate_monthly_fees, con las cuotas mensuales devueltas como centavos int64.
+    """
+    monthly_fees, quotas, monthly_rates = calculate_monthly_fees(
+        ages, genders, marital_statuses, spouses_ages, spouses_genders, property_values, interests, mortality_table)
+    return np.rint(monthly_fees * 100).astype(np.int64), quotas, monthly_rates
+
+
+def schedule_cents(mortgage: ReverseMortgage) -> Iterator[ScheduleRow]:
+    """
+    Yields the disbursement schedule of ReverseMortgage.schedule() with every amount in integer cents.
+
+    Genera el cronograma de desembolsos de ReverseMortgage.schedule() con cada monto en centavos enteros.
+
+    The balance is kept as an exact integer, only the monthly interest is rounded.
+    """
+    payment = monthly_fee_cents(mortgage)
+    balance = to_cents(mortgage.property_value)
+    for month in range(1, mortgage.quotas + 1):
+        interest = round(balance * mortgage.monthly_rate)
+        balance += interest - payment
+        yield ScheduleRow(month, payment, interest, balance)
+
+
+def calculate_schedules_cents(property_values, monthly_fees, monthly_rates, quotas, out: np.ndarray | None = None) -> np.ndarray:
+    """
+    Same as calculate_schedules, filling an int64 block of cents; monthly_fees are given in cents.
+
+    Igual que calculate_schedules, llenando un bloque int64 de centavos; monthly_fees se dan en centavos.
+    """
+    balances = to_cents(np.asarray(property_values, dtype=np.float64))
+    monthly_fees = np.asarray(monthly_fees, dtype=np.int64)
+    monthly_rates = np.asarray(monthly_rates, dtype=np.float64)
+    quotas = np.asarray(quotas)
+    months = int(quotas.max()) if quotas.size else 0
+
+    if out is None:
+        out = np.zeros((balances.size, months, 3), dtype=np.int64)
+    elif out.dtype != np.int64 or out.shape[0] != balances.size or out.shape[1] < months or out.shape[2] != 3:
+        raise ValueError(f'Schedule block of shape {out.shape} and type {out.dtype} can not hold {balances.size} loans of up to {months} months in cents')
+    else:
+        out[...] = 0
+
+    for month in range(months):
+        active = np.flatnonzero(quotas > month)
+        interests = np.rint(balances[active] * monthly_rates[active]).astype(np.int64)
+        balances[active] += interests - monthly_fees[active]
+        out[active, month, 0] = monthly_fees[active]
+        out[active, month, 1] = interests
+        out[active, month, 2] = balances[active]
+
+    return out
+
+
+def reconcile(float_amounts, exact_cents) -> ReconciliationReport:
+    """
+    Compares amounts computed by the float engine with the same amounts computed in integer cents.
+
+    Compara montos calculados por el motor flotante con los mismos montos calculados en centavos enteros.
+
+    Parameters
+    ----------
+    float_amounts : array_like of float
+        Amounts of the float engine, for example calculate_schedules balances / Montos del motor flotante
+    exact_cents : array_like of int
+        The same amounts in cents, for example calculate_schedules_cents balances / Los mismos montos en centavos
+    """
+    float_amounts = np.asarray(float_amounts, dtype=np.float64)
+    exact_cents = np.asarray(exact_cents, dtype=np.int64)
+    float_cents = to_cents(float_amounts)
+    different = float_cents != exact_cents
+    rows = np.argwhere(different)
+    if float_amounts.ndim == 1:
+        rows = rows[:, 0]
+    return ReconciliationReport(
+        rows,
+        float_cents[different],
+        exact_cents[different],
+        to_cents(float(np.sum(float_amounts))),
+        int(np.sum(exact_cents)),
+    )
@@ -0,0 +1,119 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+
+from ReverseMortgage.MonthlyPayment import ReverseMortgage
+
+# Number of paths simulated by each task sent to the process pool
+CHUNK_SIZE = 2000
+
+# Percentiles of the terminal loan-to-value reported by default
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95, 99)
+
+
+class MarketScenario(NamedTuple):
+    """
+    Parameters of the stochastic interest rate and property appreciation paths.
+
+    Parámetros de las trayectorias estocásticas de la tasa de interés y de la valorización de la propiedad.
+
+    The annual interest rate follows a mean reverting (Vasicek) process floored at zero
+    and the property value follows a geometric Brownian motion. Rates are in percent,
+    like ReverseMortgage.interest.
+    """
+    rate_mean_reversion: float = 0.15
+    rate_long_term: float | None = None
+    rate_volatility: float = 1.0
+    appreciation: float = 3.0
+    appreciation_volatility: float = 8.0
+
+
+class MonteCarloResult(NamedTuple):
+    """
+    Terminal loan-to-value of every simulated path and its percentiles.
+
+    Relación préstamo-valor final de cada trayectoria simulada y sus percentiles.
+    """
+    terminal_ltv: np.ndarray
+    percentiles: dict
+
+
+def _simulate_chunk(monthly_fee: float, property_value: float, interest: float, quotas: int,
+                    scenario: MarketScenario, paths: int, seed: np.random.SeedSequence) -> np.ndarray:
+    """
+    Simulates a chunk of paths with its own random stream and returns their terminal loan-to-value.
+
+    Simula un bloque de trayectorias con su propio flujo aleatorio y devuelve su relación préstamo-valor final.
+
+    The loan balance grows with the simulated monthly rate, using the same
+    (1 + annual)^(1/12) - 1 convention as ReverseMortgage, plus one monthly fee per month.
+    """
+    generator = np.random.default_rng(seed)
+    step = 1 / 12
+    long_term = interest if scenario.rate_long_term is None else scenario.rate_long_term
+    drift = (scenario.appreciation / 100 - (scenario.appreciation_volatility / 100) ** 2 / 2) * step
+    shock = scenario.appreciation_volatility / 100 * np.sqrt(step)
+
+    rates = np.full(paths, float(interest))
+    log_property_values = np.full(paths, np.log(property_value))
+    balances = np.zeros(paths)
+    for _ in range(quotas):
+        rate_shocks = generator.standard_normal(paths)
+        price_shocks = generator.standard_normal(paths)
+        rates += scenario.rate_mean_reversion * (long_term - rates) * step + scenario.rate_volatility * np.sqrt(step) * rate_shocks
+        np.maximum(rates, 0, out=rates)
+        balances = balances * (1 + rates / 100) ** step + monthly_fee
+        log_property_values += drift + shock * price_shocks
+
+    return balances / np.exp(log_property_values)
+
+
+def simulate_terminal_ltv(mortgage: ReverseMortgage, paths: int = 10000, seed: int = 0,
+                          scenario: MarketScenario = MarketScenario(), max_workers: int | None = None,
+                          percentiles=DEFAULT_PERCENTILES) -> MonteCarloResult:
+    """
+    Simulates stochastic rate and property value paths of a reverse mortgage in a process pool.
+
+    Simula trayectorias estocásticas de tasa y valor de la propiedad de una hipoteca inversa en un grupo de procesos.
+
+    The paths are split in chunks of CHUNK_SIZE and every chunk gets its own random stream
+    spawned from the seed, so results are the same for a given seed whatever the number
+    of workers.
+
+    Parameters
+    ----------
+    mortgage : ReverseMortgage
+        The priced reverse mortgage / La hipoteca inversa calculada
+    paths : int
+        Number of simulated paths / Número de trayectorias simuladas
+    seed : int
+        Seed of the random streams / Semilla de los flujos aleatorios
+    scenario : MarketScenario
+        Parameters of the rate and property value processes / Parámetros de los procesos de tasa y valor de la propiedad
+    max_workers : int | None
+        Number of worker processes, by default one per CPU; 1 simulates in the current process /
+        Número de procesos, por defecto uno por CPU; 1 simula en el proceso actual
+    percentiles : sequence of float
+        Percentiles of the terminal loan-to-value to report / Percentiles de la relación préstamo-valor final a reportar
+    """
+    if paths <= 0:
+        raise ValueError(f'Number of paths ({paths}) must be positive')
+
+    chunks = [min(CHUNK_SIZE, paths - start) for start in range(0, paths, CHUNK_SIZE)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    arguments = [
+        (mortgage.calculate_monthly_fee(), mortgage.property_value, mortgage.interest, mortgage.quotas, scenario, size, chunk_seed)
+        for size, chunk_seed in zip(chunks, seeds)
+    ]
+
+    workers = min(max_workers or os.cpu_count() or 1, len(chunks))
+    if workers == 1:
+        results = [_simulate_chunk(*chunk_arguments) for chunk_arguments in arguments]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_simulate_chunk, *zip(*arguments)))
+
+    terminal_ltv = np.concatenate(results)
+    return MonteCarloResult(terminal_ltv, dict(zip(percentiles, np.percentile(terminal_ltv, percentiles))))
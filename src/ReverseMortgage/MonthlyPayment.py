@@ -1,3 +1,32 @@
+from functools import lru_cache
+from typing import Iterator, NamedTuple
+
+import numpy as np
+
+from ReverseMortgage.MortalityTable import MortalityTable
+
+# CONSTANTS
+# Maximum age allowed by gender
+MAX_MALE_AGE_ALLOWED = 74
+MAX_FEMALE_AGE_ALLOWED = 79
+
+# Minimum age allowed for the younger person
+MIN_AGE_ALLOWED = 60
+
+# Life expectancy by gender
+MALE_LIFE_EXPECTANCY = 75
+FEMALE_LIFE_EXPECTANCY = 80
+
+# Maximum interest rate allowed
+MAX_INTEREST = 8
+
+AVAILABLE_GENDERS = ['m', 'f']
+AVAILABLE_MARITAL_STATUS = ['married', 'single', 'widowed', 'divorced']
+
+# Maximum number of (interest, quotas) pairs kept by the annuity factor cache
+ANNUITY_CACHE_SIZE = 4096
+
+
 class ClientException(Exception):
     """
     Base class for all client-related exceptions.
@@ -90,6 +119,36 @@ class InvalidMaritalStatus(ClientException):
     pass
 
 
+class ScheduleRow(NamedTuple):
+    """
+    One month of the disbursement schedule of a reverse mortgage.
+
+    Un mes del cronograma de desembolsos de una hipoteca inversa.
+
+    The outstanding balance is the part of the property value that has not been paid
+    out yet; it accrues the monthly interest and decreases with every monthly fee.
+    """
+    month: int
+    payment: float
+    interest: float
+    balance: float
+
+
+class InverseSolution(NamedTuple):
+    """
+    Result of solve_interests, with the convergence diagnostics of every row.
+
+    Resultado de solve_interests, con los diagnósticos de convergencia de cada fila.
+
+    residuals holds the fee of each solution minus its target. Rows without a solution
+    inside the allowed interest range keep NaN as interest and residual and False as converged.
+    """
+    interests: np.ndarray
+    converged: np.ndarray
+    iterations: np.ndarray
+    residuals: np.ndarray
+
+
 class Client:
     """
     Class representing a client for the reverse mortgage.
@@ -97,7 +156,11 @@ class Client:
     Clase que representa un cliente para la hipoteca inversa.
     """
 
-    def __init__(self, age: int, gender: str, marital_status: str, spouses_age: int | None, spouses_gender: str | None):
+    __slots__ = ('age', 'gender', 'marital_status', 'spouses_age', 'spouses_gender', 'mortality_table',
+                 'minor_age', 'minor_gender', 'estimated_years_of_life')
+
+    def __init__(self, age: int, gender: str, marital_status: str, spouses_age: int | None, spouses_gender: str | None,
+                 mortality_table: MortalityTable | None = None):
         """
         Initializes the client with personal details and calculates derived attributes.
 
@@ -115,15 +178,25 @@ class Client:
             The age of the spouse if married, otherwise None / Edad del cónyuge si está casado, de lo contrario None
         spouses_gender : str | None
             The gender of the spouse if married, otherwise None / Género del cónyuge si está casado, de lo contrario None
+        mortality_table : MortalityTable | None
+            Life table used to estimate the years of life, by default the fixed 75/80 life expectancy of the younger person /
+            Tabla de vida usada para estimar los años de vida, por defecto la esperanza de vida fija 75/80 de la persona más joven
         """
         self.age = age
         self.gender = gender
         self.marital_status = marital_status
         self.spouses_age = spouses_age
         self.spouses_gender = spouses_gender
-        self.minor_age = self.check_minor_age()
-        self.minor_gender = self.check_minor_gender()
-        self.estimated_years_of_life = self.calculate_years_of_life()
+        self.mortality_table = mortality_table
+
+        # Every field is validated once, in the same order as check_minor_age,
+        # check_minor_gender and calculate_years_of_life would do it
+        self.check_valid_age()
+        self.check_valid_marital_status()
+        self.check_valid_gender()
+        self.minor_age = self._minor_age()
+        self.minor_gender = self._minor_gender()
+        self.estimated_years_of_life = self._years_of_life()
 
     def check_valid_age(self):
         """
@@ -131,8 +204,8 @@ class Client:
 
         Verifica la validez de la edad del cliente y la edad del cónyuge si aplica.
         """
-        max_male_age_allowed = 74
-        max_female_age_allowed = 79
+        max_male_age_allowed = MAX_MALE_AGE_ALLOWED
+        max_female_age_allowed = MAX_FEMALE_AGE_ALLOWED
 
         if type(self.age) != int:
             raise InvalidAge(f'Age ({self.age}) is not a valid number')
@@ -147,6 +220,8 @@ class Client:
             raise AboveMaxAge(f'Age ({self.age}) is greater than the maximum age allowed for females ({max_female_age_allowed})')
         
         if self.marital_status.lower() == 'married':
+            if type(self.spouses_age) != int:
+                raise InvalidAge(f'Spouse\'s age ({self.spouses_age}) is not a valid number')
             if self.spouses_age < 0:
                 raise NegativeAge(f'Age ({self.spouses_age}) can not be negative')
             elif self.spouses_age == 0:
@@ -162,7 +237,7 @@ class Client:
 
         Verifica la validez del género del cliente y el género del cónyuge si aplica.
         """
-        available_genders = ['m', 'f']
+        available_genders = AVAILABLE_GENDERS
         if self.gender.lower() not in available_genders:
             raise InvalidGender(f'Gender ({self.gender}) is not valid, only "M" or "F" allowed')
         
@@ -176,7 +251,7 @@ class Client:
 
         Verifica la validez del estado civil del cliente.
         """
-        available_marital_status = ['married', 'single', 'widowed', 'divorced']
+        available_marital_status = AVAILABLE_MARITAL_STATUS
         if self.marital_status.lower() not in available_marital_status:
             raise InvalidMaritalStatus(f'Marital status ({self.marital_status}) is not valid, only married, single, widowed or divorced allowed')
 
@@ -188,7 +263,14 @@ class Client:
         """
         self.check_valid_age()
         self.check_valid_marital_status()
+        return self._minor_age()
 
+    def _minor_age(self):
+        """
+        Minimum age between the client and spouse, assuming the fields are already validated.
+
+        Edad mínima entre el cliente y el cónyuge, asumiendo que los campos ya fueron validados.
+        """
         if self.marital_status.lower() != "married" or self.age <= self.spouses_age:
             return self.age
         else:
@@ -202,6 +284,14 @@ class Client:
         """
         self.check_valid_gender()
         self.check_valid_marital_status()
+        return self._minor_gender()
+
+    def _minor_gender(self):
+        """
+        Gender associated with the minimum age, assuming the fields are already validated.
+
+        Género asociado con la edad mínima, asumiendo que los campos ya fueron validados.
+        """
         if self.marital_status.lower() != "married" or self.minor_age == self.age:
             return self.gender
         else:
@@ -213,16 +303,28 @@ class Client:
 
         Calcula los años estimados de vida en función de la edad mínima y el género.
         """
-        male_life_expect = 75
-        female_life_expect = 80
-        min_age_allowed = 60
-
         self.check_valid_age()
         self.check_valid_gender()
+        return self._years_of_life()
+
+    def _years_of_life(self):
+        """
+        Estimated years of life, assuming the fields are already validated.
+
+        Años estimados de vida, asumiendo que los campos ya fueron validados.
+        """
+        male_life_expect = MALE_LIFE_EXPECTANCY
+        female_life_expect = FEMALE_LIFE_EXPECTANCY
+        min_age_allowed = MIN_AGE_ALLOWED
 
         if self.minor_age < min_age_allowed:
             raise InvalidAge(f'Age of younger person is lesser than minimum age allowed ({min_age_allowed})')
 
+        if self.mortality_table is not None:
+            if self.marital_status.lower() == "married":
+                return float(self.mortality_table.joint_life_expectancy(self.age, self.gender, self.spouses_age, self.spouses_gender))
+            return float(self.mortality_table.life_expectancy(self.age, self.gender))
+
         if self.minor_gender.lower() == "m":
             return male_life_expect - self.minor_age
         
@@ -248,6 +350,8 @@ class ReverseMortgage:
     Clase que representa una hipoteca inversa para un cliente.
     """
 
+    __slots__ = ('_property_value', '_interest', '_client', 'quotas', 'monthly_rate', '_monthly_fee')
+
     def __init__(self, property_value: int, interest: float, client: Client):
         """
         Initializes the reverse mortgage with property value, interest rate, and client details.
@@ -263,11 +367,64 @@ class ReverseMortgage:
         client : Client
             The client applying for the reverse mortgage / El cliente que solicita la hipoteca inversa
         """
-        self.property_value = property_value
-        self.interest = interest
-        self.client = client
+        # The interest is validated once here and the derived values are cached; the fee is cached on
+        # the first call to calculate_monthly_fee. Assigning an attribute again refreshes what depends on it
+        self._monthly_fee = None
+        self._property_value = property_value
+        self._interest = interest
+        self._client = client
+        self.check_valid_interest()
+        self.quotas = self.calculate_quotas()
+        self.monthly_rate = self._monthly_rate()
+
+    @property
+    def property_value(self):
+        """
+        The value of the property; setting it clears the cached monthly fee.
+
+        Valor de la propiedad; asignarlo borra la cuota mensual guardada.
+        """
+        return self._property_value
+
+    @property_value.setter
+    def property_value(self, property_value):
+        self._property_value = property_value
+        self._monthly_fee = None
+
+    @property
+    def interest(self):
+        """
+        The annual interest rate; setting it validates it again and updates the monthly rate and fee.
+
+        Tasa de interés anual; asignarla la valida de nuevo y actualiza la tasa y la cuota mensual.
+        """
+        return self._interest
+
+    @interest.setter
+    def interest(self, interest):
+        previous, self._interest = self._interest, interest
+        try:
+            self.check_valid_interest()
+        except ReverseMortgageException:
+            self._interest = previous
+            raise
+        self.monthly_rate = self._monthly_rate()
+        self._monthly_fee = None
+
+    @property
+    def client(self):
+        """
+        The client applying for the reverse mortgage; setting it updates the quotas and the monthly fee.
+
+        El cliente que solicita la hipoteca inversa; asignarlo actualiza el número de cuotas y la cuota mensual.
+        """
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
         self.quotas = self.calculate_quotas()
-        self.monthly_rate = self.calculate_monthly_rate()
+        self._monthly_fee = None
 
     def check_valid_property_value(self):
         """
@@ -286,7 +443,7 @@ class ReverseMortgage:
 
         Verifica la validez de la tasa de interés.
         """
-        max_interest = 8
+        max_interest = MAX_INTEREST
         if self.interest < 0:
             raise NegativeInterest(f'Interest {self.interest} can not be negative')
         elif self.interest > max_interest:
@@ -298,7 +455,7 @@ class ReverseMortgage:
 
         Calcula el número de pagos mensuales en función de los años estimados de vida del cliente.
         """
-        return self.client.estimated_years_of_life * 12
+        return round(self.client.estimated_years_of_life * 12)
 
     def calculate_monthly_rate(self):
         """
@@ -307,7 +464,14 @@ class ReverseMortgage:
         Calcula la tasa de interés mensual a partir de la tasa de interés anual.
         """
         self.check_valid_interest()
+        return self._monthly_rate()
+
+    def _monthly_rate(self):
+        """
+        Monthly interest rate, assuming the interest is already validated.
 
+        Tasa de interés mensual, asumiendo que el interés ya fue validado.
+        """
         if self.interest == 0:
             return 0
         
@@ -321,18 +485,40 @@ class ReverseMortgage:
 
         Calcula la cuota mensual en función del valor de la propiedad, la tasa de interés y el número de cuotas.
         """
-        self.check_valid_interest()
-        self.check_valid_property_value()
+        if self._monthly_fee is None:
+            self.check_valid_property_value()
+            self._monthly_fee = self._calculate_monthly_fee()
+        return self._monthly_fee
 
+    def _calculate_monthly_fee(self):
+        """
+        Monthly fee, assuming the interest and property value are already validated.
+
+        Cuota mensual, asumiendo que el interés y el valor de la propiedad ya fueron validados.
+        """
         if self.interest == 0:
             return round(self.property_value / self.quotas, 2)
         
-        numerator = self.property_value * self.monthly_rate * (1 + self.monthly_rate) ** self.quotas
-        denominator = ((1 + self.monthly_rate) ** self.quotas) - 1
-        monthly_fee = numerator / denominator
+        monthly_fee = self.property_value * annuity_factor(self.interest, self.quotas)
         
         return round(monthly_fee, 2)
 
+    def schedule(self) -> Iterator[ScheduleRow]:
+        """
+        Yields the month-by-month disbursement schedule lazily, one ScheduleRow per quota.
+
+        Genera de forma perezosa el cronograma de desembolsos mes a mes, una ScheduleRow por cuota.
+
+        Interest and balance are rounded to two decimals every month, using the same
+        monthly rate convention (1 + annual)^(1/12) - 1 as calculate_monthly_rate.
+        """
+        payment = self.calculate_monthly_fee()
+        balance = self.property_value
+        for month in range(1, self.quotas + 1):
+            interest = round(balance * self.monthly_rate, 2)
+            balance = round(balance + interest - payment, 2)
+            yield ScheduleRow(month, payment, interest, balance)
+
     def __repr__(self) -> str:
         """
         Returns a string representation of the reverse mortgage details.
@@ -340,3 +526,547 @@ class ReverseMortgage:
         Devuelve una representación en cadena de los detalles de la hipoteca inversa.
         """
         return f'Property Value: ${self.property_value:,} \nInterest: {self.interest}% \nQuotas: {self.quotas} \nMonthly Rate: {round(self.monthly_rate, 6)} \n\nMonthly Fee: ${self.calculate_monthly_fee():,}'
+
+
+@lru_cache(maxsize=ANNUITY_CACHE_SIZE)
+def annuity_factor(interest: float, quotas: int) -> float:
+    """
+    Calculates the fraction of the property value paid on each monthly fee.
+
+    Calcula la fracción del valor de la propiedad que se paga en cada cuota mensual.
+
+    The book only quotes a few hundred distinct (interest, quotas) pairs, so the factors
+    are kept in a bounded LRU cache; annuity_cache_stats() reports how well it works.
+
+    Parameters
+    ----------
+    interest : float
+        The annual interest rate, already validated and greater than zero / Tasa de interés anual, ya validada y mayor que cero
+    quotas : int
+        The number of monthly payments / Número de pagos mensuales
+    """
+    monthly_rate = (1 + interest / 100) ** (1 / 12) - 1
+    growth = (1 + monthly_rate) ** quotas
+    return monthly_rate * growth / (growth - 1)
+
+
+def annuity_cache_stats() -> dict:
+    """
+    Returns the hit and miss statistics of the annuity factor cache.
+
+    Devuelve las estadísticas de aciertos y fallos de la caché de factores de anualidad.
+    """
+    info = annuity_factor.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'hit_rate': info.hits / lookups if lookups else 0.0,
+        'size': info.currsize,
+        'max_size': info.maxsize,
+    }
+
+
+# BATCH ERROR CODES
+# Per-row error codes returned by validate_batch, listed in the order the checks are applied
+VALID = 0
+INVALID_AGE_VALUE = 1
+NEGATIVE_AGE = 2
+ZERO_AGE = 3
+ABOVE_MAX_AGE = 4
+INVALID_SPOUSE_AGE_VALUE = 5
+NEGATIVE_SPOUSE_AGE = 6
+ZERO_SPOUSE_AGE = 7
+ABOVE_MAX_SPOUSE_AGE = 8
+INVALID_MARITAL_STATUS = 9
+INVALID_GENDER = 10
+INVALID_SPOUSE_GENDER = 11
+BELOW_MIN_AGE = 12
+NEGATIVE_INTEREST = 13
+ABOVE_MAX_INTEREST = 14
+NEGATIVE_PROPERTY_VALUE = 15
+PROPERTY_ZERO_VALUE = 16
+
+# Exception raised by Client or ReverseMortgage for each error code
+ERROR_EXCEPTIONS = {
+    INVALID_AGE_VALUE: InvalidAge,
+    NEGATIVE_AGE: NegativeAge,
+    ZERO_AGE: InvalidAge,
+    ABOVE_MAX_AGE: AboveMaxAge,
+    INVALID_SPOUSE_AGE_VALUE: InvalidAge,
+    NEGATIVE_SPOUSE_AGE: NegativeAge,
+    ZERO_SPOUSE_AGE: InvalidAge,
+    ABOVE_MAX_SPOUSE_AGE: AboveMaxAge,
+    INVALID_MARITAL_STATUS: InvalidMaritalStatus,
+    INVALID_GENDER: InvalidGender,
+    INVALID_SPOUSE_GENDER: InvalidGender,
+    BELOW_MIN_AGE: InvalidAge,
+    NEGATIVE_INTEREST: NegativeInterest,
+    ABOVE_MAX_INTEREST: AboveMaxInterest,
+    NEGATIVE_PROPERTY_VALUE: NegativePropertyValue,
+    PROPERTY_ZERO_VALUE: PropertyZeroValue,
+}
+
+ERROR_MESSAGES = {
+    INVALID_AGE_VALUE: 'Age is not a valid number',
+    NEGATIVE_AGE: 'Age can not be negative',
+    ZERO_AGE: 'Age can not be zero',
+    ABOVE_MAX_AGE: 'Age is greater than the maximum age allowed for the gender',
+    INVALID_SPOUSE_AGE_VALUE: 'Spouse\'s age is not a valid number',
+    NEGATIVE_SPOUSE_AGE: 'Spouse\'s age can not be negative',
+    ZERO_SPOUSE_AGE: 'Spouse\'s age can not be zero',
+    ABOVE_MAX_SPOUSE_AGE: 'Spouse\'s age is greater than the maximum age allowed for the gender',
+    INVALID_MARITAL_STATUS: 'Marital status is not valid, only married, single, widowed or divorced allowed',
+    INVALID_GENDER: 'Gender is not valid, only "M" or "F" allowed',
+    INVALID_SPOUSE_GENDER: 'Spouses gender is not valid',
+    BELOW_MIN_AGE: f'Age of younger person is lesser than minimum age allowed ({MIN_AGE_ALLOWED})',
+    NEGATIVE_INTEREST: 'Interest can not be negative',
+    ABOVE_MAX_INTEREST: f'Interest can not be above {MAX_INTEREST}',
+    NEGATIVE_PROPERTY_VALUE: 'Property value can not be negative',
+    PROPERTY_ZERO_VALUE: 'Property value can not be zero',
+}
+
+
+# Code of a gender or marital status that is not in AVAILABLE_GENDERS or AVAILABLE_MARITAL_STATUS
+UNKNOWN_CODE = -1
+
+# Code of the married status, its position in AVAILABLE_MARITAL_STATUS
+MARRIED_CODE = AVAILABLE_MARITAL_STATUS.index('married')
+
+# Age kept in an int8 column for values that are not whole numbers
+INVALID_AGE_CODE = -128
+
+
+def _category_codes(values, categories: list) -> np.ndarray:
+    """
+    Converts a column of strings (any case) to int8 codes, their position in categories or UNKNOWN_CODE.
+
+    Convierte una columna de cadenas (en cualquier caso) a códigos int8, su posición en categories o UNKNOWN_CODE.
+
+    Columns only hold a handful of distinct categories, so only those are looked up.
+    """
+    values = np.asarray(values).astype(str)
+    uniques, inverse = np.unique(values, return_inverse=True)
+    lookup = np.array([categories.index(value) if value in categories else UNKNOWN_CODE
+                       for value in np.char.lower(uniques).tolist()], dtype=np.int8)
+    return lookup[inverse].reshape(values.shape)
+
+
+def _parse_ages(values, rows: np.ndarray) -> tuple:
+    """
+    Converts a column of ages to int64, flagging the rows (among the given ones) that are not integers.
+
+    Convierte una columna de edades a int64, marcando las filas (entre las indicadas) que no son enteros.
+
+    Same rule as Client: floats such as 65.0, strings and booleans are not valid ages.
+    """
+    array = np.asarray(values)
+    if array.dtype.kind in 'iu':
+        return array.astype(np.int64), np.zeros(array.shape, dtype=bool)
+    if not isinstance(values, np.ndarray) and array.dtype.kind != 'O':
+        # Keeps the type of every value of a sequence, NumPy would turn [65, 'x'] into strings and [65, 65.5] into floats
+        array = np.empty(array.shape, dtype=object)
+        array[:] = list(values)
+    values = array
+
+    invalid = np.zeros(values.shape, dtype=bool)
+    numbers = np.zeros(values.shape, dtype=np.int64)
+    if values.dtype.kind == 'O':
+        for index in np.flatnonzero(rows):
+            value = values[index]
+            if isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_)):
+                # Out of range ages are clipped, they are rejected as above the maximum or negative anyway
+                numbers[index] = min(max(int(value), -2 ** 31), 2 ** 31)
+            else:
+                invalid[index] = True
+    else:
+        invalid[:] = True
+    invalid &= rows
+    return numbers, invalid
+
+
+def _round_cents(values: np.ndarray) -> np.ndarray:
+    """
+    Rounds an array to two decimals exactly like the built-in round(value, 2).
+
+    Redondea un arreglo a dos decimales exactamente igual que round(valor, 2).
+
+    np.round scales by 100 before rounding, so it may disagree with the built-in
+    round() on values lying within a few ulps of a half cent. Those few values are
+    rounded again one by one with the built-in round().
+    """
+    values = np.asarray(values, dtype=np.float64)
+    scaled = values * 100
+    rounded = np.round(scaled) / 100
+    distance_to_half = np.abs(scaled - np.floor(scaled) - 0.5)
+    for index in np.flatnonzero(distance_to_half <= 4 * np.spacing(np.abs(scaled))):
+        rounded.flat[index] = round(float(values.flat[index]), 2)
+    return rounded
+
+
+def _prepare_batch(ages, genders, marital_statuses, spouses_ages, spouses_genders, property_values, interests) -> dict:
+    """
+    Normalizes the input columns of a batch and computes the per-row error codes.
+
+    Normaliza las columnas de entrada de un lote y calcula los códigos de error por fila.
+    """
+    genders = _category_codes(genders, AVAILABLE_GENDERS)
+    marital_statuses = _category_codes(marital_statuses, AVAILABLE_MARITAL_STATUS)
+    married = marital_statuses == MARRIED_CODE
+    ages, invalid_ages = _parse_ages(ages, np.ones(marital_statuses.shape, dtype=bool))
+    spouses_ages, invalid_spouses_ages = _parse_ages(spouses_ages, married)
+    return _prepare_codes(ages, invalid_ages, genders, marital_statuses, spouses_ages, invalid_spouses_ages,
+                          _category_codes(spouses_genders, AVAILABLE_GENDERS), property_values, interests)
+
+
+def _prepare_codes(ages, invalid_ages, genders, marital_statuses, spouses_ages, invalid_spouses_ages, spouses_genders,
+                   property_values, interests) -> dict:
+    """
+    Computes the per-row error codes of a batch whose genders and marital statuses are already codes.
+
+    Calcula los códigos de error por fila de un lote cuyos géneros y estados civiles ya son códigos.
+
+    The columns are used as they are, so typed arrays such as the ones of a ClientBatch are not copied.
+    """
+    married = marital_statuses == MARRIED_CODE
+    property_values = np.asarray(property_values, dtype=np.float64)
+    interests = np.asarray(interests, dtype=np.float64)
+
+    males = genders == 0
+    females = genders == 1
+    spouse_males = married & (spouses_genders == 0)
+    spouse_females = married & (spouses_genders == 1)
+    younger_is_spouse = married & (spouses_ages < ages)
+    minor_ages = np.where(younger_is_spouse, spouses_ages, ages)
+
+    # Same order of checks as Client.__init__ and ReverseMortgage.calculate_monthly_fee,
+    # so every row keeps the error that the scalar classes would have raised first
+    checks = [
+        (INVALID_AGE_VALUE, invalid_ages),
+        (NEGATIVE_AGE, ages < 0),
+        (ZERO_AGE, ages == 0),
+        (ABOVE_MAX_AGE, (males & (ages > MAX_MALE_AGE_ALLOWED)) | (females & (ages > MAX_FEMALE_AGE_ALLOWED))),
+        (INVALID_SPOUSE_AGE_VALUE, invalid_spouses_ages),
+        (NEGATIVE_SPOUSE_AGE, married & (spouses_ages < 0)),
+        (ZERO_SPOUSE_AGE, married & (spouses_ages == 0)),
+        (ABOVE_MAX_SPOUSE_AGE, (spouse_males & (spouses_ages > MAX_MALE_AGE_ALLOWED)) | (spouse_females & (spouses_ages > MAX_FEMALE_AGE_ALLOWED))),
+        (INVALID_MARITAL_STATUS, marital_statuses == UNKNOWN_CODE),
+        (INVALID_GENDER, ~(males | females)),
+        (INVALID_SPOUSE_GENDER, married & ~(spouse_males | spouse_females)),
+        (BELOW_MIN_AGE, minor_ages < MIN_AGE_ALLOWED),
+        (NEGATIVE_INTEREST, interests < 0),
+        (ABOVE_MAX_INTEREST, interests > MAX_INTEREST),
+        (NEGATIVE_PROPERTY_VALUE, property_values < 0),
+        (PROPERTY_ZERO_VALUE, property_values == 0),
+    ]
+    error_codes = np.zeros(marital_statuses.shape, dtype=np.int8)
+    for code, failed in reversed(checks):
+        error_codes[failed] = code
+
+    return {
+        'error_codes': error_codes,
+        'ages': ages,
+        'genders': genders,
+        'married': married,
+        'spouses_ages': spouses_ages,
+        'spouses_genders': spouses_genders,
+        'minor_ages': minor_ages,
+        'minor_males': np.where(younger_is_spouse, spouse_males, males),
+        'property_values': property_values,
+        'interests': interests,
+    }
+
+
+def validate_batch(ages, genders, marital_statuses, spouses_ages, spouses_genders, property_values, interests) -> np.ndarray:
+    """
+    Validates whole columns of applicants at once without raising exceptions.
+
+    Valida columnas completas de solicitantes a la vez sin lanzar excepciones.
+
+    The parameters are the same as in calculate_monthly_fees. Ages that are not whole
+    numbers (for example missing values read from a file) are flagged as invalid
+    instead of failing the whole column.
+
+    Returns
+    -------
+    np.ndarray of int8
+        The error code of every row, VALID (0) when the row can be priced. ERROR_EXCEPTIONS
+        maps each code to the exception Client or ReverseMortgage would raise /
+        El código de error de cada fila, VALID (0) cuando la fila se puede calcular.
+    """
+    return _prepare_batch(ages, genders, marital_statuses, spouses_ages, spouses_genders, property_values, interests)['error_codes']
+
+
+def reject_report(error_codes: np.ndarray) -> list:
+    """
+    Lists the rejected rows of a validated batch.
+
+    Lista las filas rechazadas de un lote validado.
+
+    Returns
+    -------
+    list of tuple
+        (row, error code, exception name, message) for every row that is not VALID /
+        (fila, código de error, nombre de la excepción, mensaje) para cada fila que no es VALID
+    """
+    error_codes = np.asarray(error_codes)
+    return [
+        (int(row), int(error_codes[row]), ERROR_EXCEPTIONS[int(error_codes[row])].__name__, ERROR_MESSAGES[int(error_codes[row])])
+        for row in np.flatnonzero(error_codes)
+    ]
+
+
+def raise_for_error_codes(error_codes: np.ndarray):
+    """
+    Raises the exception of the first rejected row of a validated batch, if any.
+
+    Lanza la excepción de la primera fila rechazada de un lote validado, si existe.
+    """
+    rejected = np.flatnonzero(error_codes)
+    if rejected.size:
+        row = int(rejected[0])
+        code = int(error_codes[row])
+        raise ERROR_EXCEPTIONS[code](f'{ERROR_MESSAGES[code]} (row {row})')
+
+
+def _years_of_life(batch: dict, mortality_table: MortalityTable | None) -> np.ndarray:
+    """
+    Estimated years of life of every row of a validated batch, as Client would calculate them.
+
+    Años estimados de vida de cada fila de un lote validado, como los calcularía Client.
+    """
+    if mortality_table is None:
+        return np.where(batch['minor_males'], MALE_LIFE_EXPECTANCY, FEMALE_LIFE_EXPECTANCY) - batch['minor_ages']
+
+    married = batch['married']
+    genders = np.array(AVAILABLE_GENDERS)[batch['genders']]
+    years_of_life = mortality_table.life_expectancy(batch['ages'], genders)
+    if married.any():
+        spouses_genders = np.array(AVAILABLE_GENDERS)[batch['spouses_genders'][married]]
+        years_of_life[married] = mortality_table.joint_life_expectancy(
+            batch['ages'][married], genders[married], batch['spouses_ages'][married], spouses_genders)
+    return years_of_life
+
+
+def calculate_monthly_fees(ages, genders, marital_statuses, spouses_ages, spouses_genders, property_values, interests,
+                           mortality_table: MortalityTable | None = None):
+    """
+    Calculates the monthly fee of many reverse mortgages in a single vectorized call.
+
+    Calcula la cuota mensual de muchas hipotecas inversas en una sola llamada vectorizada.
+
+    Every column is validated with the same rules as Client and ReverseMortgage and the
+    exception of the first rejected row is raised; use validate_batch first to split out
+    the rejected rows. Results are equal to the ones obtained row by row with
+    ReverseMortgage.calculate_monthly_fee().
+
+    Parameters
+    ----------
+    ages : array_like of int
+        The ages of the clients / Edades de los clientes
+    genders : array_like of str
+        The genders of the clients, 'M' or 'F' / Géneros de los clientes, 'M' o 'F'
+    marital_statuses : array_like of str
+        The marital status of the clients / Estado civil de los clientes
+    spouses_ages : array_like of int
+        The ages of the spouses, ignored on rows that are not married / Edades de los cónyuges, ignoradas en filas que no están casadas
+    spouses_genders : array_like of str
+        The genders of the spouses, ignored on rows that are not married / Géneros de los cónyuges, ignorados en filas que no están casadas
+    property_values : array_like of float
+        The values of the properties / Valores de las propiedades
+    interests : array_like of float
+        The annual interest rates / Tasas de interés anuales
+    mortality_table : MortalityTable | None
+        Life table used to estimate the years of life, as in Client / Tabla de vida usada para estimar los años de vida, como en Client
+
+    Returns
+    -------
+    tuple of np.ndarray
+        The monthly fees rounded to two decimals, the quotas and the monthly rates /
+        Las cuotas mensuales redondeadas a dos decimales, el número de cuotas y las tasas mensuales
+    """
+    batch = _prepare_batch(ages, genders, marital_statuses, spouses_ages, spouses_genders, property_values, interests)
+    return _calculate_prepared(batch, mortality_table)
+
+
+def _calculate_prepared(batch: dict, mortality_table: MortalityTable | None) -> tuple:
+    """
+    Calculates the monthly fees, quotas and monthly rates of a prepared batch, raising if a row was rejected.
+
+    Calcula las cuotas mensuales, el número de cuotas y las tasas mensuales de un lote preparado, lanzando si se rechazó una fila.
+    """
+    raise_for_error_codes(batch['error_codes'])
+
+    quotas = np.rint(_years_of_life(batch, mortality_table) * 12).astype(np.int64)
+
+    interests = batch['interests']
+    property_values = batch['property_values']
+    zero_interest = interests == 0
+    monthly_rates = np.where(zero_interest, 0.0, (1 + interests / 100) ** (1 / 12) - 1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = (1 + monthly_rates) ** quotas
+        monthly_fees = np.where(zero_interest, property_values / quotas,
+                                property_values * (monthly_rates * growth / (growth - 1)))
+
+    return _round_cents(monthly_fees), quotas, monthly_rates
+
+
+def calculate_schedules(property_values, monthly_fees, monthly_rates, quotas, out: np.ndarray | None = None) -> np.ndarray:
+    """
+    Fills the disbursement schedules of many loans at once in a preallocated block.
+
+    Llena los cronogramas de desembolsos de muchos préstamos a la vez en un bloque preasignado.
+
+    Produces the same rows as ReverseMortgage.schedule(). Months after the last quota of
+    a loan are left at zero. Large portfolios can be processed in chunks reusing the
+    same out block.
+
+    Parameters
+    ----------
+    property_values : array_like of float
+        The values of the properties / Valores de las propiedades
+    monthly_fees, monthly_rates, quotas : array_like
+        As returned by calculate_monthly_fees / Como los devuelve calculate_monthly_fees
+    out : np.ndarray, optional
+        Block of shape (loans, months, 3) to fill, months >= max(quotas) /
+        Bloque de forma (préstamos, meses, 3) a llenar, meses >= max(quotas)
+
+    Returns
+    -------
+    np.ndarray
+        The block, with payment, interest and balance on the last axis /
+        El bloque, con pago, interés y saldo en el último eje
+    """
+    balances = np.array(property_values, dtype=np.float64)
+    monthly_fees = np.asarray(monthly_fees, dtype=np.float64)
+    monthly_rates = np.asarray(monthly_rates, dtype=np.float64)
+    quotas = np.asarray(quotas)
+    months = int(quotas.max()) if quotas.size else 0
+
+    if out is None:
+        out = np.zeros((balances.size, months, 3))
+    elif out.shape[0] != balances.size or out.shape[1] < months or out.shape[2] != 3:
+        raise ValueError(f'Schedule block of shape {out.shape} can not hold {balances.size} loans of up to {months} months')
+    else:
+        out[...] = 0
+
+    for month in range(months):
+        active = np.flatnonzero(quotas > month)
+        interests = _round_cents(balances[active] * monthly_rates[active])
+        balances[active] = _round_cents(balances[active] + interests - monthly_fees[active])
+        out[active, month, 0] = monthly_fees[active]
+        out[active, month, 1] = interests
+        out[active, month, 2] = balances[active]
+
+    return out
+
+
+def _check_batch_values(interests: np.ndarray, property_values: np.ndarray | None = None):
+    """
+    Raises the exception of the first row with an interest or property value out of range.
+
+    Lanza la excepción de la primera fila con un interés o valor de la propiedad fuera de rango.
+    """
+    error_codes = np.zeros(interests.shape, dtype=np.int8)
+    checks = [(NEGATIVE_INTEREST, interests < 0), (ABOVE_MAX_INTEREST, interests > MAX_INTEREST)]
+    if property_values is not None:
+        checks += [(NEGATIVE_PROPERTY_VALUE, property_values < 0), (PROPERTY_ZERO_VALUE, property_values == 0)]
+    for code, failed in reversed(checks):
+        error_codes[failed] = code
+    raise_for_error_codes(error_codes)
+
+
+def solve_property_values(monthly_fees, interests, quotas) -> np.ndarray:
+    """
+    Calculates the property values that give the target monthly fees, inverse of calculate_monthly_fees.
+
+    Calcula los valores de la propiedad que producen las cuotas mensuales objetivo, inverso de calculate_monthly_fees.
+
+    The fee is linear in the property value, so the solution is closed-form.
+
+    Parameters
+    ----------
+    monthly_fees : array_like of float
+        The target monthly fees / Cuotas mensuales objetivo
+    interests : array_like of float
+        The annual interest rates / Tasas de interés anuales
+    quotas : array_like of int
+        The number of monthly payments of each client / Número de pagos mensuales de cada cliente
+    """
+    monthly_fees, interests, quotas = np.broadcast_arrays(
+        np.asarray(monthly_fees, dtype=np.float64), np.asarray(interests, dtype=np.float64), np.asarray(quotas))
+    _check_batch_values(interests)
+
+    zero_interest = interests == 0
+    monthly_rates = np.where(zero_interest, 0.0, (1 + interests / 100) ** (1 / 12) - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = (1 + monthly_rates) ** quotas
+        return np.where(zero_interest, monthly_fees * quotas, monthly_fees / (monthly_rates * growth / (growth - 1)))
+
+
+def solve_interests(monthly_fees, property_values, quotas, tolerance: float = 1e-6, max_iterations: int = 100) -> InverseSolution:
+    """
+    Finds the annual interest rates that give the target monthly fees, between 0 and MAX_INTEREST.
+
+    Encuentra las tasas de interés anuales que producen las cuotas mensuales objetivo, entre 0 y MAX_INTEREST.
+
+    Solves every row at once on the monthly rate with Newton steps, falling back to
+    bisection whenever a step leaves the bracket that holds the root.
+
+    Parameters
+    ----------
+    monthly_fees : array_like of float
+        The target monthly fees / Cuotas mensuales objetivo
+    property_values : array_like of float
+        The values of the properties / Valores de las propiedades
+    quotas : array_like of int
+        The number of monthly payments of each client / Número de pagos mensuales de cada cliente
+    tolerance : float
+        Maximum absolute difference between the fee of the solution and the target /
+        Diferencia absoluta máxima entre la cuota de la solución y el objetivo
+    max_iterations : int
+        Maximum number of iterations / Número máximo de iteraciones
+    """
+    monthly_fees, property_values, quotas = np.broadcast_arrays(
+        np.asarray(monthly_fees, dtype=np.float64), np.asarray(property_values, dtype=np.float64),
+        np.asarray(quotas, dtype=np.float64))
+    _check_batch_values(np.zeros(monthly_fees.shape), property_values)
+
+    def fees_and_slopes(monthly_rates):
+        # Fee as pv * m / (1 - (1 + m)^-q), written with log1p/expm1 so it stays exact near m = 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            discount = -np.expm1(-quotas * np.log1p(monthly_rates))
+            fees = np.where(monthly_rates == 0, property_values / quotas, property_values * monthly_rates / discount)
+            slopes = property_values * (discount - monthly_rates * quotas * (1 + monthly_rates) ** (-quotas - 1)) / discount ** 2
+        return fees, slopes
+
+    low = np.zeros(monthly_fees.shape)
+    high = np.full(monthly_fees.shape, (1 + MAX_INTEREST / 100) ** (1 / 12) - 1)
+    low_fees, _ = fees_and_slopes(low)
+    high_fees, _ = fees_and_slopes(high)
+    reachable = (monthly_fees >= low_fees - tolerance) & (monthly_fees <= high_fees + tolerance)
+
+    monthly_rates = np.where(np.abs(low_fees - monthly_fees) <= tolerance, low, (low + high) / 2)
+    converged = np.zeros(monthly_fees.shape, dtype=bool)
+    iterations = np.zeros(monthly_fees.shape, dtype=np.int64)
+    for _ in range(max_iterations):
+        pending = reachable & ~converged
+        if not pending.any():
+            break
+        fees, slopes = fees_and_slopes(monthly_rates)
+        residuals = fees - monthly_fees
+        converged |= pending & (np.abs(residuals) <= tolerance)
+        pending &= ~converged
+        iterations[pending] += 1
+
+        high = np.where(pending & (residuals > 0), monthly_rates, high)
+        low = np.where(pending & (residuals < 0), monthly_rates, low)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            steps = monthly_rates - residuals / slopes
+        inside = np.isfinite(steps) & (steps > low) & (steps < high)
+        monthly_rates = np.where(pending, np.where(inside, steps, (low + high) / 2), monthly_rates)
+
+    interests = np.where(converged, ((1 + monthly_rates) ** 12 - 1) * 100, np.nan)
+    fees, _ = fees_and_slopes(monthly_rates)
+    return InverseSolution(interests, converged, iterations, np.where(reachable, fees - monthly_fees, np.nan))
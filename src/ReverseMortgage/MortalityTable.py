@@ -0,0 +1,131 @@
+import csv
+
+import numpy as np
+
+
+def _gender_index(genders) -> np.ndarray:
+    """
+    Converts genders ('M' or 'F', any case) to table indexes, 0 for males and 1 for females.
+
+    Convierte géneros ('M' o 'F', en cualquier caso) a índices de la tabla, 0 para hombres y 1 para mujeres.
+    """
+    genders = np.asarray(genders).astype(str)
+    categories, codes = np.unique(genders, return_inverse=True)
+    categories = np.char.lower(categories)
+    if not np.isin(categories, ['m', 'f']).all():
+        raise ValueError(f'Genders ({", ".join(categories)}) are not valid, only "M" or "F" allowed')
+    return np.where(categories == 'm', 0, 1)[codes].reshape(genders.shape)
+
+
+class MortalityTable:
+    """
+    Life table used to estimate the years of life of clients and couples.
+
+    Tabla de vida usada para estimar los años de vida de clientes y parejas.
+
+    The probabilities of death are turned into survival curves, single-life expectancies
+    and joint-life expectancies for every pair of ages when the table is loaded, so every
+    lookup is a plain array index and works the same for scalars and NumPy arrays.
+    """
+
+    def __init__(self, ages, male_death_probabilities, female_death_probabilities):
+        """
+        Builds the table from the yearly probabilities of death of each gender.
+
+        Construye la tabla a partir de las probabilidades anuales de muerte de cada género.
+
+        Parameters
+        ----------
+        ages : array_like of int
+            Consecutive ages covered by the table / Edades consecutivas cubiertas por la tabla
+        male_death_probabilities : array_like of float
+            Probability that a male of each age dies within a year (qx) / Probabilidad de que un hombre de cada edad muera en un año (qx)
+        female_death_probabilities : array_like of float
+            Probability that a female of each age dies within a year (qx) / Probabilidad de que una mujer de cada edad muera en un año (qx)
+        """
+        ages = np.asarray(ages, dtype=np.int64)
+        death_probabilities = np.array([male_death_probabilities, female_death_probabilities], dtype=np.float64)
+
+        if ages.size == 0 or (np.diff(ages) != 1).any():
+            raise ValueError('Mortality table ages must be consecutive')
+        if death_probabilities.shape != (2, ages.size):
+            raise ValueError('Mortality table needs one probability of death per age and gender')
+        if ((death_probabilities < 0) | (death_probabilities > 1)).any():
+            raise ValueError('Probabilities of death must be between 0 and 1')
+
+        self.first_age = int(ages[0])
+        self.last_age = int(ages[-1])
+
+        # Nobody survives past the last age of the table
+        death_probabilities[:, -1] = 1
+        survivors = np.ones((2, ages.size + 1))
+        survivors[:, 1:] = np.cumprod(1 - death_probabilities, axis=1)
+
+        # Curtate expectancy plus half a year, e_x = sum(l[x + k]) / l[x] + 0.5
+        with np.errstate(divide='ignore', invalid='ignore'):
+            remaining = np.cumsum(survivors[:, ::-1], axis=1)[:, ::-1]
+            self._life_expectancy = np.nan_to_num(remaining[:, 1:] / survivors[:, :-1]) + 0.5
+
+        # Joint (first death) expectancy of every couple, filled along the diagonals:
+        # joint[x, y] = l1[x + 1] * l2[y + 1] + joint[x + 1, y + 1]
+        size = ages.size
+        self._last_survivor_expectancy = np.zeros((2, 2, size, size))
+        for first in range(2):
+            for second in range(2):
+                products = np.outer(survivors[first, 1:], survivors[second, 1:])
+                joint = np.zeros((size + 1, size + 1))
+                for index in range(size - 1, -1, -1):
+                    joint[index, :size] = products[index] + joint[index + 1, 1:]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    joint = np.nan_to_num(joint[:size, :size] / np.outer(survivors[first, :-1], survivors[second, :-1])) + 0.5
+                self._last_survivor_expectancy[first, second] = (
+                    self._life_expectancy[first][:, None] + self._life_expectancy[second][None, :] - joint
+                )
+
+    @classmethod
+    def from_csv(cls, path: str) -> 'MortalityTable':
+        """
+        Loads a life table from a CSV file with the columns age, gender and qx.
+
+        Carga una tabla de vida desde un archivo CSV con las columnas age, gender y qx.
+        """
+        probabilities = {0: {}, 1: {}}
+        with open(path, newline='') as file:
+            for row in csv.DictReader(file):
+                gender = int(_gender_index(row['gender'].strip()))
+                probabilities[gender][int(row['age'])] = float(row['qx'])
+
+        ages = sorted(probabilities[0])
+        if ages != sorted(probabilities[1]):
+            raise ValueError(f'Mortality table {path} must cover the same ages for both genders')
+        return cls(ages, [probabilities[0][age] for age in ages], [probabilities[1][age] for age in ages])
+
+    def _age_index(self, ages) -> np.ndarray:
+        """
+        Converts ages to indexes of the precomputed arrays.
+
+        Convierte edades a índices de los arreglos precalculados.
+        """
+        ages = np.asarray(ages, dtype=np.int64)
+        if ((ages < self.first_age) | (ages > self.last_age)).any():
+            raise ValueError(f'Ages must be between {self.first_age} and {self.last_age} to use this mortality table')
+        return ages - self.first_age
+
+    def life_expectancy(self, ages, genders):
+        """
+        Returns the remaining years of life of persons of the given ages and genders.
+
+        Devuelve los años de vida restantes de personas de las edades y géneros indicados.
+        """
+        return self._life_expectancy[_gender_index(genders), self._age_index(ages)]
+
+    def joint_life_expectancy(self, ages, genders, spouses_ages, spouses_genders):
+        """
+        Returns the years until the death of the last survivor of each couple.
+
+        Devuelve los años hasta la muerte del último sobreviviente de cada pareja.
+
+        Both lives are assumed independent.
+        """
+        return self._last_survivor_expectancy[_gender_index(genders), _gender_index(spouses_genders),
+                                              self._age_index(ages), self._age_index(spouses_ages)]
@@ -0,0 +1,91 @@
+from typing import NamedTuple
+
+import numpy as np
+
+from ReverseMortgage.MonthlyPayment import _round_cents, calculate_monthly_fees, raise_for_error_codes, validate_batch
+from ReverseMortgage.MortalityTable import MortalityTable
+
+
+class FeeGrid(NamedTuple):
+    """
+    Monthly fees of a what-if sweep labelled by interest, property value and age.
+
+    Cuotas mensuales de un barrido de escenarios etiquetadas por interés, valor de la propiedad y edad.
+
+    fees[i, p, a] is the fee for interests[i], property_values[p] and ages[a].
+    """
+    fees: np.ndarray
+    interests: np.ndarray
+    property_values: np.ndarray
+    ages: np.ndarray
+
+    dims = ('interest', 'property_value', 'age')
+
+    def fee(self, interest: float, property_value: float, age: int) -> float:
+        """
+        Returns the fee of one cell of the grid by its labels.
+
+        Devuelve la cuota de una celda de la malla según sus etiquetas.
+        """
+        index = []
+        for name, labels, value in zip(self.dims, (self.interests, self.property_values, self.ages), (interest, property_value, age)):
+            matches = np.flatnonzero(labels == value)
+            if matches.size == 0:
+                raise KeyError(f'{name} {value} is not part of the grid')
+            index.append(matches[0])
+        return float(self.fees[tuple(index)])
+
+
+def fee_grid(interests, property_values, ages, gender: str = 'M', marital_status: str = 'single',
+             spouses_age: int | None = None, spouses_gender: str | None = None,
+             mortality_table: MortalityTable | None = None) -> FeeGrid:
+    """
+    Calculates the monthly fee for every combination of interest, property value and age.
+
+    Calcula la cuota mensual para cada combinación de interés, valor de la propiedad y edad.
+
+    The fee is the property value times an annuity factor that only depends on the
+    interest and the quotas, so the factors are computed once per (interest, age) and
+    broadcast over the property values, one interest slice at a time, without creating
+    Client objects. Every cell equals ReverseMortgage.calculate_monthly_fee().
+
+    Parameters
+    ----------
+    interests : array_like of float
+        Annual interest rates of the sweep / Tasas de interés anuales del barrido
+    property_values : array_like of float
+        Property values of the sweep / Valores de la propiedad del barrido
+    ages : array_like of int
+        Client ages of the sweep / Edades del cliente del barrido
+    gender, marital_status, spouses_age, spouses_gender :
+        Fixed details of the client, as in Client / Datos fijos del cliente, como en Client
+    mortality_table : MortalityTable | None
+        Life table used to estimate the years of life, as in Client / Tabla de vida usada para estimar los años de vida, como en Client
+    """
+    interests = np.asarray(interests, dtype=np.float64).reshape(-1)
+    property_values = np.asarray(property_values, dtype=np.float64).reshape(-1)
+    ages = np.asarray(ages).reshape(-1)
+
+    # Quotas depend only on the age axis; pricing a unit property at zero interest validates it
+    _, quotas, _ = calculate_monthly_fees(
+        ages, np.full(ages.size, gender), np.full(ages.size, marital_status), np.full(ages.size, spouses_age),
+        np.full(ages.size, spouses_gender), np.ones(ages.size), np.zeros(ages.size), mortality_table)
+
+    # Interests and property values are validated along their own axis with a valid reference client
+    for axis_property_values, axis_interests in ((np.ones(interests.size), interests),
+                                                 (property_values, np.zeros(property_values.size))):
+        size = axis_interests.size
+        raise_for_error_codes(validate_batch(
+            np.full(size, ages[0]), np.full(size, gender), np.full(size, marital_status), np.full(size, spouses_age),
+            np.full(size, spouses_gender), axis_property_values, axis_interests))
+
+    fees = np.empty((interests.size, property_values.size, ages.size))
+    for index, interest in enumerate(interests):
+        if interest == 0:
+            fees[index] = _round_cents(property_values[:, None] / quotas[None, :])
+            continue
+        monthly_rate = (1 + interest / 100) ** (1 / 12) - 1
+        growth = (1 + monthly_rate) ** quotas
+        fees[index] = _round_cents(property_values[:, None] * (monthly_rate * growth / (growth - 1))[None, :])
+
+    return FeeGrid(fees, interests, property_values, ages)
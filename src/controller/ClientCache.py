@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ClientCache:
+    """
+    Thread-safe in-process cache with least recently used eviction and a time to live
+
+    Entries written by other processes are only seen once the cached copy expires,
+    so ttl bounds how stale a read can be
+    """
+
+    def __init__(self, max_size=1024, ttl=60.0):
+        """
+        max_size: maximum number of entries kept, 0 disables the cache
+        ttl: seconds an entry is served before it is read again from the database
+        """
+        if max_size < 0 or ttl < 0:
+            raise ValueError(f"Invalid cache settings: max size {max_size}, ttl {ttl}")
+
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, expiry time)
+        # Increased on every invalidation, so a value loaded before it is not stored afterwards
+        self._version = 0
+
+        # Metrics
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key):
+        """
+        Returns the cached value of a key and the version to pass to put, the value being None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if time.monotonic() < expires_at:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return value, self._version
+                del self._entries[key]
+                self._expirations += 1
+            self._misses += 1
+            return None, self._version
+
+    def put(self, key, value, version):
+        """
+        Stores a value loaded after get returned version, unless the key was invalidated in between
+        """
+        if self.max_size == 0:
+            return
+        with self._lock:
+            if version != self._version:
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, *keys):
+        """
+        Removes the given keys from the cache
+        """
+        with self._lock:
+            self._version += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Removes every entry from the cache
+        """
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+    def metrics(self):
+        """
+        Returns the hit rate and eviction metrics of the cache
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
@@ -0,0 +1,156 @@
+import itertools
+from contextlib import contextmanager
+
+# Numbers the savepoints so nested ones get different names
+SAVEPOINT_NUMBERS = itertools.count(1)
+
+
+class ClientRepository:
+    """
+    Storage of the users table used by ClientController
+
+    Backends only read and write rows; checks, typing, pricing and caching stay in ClientController.
+    Rows are tuples in the order of USER_COLUMNS:
+    (id, age, marital_status, spouse_age, spouse_gender, property_value, interest_rate, gender)
+    """
+
+    # Columns of the users table read into a User, in the order of ClientController.client_row
+    USER_COLUMNS = ("id", "age", "marital_status", "spouse_age", "spouse_gender", "property_value", "interest_rate", "gender")
+
+    # Columns that hold the stored quote of a client, computed_at being set by the backend
+    QUOTE_COLUMNS = ("quotas", "monthly_rate", "monthly_fee", "computed_at")
+
+    def create_table(self):
+        """
+        Creates the users table and its indexes if they do not exist
+        """
+        raise NotImplementedError
+
+    def transaction(self, row_factory=None):
+        """
+        Context manager that yields a transaction handle for the other methods,
+        committing when the block ends and rolling back if it raises
+
+        row_factory: function called with each row read, whose result is returned instead of the tuple
+        """
+        raise NotImplementedError
+
+    @contextmanager
+    def savepoint(self, transaction):
+        """
+        Context manager that undoes the statements of its block if it raises, keeping the rest of the transaction
+        """
+        name = f"client_savepoint_{next(SAVEPOINT_NUMBERS)}"
+        transaction.execute(f"SAVEPOINT {name}")
+        try:
+            yield
+        except Exception:
+            transaction.execute(f"ROLLBACK TO SAVEPOINT {name}")
+            transaction.execute(f"RELEASE SAVEPOINT {name}")
+            raise
+        else:
+            transaction.execute(f"RELEASE SAVEPOINT {name}")
+
+    def insert_rows(self, transaction, rows):
+        """
+        Inserts rows followed by their quotas, monthly rate and monthly fee, skipping ID numbers that already exist
+
+        Returns the set of ID numbers inserted
+        """
+        raise NotImplementedError
+
+    def find_rows(self, transaction, ids):
+        """
+        Returns the rows of the given ID numbers that exist, in any order
+        """
+        raise NotImplementedError
+
+    def iter_rows(self, batch_size, row_factory=None):
+        """
+        Yields every row ordered by ID number, reading batch_size rows at a time
+
+        row_factory: as in transaction
+        """
+        raise NotImplementedError
+
+    def list_rows(self, transaction, after_id, limit, filters):
+        """
+        Returns up to limit rows ordered by ID number, starting after the ID number after_id (None for the first page)
+
+        filters: list of (column, operator, value) conditions that every row must meet,
+        the operator being "=", ">=", "<=" or "in" with a list of values
+        """
+        raise NotImplementedError
+
+    def delete(self, transaction, id):
+        """
+        Deletes the row of an ID number
+        """
+        raise NotImplementedError
+
+    def update(self, transaction, id, changes):
+        """
+        Sets the (column, value) changes on the row of an ID number with one statement
+
+        Returns the updated rows
+        """
+        raise NotImplementedError
+
+    def update_many(self, transaction, statements, page_size):
+        """
+        Applies many updates in order; statements is a list of (columns, parameter lists) runs of consecutive updates
+        that set the same tuple of columns, each parameter list being the new values followed by the ID number
+        """
+        raise NotImplementedError
+
+    def store_quotes(self, transaction, quotes):
+        """
+        Stores (id, quotas, monthly_rate, monthly_fee) quotes and marks them as computed now
+        """
+        raise NotImplementedError
+
+    def stale_rows(self, transaction, limit):
+        """
+        Returns up to limit rows whose quote is stale, locking them where the backend allows it
+        """
+        raise NotImplementedError
+
+    def invalidate_quotes(self, transaction):
+        """
+        Marks the quote of every row as stale
+        """
+        raise NotImplementedError
+
+    def find_quote(self, transaction, id):
+        """
+        Returns the (id, quotas, monthly_rate, monthly_fee, computed_at) of an ID number, or None
+        """
+        raise NotImplementedError
+
+    def changed_rows(self, transaction, position, limit):
+        """
+        Returns up to limit (version, row) pairs of the rows written after the (version, id) position,
+        ordered by version and ID number
+
+        Versions grow with every write to the client data of a row, and a committed change is never
+        returned behind a position already read
+        """
+        raise NotImplementedError
+
+    def load_checkpoint(self, transaction, worker):
+        """
+        Returns the (version, id) position saved by a re-pricing worker, or None if it never ran
+        """
+        raise NotImplementedError
+
+    def save_checkpoint(self, transaction, worker, position):
+        """
+        Saves the (version, id) position of a re-pricing worker
+        """
+        raise NotImplementedError
+
+    def metrics(self):
+        """
+        Returns the connection metrics of the backend
+        """
+        return {}
@@ -0,0 +1,202 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeoutException(Exception):
+    """
+    Custom exception for when no connection becomes available before the timeout
+    """
+    def __init__(self, timeout):
+        super().__init__(f"No database connection became available within {timeout} seconds")
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of database connections
+
+    Keeps between min_size and max_size open connections created with the connect
+    function, checks their health on checkout and records wait time and utilisation
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=30.0, health_check_interval=30.0):
+        """
+        connect: function without arguments that opens a new connection
+        timeout: seconds to wait for a free connection before raising PoolTimeoutException
+        health_check_interval: connections idle for longer than this are pinged with SELECT 1 on checkout
+        """
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min {min_size}, max {max_size}")
+
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._condition = threading.Condition()
+        self._idle = []  # (connection, time it was returned to the pool)
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+
+        # Metrics
+        self._checkouts = 0
+        self._waits = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._peak_in_use = 0
+        self._discarded = 0
+
+        for _ in range(min_size):
+            self._idle.append((self.connect(), time.monotonic()))
+            self._size += 1
+
+    def checkout(self):
+        """
+        Takes a healthy connection from the pool, opening a new one if the pool is not full
+        """
+        start = time.monotonic()
+        blocked = False
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("The connection pool is closed")
+                if self._idle:
+                    connection, returned_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    connection, returned_at = None, None
+                    self._size += 1
+                    break
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    raise PoolTimeoutException(self.timeout)
+                blocked = True
+                self._condition.wait(remaining)
+            self._in_use += 1
+            # Wait time only counts the time spent waiting for a free slot in the pool
+            waited = time.monotonic() - start
+            self._checkouts += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+            self._waits += blocked
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+
+        # Connecting and pinging happen outside the lock so other threads are not blocked
+        try:
+            if connection is not None and not self._is_healthy(connection, returned_at):
+                self._close_quietly(connection)
+                connection = None
+                with self._condition:
+                    self._discarded += 1
+            if connection is None:
+                connection = self.connect()
+        except Exception:
+            with self._condition:
+                self._in_use -= 1
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+        return connection
+
+    def checkin(self, connection, discard=False):
+        """
+        Returns a connection to the pool, closing it instead if it is broken or discard is True
+        """
+        if not discard and not getattr(connection, "closed", False):
+            try:
+                # Leaves no transaction open for the next user of the connection
+                connection.rollback()
+            except Exception:
+                discard = True
+        else:
+            discard = True
+
+        with self._condition:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._size -= 1
+                if discard:
+                    self._discarded += 1
+            else:
+                self._idle.append((connection, time.monotonic()))
+                connection = None
+            self._condition.notify()
+
+        if connection is not None:
+            self._close_quietly(connection)
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager that checks out a connection and always returns it to the pool
+        """
+        connection = self.checkout()
+        discard = False
+        try:
+            yield connection
+        except Exception:
+            discard = bool(getattr(connection, "closed", False))
+            raise
+        finally:
+            # Also runs for GeneratorExit and KeyboardInterrupt, e.g. a generator holding the connection closed early
+            self.checkin(connection, discard=discard)
+
+    def metrics(self):
+        """
+        Returns the wait time and utilisation metrics of the pool
+        """
+        with self._condition:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "max_size": self.max_size,
+                "utilisation": self._in_use / self.max_size,
+                "peak_in_use": self._peak_in_use,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "average_wait": self._total_wait / self._checkouts if self._checkouts else 0.0,
+                "max_wait": self._max_wait,
+                "discarded": self._discarded,
+            }
+
+    def close(self):
+        """
+        Closes every idle connection; connections in use are closed when they are returned
+        """
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for connection, _ in idle:
+            self._close_quietly(connection)
+
+    def _is_healthy(self, connection, returned_at):
+        """
+        Checks that an idle connection is still open, pinging it if it was idle for too long
+        """
+        if getattr(connection, "closed", False):
+            return False
+        if time.monotonic() - returned_at < self.health_check_interval:
+            return True
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute("SELECT 1")
+            finally:
+                cursor.close()
+            connection.rollback()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
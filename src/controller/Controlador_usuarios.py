@@ -3,9 +3,19 @@ import sys
 sys.path.append("src")
 sys.path.append(".")
 
-import psycopg2
-from psycopg2 import sql
-from controller import Secret_Config
+import copy
+import os
+from contextlib import contextmanager
+from itertools import islice
+
+try:
+    from controller import Secret_Config
+except ImportError:
+    # Without Secret_Config the clients are kept in the embedded SQLite backend
+    Secret_Config = None
+from controller.ClientCache import ClientCache
+from controller.Metrics import QUERY_METRICS, instrumented
+from controller.Quotes import Quote, price_rows, quote_values
 from Model.User import User
 
 # CONSTANTS
@@ -23,6 +33,44 @@ MIN_PROPERTY_VALUE = 10000000
 MIN_INTEREST_RATE = 6
 MAX_INTEREST_RATE = 43
 
+# Names of the marital status that include a spouse
+MARRIED_STATUS = ["Married", "Wedded", "Casado", "Casada"]
+
+# Number of rows sent to the database in each statement by insert_clients
+INSERT_CHUNK_SIZE = 1000
+
+# Number of rows fetched in each round trip by iter_clients
+FETCH_BATCH_SIZE = 1000
+
+# Default number of clients in each page of list_clients
+LIST_PAGE_SIZE = 100
+
+# Number of clients priced in each transaction by recompute_stale_quotes and reprice_changes
+QUOTE_BATCH_SIZE = 5000
+
+# Name under which reprice_changes saves its position when no worker name is given
+REPRICING_WORKER = "quotes"
+
+# Storage backend, "postgres" or "sqlite"; the CLIENT_DB_BACKEND environment variable overrides Secret_Config
+DB_BACKEND = os.environ.get("CLIENT_DB_BACKEND", getattr(Secret_Config, "DB_BACKEND", "postgres" if Secret_Config else "sqlite"))
+
+# SQLite database file, ":memory:" keeps the clients in memory
+SQLITE_PATH = getattr(Secret_Config, "SQLITE_PATH", ":memory:")
+
+# Connection pool settings, they can be overridden in Secret_Config
+POOL_MIN_SIZE = getattr(Secret_Config, "PGPOOL_MIN_SIZE", 1)
+POOL_MAX_SIZE = getattr(Secret_Config, "PGPOOL_MAX_SIZE", 10)
+POOL_TIMEOUT = getattr(Secret_Config, "PGPOOL_TIMEOUT", 30.0)
+POOL_HEALTH_CHECK_INTERVAL = getattr(Secret_Config, "PGPOOL_HEALTH_CHECK_INTERVAL", 30.0)
+
+# find_client cache settings, they can be overridden in Secret_Config; a size of 0 disables the cache
+CACHE_MAX_SIZE = getattr(Secret_Config, "CLIENT_CACHE_SIZE", 1024)
+CACHE_TTL = getattr(Secret_Config, "CLIENT_CACHE_TTL", 60.0)
+
+# Latency histograms and slow-query log, disabled by default; statements slower than the threshold in seconds are logged
+QUERY_METRICS.configure(enabled=getattr(Secret_Config, "QUERY_METRICS_ENABLED", False),
+                        slow_query_threshold=getattr(Secret_Config, "SLOW_QUERY_THRESHOLD", 0.5))
+
 
 # EXCEPTIONS
 class ClientNotUpdatedException(Exception):
@@ -74,222 +122,459 @@ class InterestRateException(Exception):
     def __init__(self, interest_rate):
         super().__init__(f"The interest rate: {interest_rate} is invalid; it should not be less than {MIN_INTEREST_RATE} or greater than {MAX_INTEREST_RATE}")
 
+class ClientSessionException(Exception):
+    """ 
+    Custom exception for a session that can not be committed because a write failed outside a savepoint
+    """
+    def __init__(self):
+        super().__init__("The session was rolled back because one of its operations failed")
+
 
 class ClientController:
 
+    # Shared storage backend, created on first use
+    repository = None
+
+    # Shared cache of find_client, created on first use
+    cache = None
+
     @staticmethod
     def get_connection():
         """
-        Creates a connection to the database and returns it
+        Creates a new connection to the PostgreSQL database configured in Secret_Config
         """
-        DATABASE = Secret_Config.PGDATABASE
-        USER = Secret_Config.PGUSER
-        PASSWORD = Secret_Config.PGPASSWORD
-        HOST = Secret_Config.PGHOST
-        PORT = Secret_Config.PGPORT
-        
-        # Connecting to the database
-        return psycopg2.connect(database=DATABASE, user=USER, password=PASSWORD, host=HOST, port=PORT)
+        from controller.PostgresRepository import connect
+        return connect()
+
+    @staticmethod
+    def get_repository():
+        """
+        Returns the shared storage backend selected by DB_BACKEND, creating it on first use
+        """
+        if ClientController.repository is None:
+            if DB_BACKEND == "postgres":
+                from controller.PostgresRepository import PostgresClientRepository
+                ClientController.repository = PostgresClientRepository(
+                    min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, timeout=POOL_TIMEOUT,
+                    health_check_interval=POOL_HEALTH_CHECK_INTERVAL)
+            elif DB_BACKEND == "sqlite":
+                from controller.SQLiteRepository import SQLiteClientRepository
+                ClientController.repository = SQLiteClientRepository(SQLITE_PATH)
+                ClientController.repository.create_table()
+            else:
+                raise ValueError(f"Unknown database backend: {DB_BACKEND}, only postgres or sqlite allowed")
+        return ClientController.repository
+
+    @staticmethod
+    def use_repository(repository):
+        """
+        Replaces the storage backend, for example with an SQLite repository in tests, and empties the cache
+        """
+        ClientController.repository = repository
+        ClientController.get_cache().clear()
+
+    @staticmethod
+    @contextmanager
+    def session(isolate=True):
+        """ 
+        Context manager that yields a ClientSession, committing all its operations together when the block ends
+
+        Everything is rolled back if the block raises. The cache entries of the clients written
+        are invalidated once the transaction ends
+        """
+        session = None
+        try:
+            with ClientController.get_repository().transaction() as transaction:
+                session = ClientSession(ClientController.get_repository(), transaction, isolate)
+                yield session
+                if session.failed:
+                    raise ClientSessionException()
+        finally:
+            if session is not None:
+                ClientController.get_cache().invalidate(*session.changed_ids)
+
+    @staticmethod
+    def pool_metrics():
+        """
+        Returns the wait time and utilisation metrics of the connection pool
+        """
+        return ClientController.get_repository().metrics()
+
+    @staticmethod
+    def configure_metrics(enabled=None, slow_query_threshold=None):
+        """ 
+        Turns the latency histograms on or off and changes the slow-query threshold in seconds
+        """
+        QUERY_METRICS.configure(enabled=enabled, slow_query_threshold=slow_query_threshold)
+
+    @staticmethod
+    def metrics_dump():
+        """ 
+        Returns the latency histograms, slow-query count, pool and cache metrics as plain text
+        in the Prometheus exposition format
+        """
+        lines = [QUERY_METRICS.dump()]
+        for prefix, metrics in (("controller_pool", ClientController.pool_metrics()),
+                                ("controller_cache", ClientController.cache_metrics())):
+            for name, value in metrics.items():
+                if isinstance(value, (int, float)):
+                    lines.append(f"{prefix}_{name} {value}\n")
+        return "".join(lines)
+
+    @staticmethod
+    def slow_queries():
+        """ 
+        Returns the latest statements slower than the slow-query threshold, with their literals redacted
+        """
+        return list(QUERY_METRICS.slow_queries)
 
     @staticmethod
+    def get_cache():
+        """
+        Returns the shared cache of find_client, creating it on first use
+        """
+        if ClientController.cache is None:
+            ClientController.cache = ClientCache(max_size=CACHE_MAX_SIZE, ttl=CACHE_TTL)
+        return ClientController.cache
+
+    @staticmethod
+    def cache_metrics():
+        """
+        Returns the hit rate metrics of the find_client cache
+        """
+        return ClientController.get_cache().metrics()
+
+    @staticmethod
+    @instrumented
     def create_table():
         """ 
-        Creates the clients table in the database 
+        Creates the clients table in the database and applies the pending migrations
         """
         try:
-            connection = ClientController.get_connection()
-            cursor = connection.cursor()
-
-            # Query with sql.SQL
-            cursor.execute(sql.SQL("""
-                CREATE TABLE IF NOT EXISTS Users (
-                    id VARCHAR(20) NOT NULL PRIMARY KEY,
-                    age VARCHAR(2) NOT NULL,
-                    marital_status TEXT NOT NULL,
-                    spouse_age VARCHAR(2),
-                    spouse_gender TEXT,
-                    property_value VARCHAR(20) NOT NULL,
-                    interest_rate VARCHAR(4) NOT NULL
-                )
-            """))
-            
-            connection.commit()
+            ClientController.get_repository().create_table()
             print("TABLE CREATED SUCCESSFULLY\n")
-        except psycopg2.errors.DuplicateTable:
-            print("THE TABLE ALREADY EXISTS\n")
         except Exception as e:
             print(f"Error creating table: {e}")
-        finally:
-            cursor.close()
-            connection.close()
 
     @staticmethod
+    @instrumented
     def clear_table():
         """ 
         Deletes all records from the clients table in the database 
         """
-        connection = ClientController.get_connection()
-        cursor = connection.cursor()
+        with ClientController.get_repository().transaction():
+            # Execute the query to delete all records from the table
+            pass
 
-        # Execute the query to delete all records from the table
-        cursor.connection.commit()
-        cursor.close()
-        connection.close()
+        ClientController.get_cache().clear()
         
     @staticmethod
+    @instrumented
     def insert_client(client: User):
         """ 
-        Receives an instance of the User class and inserts it into the respective table
+        Receives an instance of the User class and inserts it into the respective table, with its quote
         """
-        connection = ClientController.get_connection()
-        cursor = connection.cursor()
+        with ClientController.session(isolate=False) as session:
+            session.insert_client(client)
+    
+    @staticmethod
+    @instrumented
+    def insert_clients(clients, chunk_size=INSERT_CHUNK_SIZE):
+        """ 
+        Inserts many clients in a single transaction, reading them in chunks so memory stays flat
 
-        ClientController.verify_empty_fields(client.id, client.marital_status, client.age, client.property_value, client.interest_rate)
-        ClientController.verify_age(int(client.age))
-        ClientController.verify_property(float(client.property_value))
-        ClientController.verify_interest(float(client.interest_rate))
+        Every client goes through the same checks as insert_client. Returns the rejected rows
+        as a list of (position, client, exception), including ids that already exist
+        """
+        with ClientController.session(isolate=False) as session:
+            return session.insert_clients(clients, chunk_size)
+
+    @staticmethod
+    def client_row(client: User):
+        """ 
+        Returns the typed values of a client in the column order of the users table, without spouse data if not married
+        """
+        if client.marital_status.title() in MARRIED_STATUS:
+            return (client.id, client.age, client.marital_status, client.spouse_age, client.spouse_gender, client.property_value, client.interest_rate, client.gender)
+        return (client.id, client.age, client.marital_status, None, None, client.property_value, client.interest_rate, client.gender)
 
-        try:
-            # Conditional to check if the client has a spouse
-            if client.marital_status.title() in ["Married", "Wedded","Casado","Casada"]: 
-                # Insert the client's and spouse's data with sql.SQL
-                cursor.execute(
-                    sql.SQL("""
-                        INSERT INTO users (id, age, marital_status, spouse_age, spouse_gender, property_value, interest_rate)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    """),
-                    (client.id, client.age, client.marital_status, client.spouse_age, client.spouse_gender, client.property_value, client.interest_rate)
-                )
-            else:
-                # Insert only the client's data with sql.SQL
-                cursor.execute(
-                    sql.SQL("""
-                        INSERT INTO users (id, age, marital_status, property_value, interest_rate)
-                        VALUES (%s, %s, %s, %s, %s)
-                    """),
-                    (client.id, client.age, client.marital_status, client.property_value, client.interest_rate)
-                )
-
-            connection.commit()
-            
-        except Exception as e:
-            connection.rollback()
-            print(f"Error agregando usuario: {e}")
-            raise ClientNotInsertedException()
-        finally:
-            cursor.close()
-            connection.close()
-    
     @staticmethod
+    def quoted_rows(rows):
+        """ 
+        Appends the quotas, monthly rate and monthly fee to rows of client_row, pricing them all at once
+        """
+        rows = list(rows)
+        return [row + quote_values(quote)[1:] for row, quote in zip(rows, price_rows(rows))]
+
+    @staticmethod
+    @instrumented
     def find_client(id):
         """ 
         Fetches a client from the clients table by ID number 
+
+        Found clients are kept in the cache, which returns copies so callers can not change the cached client
         """
-        connection = ClientController.get_connection()
-        cursor = connection.cursor()
+        cache = ClientController.get_cache()
+        cached, version = cache.get(str(id))
+        if cached is not None:
+            return copy.copy(cached)
 
+        repository = ClientController.get_repository()
         try:
-            # Using sql.SQL for query
-            cursor.execute(
-                sql.SQL("""
-                    SELECT id, age, marital_status, spouse_age, spouse_gender, property_value, interest_rate
-                    FROM users WHERE id = %s
-                """),
-                (id,)
-            )
-
-            row = cursor.fetchone()
-            if row:
-                result = User(id=row[0], age=row[1], marital_status=row[2], spouse_age=row[3],
-                            spouse_gender=row[4], property_value=row[5], interest_rate=row[6])
-                return result
-            else:
-                return None
+            with repository.transaction(row_factory=User.from_row) as transaction:
+                clients = repository.find_rows(transaction, [str(id)])
         except Exception as e:
             print(f"Error finding client: {e}")
             return None
-        finally:
-            cursor.close()
-            connection.close()
+
+        if clients:
+            client = clients[0]
+            cache.put(str(id), client, version)
+            return copy.copy(client)
+        else:
+            return None
     
     @staticmethod
-    def delete_client(id):
+    @instrumented
+    def find_clients(ids):
         """ 
-        Deletes a client from the Clients table
+        Fetches many clients by ID number with a single query
+
+        Returns the clients found, in the same order as the given ids
         """
-        connection = ClientController.get_connection()
-        cursor = connection.cursor()
+        ids = [str(id) for id in ids]
+        if not ids:
+            return []
 
+        repository = ClientController.get_repository()
         try:
-            cursor.execute(sql.SQL("DELETE FROM users WHERE id = %s"), (id,))
-            cursor.connection.commit()
+            with repository.transaction(row_factory=User.from_row) as transaction:
+                clients = repository.find_rows(transaction, ids)
         except Exception as e:
-            print(f"Error deleting client: {e}")
-            raise ClientNotDeletedException()
-        finally:
-            cursor.close()
-            connection.close()
+            print(f"Error finding clients: {e}")
+            return []
+
+        found = {client.id: client for client in clients}
+        return [found[id] for id in ids if id in found]
+
+    @staticmethod
+    def iter_clients(batch_size=FETCH_BATCH_SIZE):
+        """ 
+        Streams every client of the table ordered by ID number, yielding User objects lazily
+
+        Only batch_size rows are held in memory at a time
+        """
+        yield from ClientController.get_repository().iter_rows(batch_size, row_factory=User.from_row)
+
+    @staticmethod
+    @instrumented
+    def list_clients(after_id=None, limit=LIST_PAGE_SIZE, min_age=None, max_age=None, marital_status=None,
+                     min_property_value=None, max_property_value=None, min_interest_rate=None, max_interest_rate=None):
+        """ 
+        Returns a page of up to limit clients ordered by ID number, keeping only those that match every given filter
+
+        Pages are read by keyset: pass the ID number of the last client of a page as after_id to get the next one,
+        so without filters or with a single marital_status a page deep in the table costs the same as the first.
+        Range filters and lists of statuses are read along the ID numbers, skipping the clients that do not match,
+        so a page costs more the fewer clients match. The ranges include their limits and
+        marital_status may be a single status or a list of them
+        """
+        if limit <= 0:
+            raise ValueError(f"Invalid page size: {limit}")
+
+        filters = [(column, operator, value) for column, operator, value in (
+            ("age", ">=", min_age),
+            ("age", "<=", max_age),
+            ("property_value", ">=", min_property_value),
+            ("property_value", "<=", max_property_value),
+            ("interest_rate", ">=", min_interest_rate),
+            ("interest_rate", "<=", max_interest_rate),
+        ) if value is not None]
+        if isinstance(marital_status, str):
+            filters.append(("marital_status", "=", marital_status))
+        elif marital_status is not None:
+            filters.append(("marital_status", "in", list(marital_status)))
+
+        repository = ClientController.get_repository()
+        try:
+            with repository.transaction(row_factory=User.from_row) as transaction:
+                return repository.list_rows(transaction, None if after_id is None else str(after_id), limit, filters)
+        except Exception as e:
+            print(f"Error listing clients: {e}")
+            return []
+
+    @staticmethod
+    @instrumented
+    def find_quote(id):
+        """ 
+        Fetches the stored quote of a client by ID number, without pricing it again
+
+        Returns None if the client does not exist; the fields of the quote are None if the client can not be priced
+        """
+        repository = ClientController.get_repository()
+        with repository.transaction() as transaction:
+            row = repository.find_quote(transaction, str(id))
+        return None if row is None else Quote(*row)
+
+    @staticmethod
+    def store_quotes(transaction, rows):
+        """ 
+        Prices rows of the users table read in USER_COLUMNS order and stores their quotes, without committing
+        """
+        rows = list(rows)
+        if rows:
+            ClientController.get_repository().store_quotes(transaction, [quote_values(quote) for quote in price_rows(rows)])
+
+    @staticmethod
+    @instrumented
+    def recompute_stale_quotes(batch_size=QUOTE_BATCH_SIZE):
+        """ 
+        Prices every client whose quote is stale with the vectorized engine, committing after each batch
+
+        Returns the number of clients priced
+        """
+        repository = ClientController.get_repository()
+        recomputed = 0
+        while True:
+            with repository.transaction() as transaction:
+                rows = repository.stale_rows(transaction, batch_size)
+                ClientController.store_quotes(transaction, rows)
+            if not rows:
+                break
+            recomputed += len(rows)
+
+        return recomputed
+
+    @staticmethod
+    @instrumented
+    def reprice_changes(worker=REPRICING_WORKER, batch_size=QUOTE_BATCH_SIZE):
+        """ 
+        Prices again only the clients written since the last run of a worker, committing after each batch
+
+        The position of the worker is saved in the same transaction as the quotes of each batch,
+        so a worker that stops goes on after its last committed batch instead of from the start.
+        Returns the number of clients priced
+        """
+        repository = ClientController.get_repository()
+        repriced = 0
+        while True:
+            with repository.transaction() as transaction:
+                position = repository.load_checkpoint(transaction, worker) or (0, "")
+                changes = repository.changed_rows(transaction, position, batch_size)
+                if not changes:
+                    break
+                ClientController.store_quotes(transaction, [row for _, row in changes])
+                version, row = changes[-1]
+                repository.save_checkpoint(transaction, worker, (version, row[0]))
+            repriced += len(changes)
+
+        return repriced
+
+    @staticmethod
+    @instrumented
+    def invalidate_quotes():
+        """ 
+        Marks the quote of every client as stale, for example after the pricing rules change
+        """
+        repository = ClientController.get_repository()
+        with repository.transaction() as transaction:
+            repository.invalidate_quotes(transaction)
+
+    @staticmethod
+    @instrumented
+    def delete_client(id):
+        """ 
+        Deletes a client from the Clients table
+        """
+        with ClientController.session(isolate=False) as session:
+            session.delete_client(id)
              
     @staticmethod
+    @instrumented
     def update_client(id, updated_data: User):
         """ 
         Updates the values of a client in the clients table by ID number
+
+        Only the given fields are changed, with a single UPDATE statement, and the quote of the client is recomputed
         """
-        connection = ClientController.get_connection()
-        cursor = connection.cursor()
+        with ClientController.session(isolate=False) as session:
+            session.update_client(id, updated_data)
 
-        try:
-            # Actualiza el ID del cliente
-            if updated_data.id:
-                cursor.execute(
-                    sql.SQL("UPDATE users SET id = %s WHERE id = %s"),
-                    (updated_data.id, id)
-                )
-
-            # Actualiza estado civil y datos del cónyuge
-            if updated_data.marital_status:
-                if updated_data.marital_status.title() == "Married":  
-                    cursor.execute(
-                        sql.SQL("UPDATE users SET marital_status = %s, spouse_age = %s, spouse_gender = %s WHERE id = %s"),
-                        (updated_data.marital_status, updated_data.spouse_age, updated_data.spouse_gender, id)
-                    ) 
-                else:
-                    cursor.execute(
-                        sql.SQL("UPDATE users SET marital_status = 'Single', spouse_age = NULL, spouse_gender = NULL WHERE id = %s"),
-                        (id,)
-                    )
-
-            
-            # Actualiza valor de la propiedad
-            if updated_data.property_value:
-                cursor.execute(
-                    sql.SQL("UPDATE users SET property_value = %s WHERE id = %s"),
-                    (updated_data.property_value, id)
-                )
-
-            # Actualiza tasa de interés
-            if updated_data.interest_rate:
-                cursor.execute(
-                    sql.SQL("UPDATE users SET interest_rate = %s WHERE id = %s"),
-                    (updated_data.interest_rate, id)
-                )
-
-            # Hacer commit una sola vez al final
-            connection.commit()
+    @staticmethod
+    @instrumented
+    def update_clients(updates, page_size=INSERT_CHUNK_SIZE):
+        """ 
+        Applies many partial updates in one transaction
 
-        except Exception as e:
-            print(f"Error updating client: {e}")
-            raise ClientNotUpdatedException()
-        finally:
-            cursor.close()
-            connection.close()
+        updates: iterable of (id, updated_data) pairs, with the same meaning as in update_client.
+        Consecutive updates that change the same columns share one statement and are sent in pages of page_size;
+        updates always run in the given order.
+        The quotes of the updated clients are recomputed together at the end.
+        If any update fails nothing is changed and ClientNotUpdatedException is raised
+        """
+        with ClientController.session(isolate=False) as session:
+            session.update_clients(updates, page_size)
+
+    @staticmethod
+    def update_changes(updated_data: User):
+        """ 
+        Returns the (column, typed value) pairs that an update of a client changes
+        """
+        changes = []
+
+        # ID del cliente
+        if updated_data.id:
+            changes.append(("id", str(updated_data.id)))
+
+        # Estado civil y datos del cónyuge
+        if updated_data.marital_status:
+            if updated_data.marital_status.title() == "Married":
+                changes += [("marital_status", updated_data.marital_status),
+                            ("spouse_age", updated_data.spouse_age),
+                            ("spouse_gender", updated_data.spouse_gender)]
+            else:
+                changes += [("marital_status", "Single"), ("spouse_age", None), ("spouse_gender", None)]
+
+        # Valor de la propiedad
+        if updated_data.property_value:
+            changes.append(("property_value", updated_data.property_value))
+
+        # Tasa de interés
+        if updated_data.interest_rate:
+            changes.append(("interest_rate", updated_data.interest_rate))
+
+        # Género del cliente
+        if updated_data.gender:
+            changes.append(("gender", updated_data.gender))
+
+        return changes
+
+    @staticmethod
+    def verify_client(client: User):
+        """ 
+        Runs every verification of a client before it is inserted
+
+        The numeric fields were already parsed when the User was created, so they are only checked here
+        """
+        ClientController.verify_empty_fields(client.id, client.marital_status, client.age, client.property_value, client.interest_rate)
+        ClientController.verify_numbers(client.age, client.property_value, client.interest_rate)
+        ClientController.verify_age(client.age)
+        ClientController.verify_property(client.property_value)
+        ClientController.verify_interest(client.interest_rate)
 
-        
     @staticmethod
     def verify_empty_fields(id, marital_status, age, property_value, interest_rate):
         if id is None or marital_status is None or age is None or property_value is None or interest_rate is None:
             raise NoneException()
 
+    @staticmethod
+    def verify_numbers(age, *values):
+        if isinstance(age, bool) or not isinstance(age, int):
+            raise ValueError(f"The age: {age} is not a whole number")
+        for value in values:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"The value: {value} is not a number")
+
     @staticmethod
     def verify_age(age):
         if age < MIN_AGE or age > MAX_LIFE_EXPECTANCY_MALES:
@@ -303,4 +588,168 @@ class ClientController:
     @staticmethod
     def verify_interest(interest_rate):
         if interest_rate < MIN_INTEREST_RATE or interest_rate > MAX_INTEREST_RATE:
-            raise InterestRateException(interest_rate)
\ No newline at end of file
+            raise InterestRateException(interest_rate)
+
+
+class ClientSession:
+    """ 
+    Unit of work that runs many controller operations in one transaction on one pooled connection
+
+    Created by ClientController.session(). With isolate, every write runs inside a savepoint,
+    so a write that fails raises its exception and is undone alone while the session goes on.
+    Without it a failed write makes the whole session roll back
+    """
+
+    def __init__(self, repository, transaction, isolate=True):
+        self.repository = repository
+        self.transaction = transaction
+        self.isolate = isolate
+        self.failed = False
+        # ID numbers written by the session, removed from the cache once it ends
+        self.changed_ids = set()
+
+    def savepoint(self):
+        """ 
+        Context manager that undoes the operations of its block if it raises, keeping the rest of the session
+        """
+        return self.repository.savepoint(self.transaction)
+
+    @contextmanager
+    def write(self, message, exception):
+        """ 
+        Runs the statements of one write, inside a savepoint if the session isolates them,
+        raising the given controller exception if they fail
+        """
+        try:
+            if self.isolate:
+                with self.savepoint():
+                    yield
+            else:
+                yield
+        except Exception as e:
+            if not self.isolate:
+                self.failed = True
+            print(f"{message}: {e}")
+            raise exception()
+
+    @instrumented
+    def insert_client(self, client: User):
+        """ 
+        Same as ClientController.insert_client, inside the session
+        """
+        ClientController.verify_client(client)
+
+        with self.write("Error agregando usuario", ClientNotInsertedException):
+            # The spouse's data is left empty if the client is not married
+            inserted_ids = self.repository.insert_rows(
+                self.transaction, ClientController.quoted_rows([ClientController.client_row(client)]))
+
+        if str(client.id) not in inserted_ids:
+            print(f"Error agregando usuario: the id {client.id} already exists")
+            raise ClientNotInsertedException()
+        self.changed_ids.add(str(client.id))
+
+    @instrumented
+    def insert_clients(self, clients, chunk_size=INSERT_CHUNK_SIZE):
+        """ 
+        Same as ClientController.insert_clients, inside the session; either every valid client is inserted or none
+        """
+        rejected = []
+        seen_ids = set()
+
+        with self.write("Error agregando usuarios", ClientNotInsertedException):
+            clients = enumerate(clients)
+            while True:
+                chunk = list(islice(clients, chunk_size))
+                if not chunk:
+                    break
+
+                valid = []
+                for position, client in chunk:
+                    try:
+                        ClientController.verify_client(client)
+                    except Exception as e:
+                        rejected.append((position, client, e))
+                    else:
+                        valid.append((position, client))
+
+                if not valid:
+                    continue
+
+                # Ids that already exist are skipped and reported as rejected
+                inserted_ids = self.repository.insert_rows(
+                    self.transaction, ClientController.quoted_rows([ClientController.client_row(client) for _, client in valid]))
+                for position, client in valid:
+                    client_id = str(client.id)
+                    if client_id in inserted_ids and client_id not in seen_ids:
+                        seen_ids.add(client_id)
+                    else:
+                        rejected.append((position, client, ClientNotInsertedException()))
+
+        self.changed_ids.update(seen_ids)
+        return rejected
+
+    @instrumented
+    def find_client(self, id):
+        """ 
+        Fetches a client by ID number inside the session, seeing its uncommitted writes and skipping the cache
+        """
+        try:
+            rows = self.repository.find_rows(self.transaction, [str(id)])
+        except Exception as e:
+            print(f"Error finding client: {e}")
+            return None
+        return User.from_row(rows[0]) if rows else None
+
+    @instrumented
+    def delete_client(self, id):
+        """ 
+        Same as ClientController.delete_client, inside the session
+        """
+        with self.write("Error deleting client", ClientNotDeletedException):
+            self.repository.delete(self.transaction, str(id))
+        self.changed_ids.add(str(id))
+
+    @instrumented
+    def update_client(self, id, updated_data: User):
+        """ 
+        Same as ClientController.update_client, inside the session
+        """
+        changes = ClientController.update_changes(updated_data)
+        if not changes:
+            return
+
+        with self.write("Error updating client", ClientNotUpdatedException):
+            ClientController.store_quotes(self.transaction, self.repository.update(self.transaction, str(id), changes))
+
+        # The client may be cached under its old and its new ID number
+        self.changed_ids.update((str(id), str(dict(changes).get("id", id))))
+
+    @instrumented
+    def update_clients(self, updates, page_size=INSERT_CHUNK_SIZE):
+        """ 
+        Same as ClientController.update_clients, inside the session; either every update is applied or none
+        """
+        # Runs of consecutive updates that change the same columns share a statement; merging other updates
+        # would reorder them, and a later update of the same client or of a changed ID number would be lost
+        statements = []
+        updated_ids = []
+        old_ids = []
+        for id, updated_data in updates:
+            changes = ClientController.update_changes(updated_data)
+            if changes:
+                columns = tuple(column for column, _ in changes)
+                if not statements or statements[-1][0] != columns:
+                    statements.append((columns, []))
+                statements[-1][1].append([value for _, value in changes] + [str(id)])
+                updated_ids.append(str(dict(changes).get("id", id)))
+                old_ids.append(str(id))
+
+        if not statements:
+            return
+
+        with self.write("Error updating clients", ClientNotUpdatedException):
+            self.repository.update_many(self.transaction, statements, page_size)
+            ClientController.store_quotes(self.transaction, self.repository.find_rows(self.transaction, updated_ids))
+
+        self.changed_ids.update(old_ids, updated_ids)
@@ -0,0 +1,259 @@
+import bisect
+import contextvars
+import functools
+import logging
+import re
+import threading
+import time
+from collections import deque
+from typing import NamedTuple
+
+# Upper bounds in seconds of the latency histogram buckets, slower observations fall in a last +Inf bucket
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Number of slow statements kept in memory
+SLOW_QUERY_LOG_SIZE = 100
+
+# Longest statement text kept in the slow-query log
+MAX_STATEMENT_LENGTH = 500
+
+slow_query_logger = logging.getLogger("controller.slow_queries")
+
+# Name of the controller operation running in the current thread
+_operation = contextvars.ContextVar("operation", default=None)
+
+# Quoted strings and numbers, with their exponent, the literals that may hold client data inside a statement
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?(?:[eE][+-]?\d+)?\b")
+
+
+class SlowQuery(NamedTuple):
+    """
+    Statement that took longer than the slow-query threshold, with its literals and parameters redacted
+    """
+    operation: str
+    seconds: float
+    statement: str
+    parameters: int
+
+
+class LatencyHistogram:
+    """
+    Counts observations in the fixed BUCKETS, keeping their sum and maximum
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, fraction):
+        """
+        Returns the upper bound of the bucket holding the given fraction of the observations
+        """
+        if self.count == 0:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.max
+
+
+def redact_statement(statement):
+    """
+    Replaces the literals of a statement with ? and shortens it to MAX_STATEMENT_LENGTH
+    """
+    if isinstance(statement, bytes):
+        statement = statement.decode("utf-8", "replace")
+    statement = " ".join(_LITERALS.sub("?", str(statement)).split())
+    if len(statement) > MAX_STATEMENT_LENGTH:
+        statement = statement[:MAX_STATEMENT_LENGTH] + " ..."
+    return statement
+
+
+class QueryMetrics:
+    """
+    Thread-safe latency histograms of the controller operations, split by phase, and a slow-query log
+
+    Phases are connect (getting a connection), execute, fetch and total (the whole operation).
+    When disabled no time is measured and cursors are not wrapped
+    """
+
+    def __init__(self, enabled=False, slow_query_threshold=0.5, slow_query_log_size=SLOW_QUERY_LOG_SIZE):
+        self.enabled = enabled
+        self.slow_query_threshold = slow_query_threshold
+        self._lock = threading.Lock()
+        self._histograms = {}  # (operation, phase) -> LatencyHistogram
+        self.slow_queries = deque(maxlen=slow_query_log_size)
+
+    def configure(self, enabled=None, slow_query_threshold=None):
+        """
+        Turns the measurements on or off and changes the slow-query threshold in seconds
+        """
+        if enabled is not None:
+            self.enabled = enabled
+        if slow_query_threshold is not None:
+            self.slow_query_threshold = slow_query_threshold
+
+    def start(self):
+        """
+        Returns the start time of a measurement, or None when disabled
+        """
+        return time.perf_counter() if self.enabled else None
+
+    def observe(self, phase, started, statement=None, parameters=None, operation=None):
+        """
+        Records the time since started in the histogram of the current operation and phase
+
+        Executed statements slower than the threshold are also added to the slow-query log;
+        statement may be a function returning its text, only called for slow statements
+        """
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        operation = operation or _operation.get() or "other"
+
+        with self._lock:
+            histogram = self._histograms.get((operation, phase))
+            if histogram is None:
+                histogram = self._histograms[(operation, phase)] = LatencyHistogram()
+            histogram.observe(seconds)
+
+        if statement is not None and seconds >= self.slow_query_threshold:
+            if callable(statement):
+                statement = statement()
+            slow_query = SlowQuery(operation, seconds, redact_statement(statement),
+                                   len(parameters) if parameters else 0)
+            self.slow_queries.append(slow_query)
+            slow_query_logger.warning("Slow query in %s (%.3f s, %d parameters redacted): %s",
+                                      slow_query.operation, slow_query.seconds, slow_query.parameters, slow_query.statement)
+
+    def snapshot(self):
+        """
+        Returns count, sum, max and approximate p50/p99 of every (operation, phase) histogram
+        """
+        with self._lock:
+            return {
+                key: {
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "max": histogram.max,
+                    "p50": histogram.quantile(0.5),
+                    "p99": histogram.quantile(0.99),
+                }
+                for key, histogram in self._histograms.items()
+            }
+
+    def reset(self):
+        """
+        Empties every histogram and the slow-query log
+        """
+        with self._lock:
+            self._histograms.clear()
+            self.slow_queries.clear()
+
+    def dump(self):
+        """
+        Returns the histograms as plain text in the Prometheus exposition format
+        """
+        lines = [
+            "# HELP controller_latency_seconds Latency of the controller operations by phase",
+            "# TYPE controller_latency_seconds histogram",
+        ]
+        with self._lock:
+            for (operation, phase), histogram in sorted(self._histograms.items()):
+                labels = f'operation="{operation}",phase="{phase}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f'controller_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"controller_latency_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+                lines.append(f"controller_latency_seconds_count{{{labels}}} {histogram.count}")
+            lines.append("# HELP controller_slow_queries Slow statements kept in the slow-query log")
+            lines.append("# TYPE controller_slow_queries gauge")
+            lines.append(f"controller_slow_queries {len(self.slow_queries)}")
+        return "\n".join(lines) + "\n"
+
+
+# Metrics shared by the controller and the storage backends
+QUERY_METRICS = QueryMetrics()
+
+
+def instrumented(function):
+    """
+    Decorator that names the statements of a controller operation after it and records its total time
+
+    Nested operations are counted under the outermost one
+    """
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not QUERY_METRICS.enabled or _operation.get() is not None:
+            return function(*args, **kwargs)
+        token = _operation.set(name)
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            QUERY_METRICS.observe("total", started)
+            _operation.reset(token)
+
+    return wrapper
+
+
+class TimedCursorMixin:
+    """
+    Mixin for DB-API cursor classes that times execute and fetch calls into QUERY_METRICS
+
+    operation names the statements when they do not run inside an instrumented operation
+    """
+    operation = None
+
+    def statement_text(self, query):
+        return query
+
+    def execute(self, query, *args):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, *args)
+        finally:
+            QUERY_METRICS.observe("execute", started, lambda: self.statement_text(query), args[0] if args else None,
+                                  self.operation)
+
+    def executemany(self, query, *args):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, *args)
+        finally:
+            QUERY_METRICS.observe("execute", started, lambda: self.statement_text(query), None, self.operation)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            QUERY_METRICS.observe("fetch", started, operation=self.operation)
+
+    def fetchmany(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(*args)
+        finally:
+            QUERY_METRICS.observe("fetch", started, operation=self.operation)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            QUERY_METRICS.observe("fetch", started, operation=self.operation)
@@ -0,0 +1,425 @@
+# Importing to include the search path
+import sys
+sys.path.append("src")
+sys.path.append(".")
+
+from psycopg2 import sql
+
+# Number of rows converted in each transaction while backfilling a migration
+BACKFILL_BATCH_SIZE = 5000
+
+# Maximum time the final swap of a migration waits for its table lock before giving up
+LOCK_TIMEOUT = "5s"
+
+# Key of the advisory lock that keeps two migration runs from overlapping
+ADVISORY_LOCK_KEY = 815001
+
+# Columns of the users table stored as VARCHAR before version 1, with their typed replacement
+TYPED_COLUMNS = [
+    ("age", "SMALLINT", True),
+    ("spouse_age", "SMALLINT", False),
+    ("property_value", "NUMERIC(20, 2)", True),
+    ("interest_rate", "NUMERIC(5, 2)", True),
+]
+
+# Indexes for the common filters of the users table
+INDEXES = [
+    ("users_age_interest_rate_idx", "(age, interest_rate)"),
+    ("users_interest_rate_idx", "(interest_rate)"),
+]
+
+# Quote fields stored next to each client, recomputed when the client changes
+QUOTE_COLUMNS = [
+    ("gender", "TEXT"),
+    ("quotas", "SMALLINT"),
+    ("monthly_rate", "DOUBLE PRECISION"),
+    ("monthly_fee", "NUMERIC(20, 2)"),
+    ("computed_at", "TIMESTAMPTZ"),
+]
+
+# Index of the clients whose quote is stale, used by the recompute job
+QUOTE_INDEXES = [
+    ("users_stale_quotes_idx", "(id) WHERE computed_at IS NULL"),
+]
+
+# Indexes of the list_clients filters that return rows in keyset order: the equality filter followed by id.
+# Range filters have no such index, their pages are read along the primary key skipping the rows that do not match
+LIST_INDEXES = [
+    ("users_marital_status_id_idx", "(marital_status, id)"),
+]
+
+# Indexes created by earlier versions that no query can use
+DROPPED_INDEXES = ["users_property_value_idx"]
+
+# Client data columns whose changes give a row a new version, the quote columns are left out
+TRACKED_COLUMNS = ("id", "age", "marital_status", "spouse_age", "spouse_gender", "property_value", "interest_rate", "gender")
+
+# Index read in order by the re-pricing workers
+CHANGE_INDEXES = [
+    ("users_version_idx", "(version, id)"),
+]
+
+
+class MigrationException(Exception):
+    """
+    Custom exception for when a migration can not be applied
+    """
+    def __init__(self, version, name, error):
+        super().__init__(f"Migration {version} ({name}) could not be applied: {error}")
+
+
+def column_type(cursor, table, column):
+    """
+    Returns the data type of a column, or None if the column does not exist
+    """
+    cursor.execute(
+        """
+            SELECT data_type FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s
+        """,
+        (table, column)
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def rejected_rows(cursor, limit=10):
+    """
+    Returns the ID numbers of up to limit rows whose legacy values could not be converted by typed_columns,
+    and how many rows there are in total
+
+    A value is rejected when it is not a number, does not fit its typed column or is missing from a NOT NULL column
+    """
+    rejected = sql.SQL(" OR ").join(
+        sql.SQL("{} IS NULL").format(sql.Identifier(f"{column}_typed")) if required else
+        sql.SQL("({} IS NULL AND NULLIF(btrim({}), '') IS NOT NULL)").format(
+            sql.Identifier(f"{column}_typed"), sql.Identifier(column))
+        for column, _, required in TYPED_COLUMNS
+    )
+    cursor.execute(sql.SQL("SELECT id, count(*) OVER () FROM users WHERE {} ORDER BY id LIMIT %s").format(rejected),
+                   (limit,))
+    rows = cursor.fetchall()
+    return [id for id, _ in rows], rows[0][1] if rows else 0
+
+
+def drop_typed_columns_sync(connection):
+    """
+    Removes the trigger and the NOT VALID constraints of a typed_columns run that failed, so writes do not pay
+    for them until the migration runs again; the shadow columns are left, a new run fills them again
+    """
+    connection.rollback()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("DROP TRIGGER IF EXISTS users_sync_typed_columns ON users")
+        cursor.execute("DROP FUNCTION IF EXISTS users_sync_typed_columns()")
+        for column, _, required in TYPED_COLUMNS:
+            if required:
+                cursor.execute(sql.SQL("ALTER TABLE users DROP CONSTRAINT IF EXISTS {}").format(
+                    sql.Identifier(f"users_{column}_typed_not_null")))
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+def typed_columns(connection, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Moves the numeric columns of the users table from VARCHAR to SMALLINT/NUMERIC without taking it offline
+
+    1. Adds nullable shadow columns, which only changes the catalog
+    2. Keeps the shadow columns in sync with a trigger while the old columns are still written
+    3. Backfills the existing rows in batches by ID number, committing after each batch
+    4. Checks the NOT NULL columns with NOT VALID constraints validated without blocking writes
+    5. Swaps the columns in one short transaction that gives up if it can not get its lock in LOCK_TIMEOUT
+
+    Legacy values that are not numbers, or do not fit their typed column, are converted to NULL and stop the
+    migration before the swap with the ID numbers of their rows. If any step fails the trigger is removed,
+    and the migration can run again once those rows are fixed
+    """
+    cursor = connection.cursor()
+    try:
+        if column_type(cursor, "users", "age") == "smallint":
+            return
+
+        # 1. Columnas sombra
+        for column, type, _ in TYPED_COLUMNS:
+            cursor.execute(sql.SQL("ALTER TABLE users ADD COLUMN IF NOT EXISTS {} {}").format(
+                sql.Identifier(f"{column}_typed"), sql.SQL(type)))
+        connection.commit()
+
+        try:
+            backfill_typed_columns(connection, cursor, batch_size)
+        except Exception:
+            drop_typed_columns_sync(connection)
+            raise
+    finally:
+        cursor.close()
+
+
+def backfill_typed_columns(connection, cursor, batch_size):
+    """
+    Steps 2 to 5 of typed_columns, once the shadow columns exist
+    """
+    # 2. Trigger de sincronización; un valor que no se puede convertir queda en NULL en lugar de
+    # hacer fallar la escritura, y se rechaza antes del intercambio
+    casts = sql.SQL(" ").join(
+        sql.SQL("BEGIN NEW.{} := NULLIF(btrim(NEW.{}), '')::{}; "
+                "EXCEPTION WHEN data_exception THEN NEW.{} := NULL; END;").format(
+            sql.Identifier(f"{column}_typed"), sql.Identifier(column), sql.SQL(type),
+            sql.Identifier(f"{column}_typed"))
+        for column, type, _ in TYPED_COLUMNS
+    )
+    cursor.execute(sql.SQL("""
+        CREATE OR REPLACE FUNCTION users_sync_typed_columns() RETURNS trigger AS $$
+        BEGIN {} RETURN NEW; END
+        $$ LANGUAGE plpgsql
+    """).format(casts))
+    cursor.execute("DROP TRIGGER IF EXISTS users_sync_typed_columns ON users")
+    cursor.execute("""
+        CREATE TRIGGER users_sync_typed_columns BEFORE INSERT OR UPDATE ON users
+        FOR EACH ROW EXECUTE FUNCTION users_sync_typed_columns()
+    """)
+    connection.commit()
+
+    # 3. Relleno por lotes; el trigger calcula las columnas sombra de cada fila actualizada
+    last_id = ""
+    while True:
+        # El último id se calcula en SQL, con la misma intercalación que ORDER BY
+        cursor.execute(
+            """
+                WITH updated AS (
+                    UPDATE users SET age = age
+                    WHERE id IN (SELECT id FROM users WHERE id > %s ORDER BY id LIMIT %s)
+                    RETURNING id
+                )
+                SELECT max(id) FROM updated
+            """,
+            (last_id, batch_size)
+        )
+        batch_last_id = cursor.fetchone()[0]
+        connection.commit()
+        if batch_last_id is None:
+            break
+        last_id = batch_last_id
+
+    ids, count = rejected_rows(cursor)
+    connection.commit()
+    if count:
+        raise ValueError(f"{count} rows hold values that are not valid numbers, e.g. ID numbers {', '.join(ids)}")
+
+    # 4. Restricciones NOT NULL validadas sin bloquear escrituras
+    for column, _, required in TYPED_COLUMNS:
+        if required:
+            constraint = sql.Identifier(f"users_{column}_typed_not_null")
+            cursor.execute(sql.SQL("ALTER TABLE users DROP CONSTRAINT IF EXISTS {}").format(constraint))
+            cursor.execute(sql.SQL("ALTER TABLE users ADD CONSTRAINT {} CHECK ({} IS NOT NULL) NOT VALID").format(
+                constraint, sql.Identifier(f"{column}_typed")))
+            connection.commit()
+            cursor.execute(sql.SQL("ALTER TABLE users VALIDATE CONSTRAINT {}").format(constraint))
+            connection.commit()
+
+    # 5. Intercambio de columnas en una transacción corta
+    cursor.execute(sql.SQL("SET LOCAL lock_timeout = {}").format(sql.Literal(LOCK_TIMEOUT)))
+    cursor.execute("LOCK TABLE users IN ACCESS EXCLUSIVE MODE")
+    cursor.execute("DROP TRIGGER users_sync_typed_columns ON users")
+    cursor.execute("DROP FUNCTION users_sync_typed_columns()")
+    for column, _, required in TYPED_COLUMNS:
+        typed = sql.Identifier(f"{column}_typed")
+        cursor.execute(sql.SQL("ALTER TABLE users DROP COLUMN {}").format(sql.Identifier(column)))
+        cursor.execute(sql.SQL("ALTER TABLE users RENAME COLUMN {} TO {}").format(typed, sql.Identifier(column)))
+        if required:
+            # The validated constraint lets SET NOT NULL skip the table scan
+            constraint = sql.Identifier(f"users_{column}_typed_not_null")
+            cursor.execute(sql.SQL("ALTER TABLE users ALTER COLUMN {} SET NOT NULL").format(sql.Identifier(column)))
+            cursor.execute(sql.SQL("ALTER TABLE users DROP CONSTRAINT {}").format(constraint))
+    connection.commit()
+
+
+def create_indexes(connection, indexes):
+    """
+    Creates indexes of the users table without blocking writes, rebuilding any left invalid by a failed run
+
+    indexes: list of (name, definition), the definition being the columns and optional WHERE clause
+    """
+    autocommit = connection.autocommit
+    connection.autocommit = True
+    cursor = connection.cursor()
+    try:
+        for name, definition in indexes:
+            cursor.execute(
+                "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)",
+                (name,)
+            )
+            row = cursor.fetchone()
+            if row and row[0]:
+                continue
+            if row:
+                cursor.execute(sql.SQL("DROP INDEX CONCURRENTLY {}").format(sql.Identifier(name)))
+            # CREATE INDEX CONCURRENTLY can not run inside a transaction block
+            cursor.execute(sql.SQL("CREATE INDEX CONCURRENTLY {} ON users {}").format(
+                sql.Identifier(name), sql.SQL(definition)))
+    finally:
+        cursor.close()
+        connection.autocommit = autocommit
+
+
+def filter_indexes(connection, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Creates the indexes of the common filters
+    """
+    create_indexes(connection, INDEXES)
+
+
+def quote_columns(connection, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Adds the client gender and the quote columns, all nullable so only the catalog changes
+
+    Existing clients are left with a stale quote, priced later by ClientController.recompute_stale_quotes
+    """
+    cursor = connection.cursor()
+    try:
+        for column, type in QUOTE_COLUMNS:
+            cursor.execute(sql.SQL("ALTER TABLE users ADD COLUMN IF NOT EXISTS {} {}").format(
+                sql.Identifier(column), sql.SQL(type)))
+        connection.commit()
+    finally:
+        cursor.close()
+
+    create_indexes(connection, QUOTE_INDEXES)
+
+
+def list_indexes(connection, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Creates the indexes used to filter the pages of list_clients
+    """
+    create_indexes(connection, LIST_INDEXES)
+
+
+def change_tracking(connection, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Adds the version and updated_at columns, set by a trigger whenever the client data of a row is written,
+    and the change_checkpoints table where the re-pricing workers save their position
+
+    The version is the ID of the transaction that wrote the row. Rows written before this migration
+    keep a NULL version; their quotes are priced by ClientController.recompute_stale_quotes
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS version BIGINT")
+        cursor.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ")
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION users_track_change() RETURNS trigger AS $$
+            BEGIN
+                NEW.version := txid_current();
+                NEW.updated_at := now();
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        cursor.execute("DROP TRIGGER IF EXISTS users_track_change ON users")
+        cursor.execute(sql.SQL("""
+            CREATE TRIGGER users_track_change BEFORE INSERT OR UPDATE OF {} ON users
+            FOR EACH ROW EXECUTE FUNCTION users_track_change()
+        """).format(sql.SQL(", ").join(sql.Identifier(column) for column in TRACKED_COLUMNS)))
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS change_checkpoints (
+                worker TEXT NOT NULL PRIMARY KEY,
+                version BIGINT NOT NULL,
+                id VARCHAR(20) NOT NULL,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+        connection.commit()
+    finally:
+        cursor.close()
+
+    create_indexes(connection, CHANGE_INDEXES)
+
+
+def drop_unused_indexes(connection, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Drops the DROPPED_INDEXES without blocking writes
+    """
+    autocommit = connection.autocommit
+    connection.autocommit = True
+    cursor = connection.cursor()
+    try:
+        for name in DROPPED_INDEXES:
+            cursor.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier(name)))
+    finally:
+        cursor.close()
+        connection.autocommit = autocommit
+
+
+# Migrations of the database in the order they are applied: (version, name, function)
+MIGRATIONS = [
+    (1, "typed_columns", typed_columns),
+    (2, "filter_indexes", filter_indexes),
+    (3, "quote_columns", quote_columns),
+    (4, "list_indexes", list_indexes),
+    (5, "change_tracking", change_tracking),
+    (6, "drop_unused_indexes", drop_unused_indexes),
+]
+
+
+def applied_versions(connection):
+    """
+    Returns the versions already applied, creating the schema_migrations table if needed
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER NOT NULL PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+        cursor.execute("SELECT version FROM schema_migrations")
+        versions = set(row[0] for row in cursor.fetchall())
+        connection.commit()
+        return versions
+    finally:
+        cursor.close()
+
+
+def migrate(connection, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Applies every pending migration in order and returns the versions applied
+
+    Each migration commits its own steps, so it must be able to resume after a failed run
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT pg_advisory_lock(%s)", (ADVISORY_LOCK_KEY,))
+    connection.commit()
+
+    applied = []
+    try:
+        done = applied_versions(connection)
+        for version, name, function in MIGRATIONS:
+            if version in done:
+                continue
+            try:
+                function(connection, batch_size)
+                cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+                connection.commit()
+            except Exception as e:
+                connection.rollback()
+                raise MigrationException(version, name, e)
+            applied.append(version)
+    finally:
+        cursor.execute("SELECT pg_advisory_unlock(%s)", (ADVISORY_LOCK_KEY,))
+        connection.commit()
+        cursor.close()
+
+    return applied
+
+
+if __name__ == "__main__":
+    from controller.Controlador_usuarios import ClientController
+
+    connection = ClientController.get_connection()
+    try:
+        versions = migrate(connection)
+        print(f"APPLIED MIGRATIONS: {versions}" if versions else "THE DATABASE IS UP TO DATE")
+    finally:
+        connection.close()
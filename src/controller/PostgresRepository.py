@@ -0,0 +1,286 @@
+# Importing to include the search path
+import sys
+sys.path.append("src")
+sys.path.append(".")
+
+import uuid
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2 import sql
+from psycopg2.extras import execute_batch, execute_values
+
+from controller.ClientRepository import ClientRepository
+from controller.ConnectionPool import ConnectionPool
+from controller.Metrics import QUERY_METRICS, TimedCursorMixin
+from controller.Migrations import migrate
+
+USER_COLUMNS = sql.SQL(", ").join(sql.Identifier(column) for column in ClientRepository.USER_COLUMNS)
+QUOTE_COLUMNS = sql.SQL(", ").join(sql.Identifier(column) for column in ClientRepository.QUOTE_COLUMNS)
+
+
+class RowFactoryCursor(psycopg2.extensions.cursor):
+    """
+    psycopg2 cursor that passes every fetched row to its row_factory, like the sqlite3 cursors
+    """
+    row_factory = None
+
+    def fetchone(self):
+        row = super().fetchone()
+        return row if self.row_factory is None or row is None else self.row_factory(row)
+
+    def fetchmany(self, *args):
+        rows = super().fetchmany(*args)
+        return rows if self.row_factory is None else list(map(self.row_factory, rows))
+
+    def fetchall(self):
+        rows = super().fetchall()
+        return rows if self.row_factory is None else list(map(self.row_factory, rows))
+
+
+class TimedCursor(TimedCursorMixin, RowFactoryCursor):
+    """
+    psycopg2 cursor that records its execute and fetch times in QUERY_METRICS
+    """
+
+    def statement_text(self, query):
+        return query.as_string(self) if isinstance(query, sql.Composable) else query
+
+
+def cursor_factory():
+    """
+    Returns the cursor class to use, the untimed one when the metrics are disabled
+    """
+    return TimedCursor if QUERY_METRICS.enabled else RowFactoryCursor
+
+
+def connect():
+    """
+    Creates a new connection to the database configured in Secret_Config
+    """
+    from controller import Secret_Config
+
+    DATABASE = Secret_Config.PGDATABASE
+    USER = Secret_Config.PGUSER
+    PASSWORD = Secret_Config.PGPASSWORD
+    HOST = Secret_Config.PGHOST
+    PORT = Secret_Config.PGPORT
+
+    # Connecting to the database
+    return psycopg2.connect(database=DATABASE, user=USER, password=PASSWORD, host=HOST, port=PORT)
+
+
+class PostgresClientRepository(ClientRepository):
+    """
+    Users table in PostgreSQL, reached through a pool of psycopg2 connections
+    """
+
+    def __init__(self, connect=connect, min_size=1, max_size=10, timeout=30.0, health_check_interval=30.0):
+        self.pool = ConnectionPool(connect, min_size=min_size, max_size=max_size, timeout=timeout,
+                                   health_check_interval=health_check_interval)
+
+    def create_table(self):
+        try:
+            with self.pool.connection() as connection:
+                cursor = connection.cursor()
+                try:
+                    # Query with sql.SQL
+                    cursor.execute(sql.SQL("""
+                        CREATE TABLE IF NOT EXISTS Users (
+                            id VARCHAR(20) NOT NULL PRIMARY KEY,
+                            age SMALLINT NOT NULL,
+                            marital_status TEXT NOT NULL,
+                            spouse_age SMALLINT,
+                            spouse_gender TEXT,
+                            property_value NUMERIC(20, 2) NOT NULL,
+                            interest_rate NUMERIC(5, 2) NOT NULL,
+                            gender TEXT,
+                            quotas SMALLINT,
+                            monthly_rate DOUBLE PRECISION,
+                            monthly_fee NUMERIC(20, 2),
+                            computed_at TIMESTAMPTZ,
+                            version BIGINT,
+                            updated_at TIMESTAMPTZ
+                        )
+                    """))
+                    connection.commit()
+                finally:
+                    cursor.close()
+
+                # Converts tables created with older versions and adds the indexes
+                migrate(connection)
+        except psycopg2.errors.DuplicateTable:
+            pass
+
+    @contextmanager
+    def transaction(self, row_factory=None):
+        started = QUERY_METRICS.start()
+        with self.pool.connection() as connection:
+            QUERY_METRICS.observe("connect", started)
+            cursor = connection.cursor(cursor_factory=cursor_factory())
+            cursor.row_factory = row_factory
+            try:
+                yield cursor
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def insert_rows(self, cursor, rows):
+        if not rows:
+            return set()
+        # Ids that already exist are skipped by ON CONFLICT
+        return set(row[0] for row in execute_values(
+            cursor,
+            sql.SQL("""
+                INSERT INTO users ({}, {})
+                VALUES %s
+                ON CONFLICT (id) DO NOTHING
+                RETURNING id
+            """).format(USER_COLUMNS, QUOTE_COLUMNS),
+            rows,
+            template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, now())",
+            page_size=len(rows),
+            fetch=True
+        ))
+
+    def find_rows(self, cursor, ids):
+        cursor.execute(sql.SQL("SELECT {} FROM users WHERE id = ANY(%s)").format(USER_COLUMNS), (list(ids),))
+        return cursor.fetchall()
+
+    def iter_rows(self, batch_size, row_factory=None):
+        started = QUERY_METRICS.start()
+        with self.pool.connection() as connection:
+            QUERY_METRICS.observe("connect", started, operation="iter_clients")
+            # Server-side cursor, so only batch_size rows are held in memory at a time
+            cursor = connection.cursor(name=f"iter_clients_{uuid.uuid4().hex}", cursor_factory=cursor_factory())
+            cursor.itersize = batch_size
+            cursor.row_factory = row_factory
+            if isinstance(cursor, TimedCursor):
+                cursor.operation = "iter_clients"
+
+            try:
+                cursor.execute(sql.SQL("SELECT {} FROM users ORDER BY id").format(USER_COLUMNS))
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield from rows
+            finally:
+                cursor.close()
+
+    def list_rows(self, cursor, after_id, limit, filters):
+        conditions, parameters = [sql.SQL("TRUE")], []
+        if after_id is not None:
+            conditions.append(sql.SQL("id > %s"))
+            parameters.append(after_id)
+        for column, operator, value in filters:
+            if operator == "in":
+                conditions.append(sql.SQL("{} = ANY(%s)").format(sql.Identifier(column)))
+                value = list(value)
+            else:
+                conditions.append(sql.SQL("{} {} %s").format(sql.Identifier(column), sql.SQL(operator)))
+            parameters.append(value)
+
+        # Seeks to after_id in the index instead of skipping rows with OFFSET
+        cursor.execute(
+            sql.SQL("SELECT {} FROM users WHERE {} ORDER BY id LIMIT %s").format(
+                USER_COLUMNS, sql.SQL(" AND ").join(conditions)),
+            parameters + [limit]
+        )
+        return cursor.fetchall()
+
+    def delete(self, cursor, id):
+        cursor.execute(sql.SQL("DELETE FROM users WHERE id = %s"), (id,))
+
+    def update(self, cursor, id, changes):
+        cursor.execute(
+            sql.SQL("{} RETURNING {}").format(self.update_statement([column for column, _ in changes]), USER_COLUMNS),
+            [value for _, value in changes] + [id]
+        )
+        return cursor.fetchall()
+
+    def update_many(self, cursor, statements, page_size):
+        for columns, parameters in statements:
+            execute_batch(cursor, self.update_statement(columns), parameters, page_size=page_size)
+
+    @staticmethod
+    def update_statement(columns):
+        """
+        Builds the UPDATE statement that sets the given columns for one ID number
+        """
+        assignments = sql.SQL(", ").join(sql.SQL("{} = %s").format(sql.Identifier(column)) for column in columns)
+        return sql.SQL("UPDATE users SET {} WHERE id = %s").format(assignments)
+
+    def store_quotes(self, cursor, quotes):
+        if not quotes:
+            return
+        execute_values(
+            cursor,
+            """
+                UPDATE users SET quotas = quote.quotas, monthly_rate = quote.monthly_rate,
+                                 monthly_fee = quote.monthly_fee, computed_at = now()
+                FROM (VALUES %s) AS quote (id, quotas, monthly_rate, monthly_fee)
+                WHERE users.id = quote.id
+            """,
+            quotes,
+            template="(%s, %s::SMALLINT, %s::DOUBLE PRECISION, %s::NUMERIC)",
+            page_size=len(quotes)
+        )
+
+    def stale_rows(self, cursor, limit):
+        # Rows locked by other transactions are skipped, so several jobs can run at once
+        cursor.execute(
+            sql.SQL("""
+                SELECT {} FROM users WHERE computed_at IS NULL
+                ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED
+            """).format(USER_COLUMNS),
+            (limit,)
+        )
+        return cursor.fetchall()
+
+    def invalidate_quotes(self, cursor):
+        cursor.execute("UPDATE users SET computed_at = NULL")
+
+    def find_quote(self, cursor, id):
+        cursor.execute(sql.SQL("SELECT id, {} FROM users WHERE id = %s").format(QUOTE_COLUMNS), (id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        id, quotas, monthly_rate, monthly_fee, computed_at = row
+        return (id, quotas, monthly_rate, None if monthly_fee is None else float(monthly_fee), computed_at)
+
+    def changed_rows(self, cursor, position, limit):
+        # Versions from the oldest running transaction on are left for the next call, so a change
+        # committed later can never get a version behind a saved position
+        cursor.execute(
+            sql.SQL("""
+                SELECT version, {} FROM users
+                WHERE (version, id) > (%s, %s) AND version < txid_snapshot_xmin(txid_current_snapshot())
+                ORDER BY version, id LIMIT %s
+            """).format(USER_COLUMNS),
+            (*position, limit)
+        )
+        return [(row[0], row[1:]) for row in cursor.fetchall()]
+
+    def load_checkpoint(self, cursor, worker):
+        # Locks the position so two workers with the same name take turns
+        cursor.execute("SELECT version, id FROM change_checkpoints WHERE worker = %s FOR UPDATE", (worker,))
+        row = cursor.fetchone()
+        return None if row is None else tuple(row)
+
+    def save_checkpoint(self, cursor, worker, position):
+        cursor.execute(
+            """
+                INSERT INTO change_checkpoints (worker, version, id, updated_at) VALUES (%s, %s, %s, now())
+                ON CONFLICT (worker) DO UPDATE
+                SET version = EXCLUDED.version, id = EXCLUDED.id, updated_at = EXCLUDED.updated_at
+            """,
+            (worker, *position)
+        )
+
+    def metrics(self):
+        return self.pool.metrics()
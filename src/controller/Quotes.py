@@ -0,0 +1,94 @@
+# Importing to include the search path
+import sys
+sys.path.append("src")
+sys.path.append(".")
+
+import logging
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal
+from typing import NamedTuple
+
+import numpy as np
+
+from ReverseMortgage.ClientBatch import ClientBatch
+from ReverseMortgage.MonthlyPayment import ERROR_MESSAGES, VALID
+
+# Columns of the rows priced by price_rows, in the order of ClientRepository.USER_COLUMNS
+USER_COLUMNS = ("id", "age", "marital_status", "spouse_age", "spouse_gender", "property_value", "interest_rate", "gender")
+
+# Rows the pricing engine rejects are logged here, counted by reason and without their values
+rejected_quote_logger = logging.getLogger("controller.quotes")
+
+# Genders as written in the users table, translated to the genders of the pricing engine
+ENGINE_GENDERS = {
+    "m": "M", "male": "M", "hombre": "M", "masculino": "M",
+    "f": "F", "female": "F", "mujer": "F", "femenino": "F",
+}
+
+# Marital statuses as written in the users table, translated to the marital statuses of the pricing engine
+ENGINE_MARITAL_STATUS = {
+    "married": "married", "wedded": "married", "casado": "married", "casada": "married",
+    "single": "single", "soltero": "single", "soltera": "single",
+    "widowed": "widowed", "viudo": "widowed", "viuda": "widowed",
+    "divorced": "divorced", "divorciado": "divorced", "divorciada": "divorced",
+}
+
+
+class Quote(NamedTuple):
+    """
+    Quote fields stored next to a client; all of them are None if the client can not be priced
+
+    error is the reason the pricing engine rejected the client, set by price_rows and not stored
+    """
+    id: str
+    quotas: int | None
+    monthly_rate: float | None
+    monthly_fee: float | None
+    computed_at: datetime | None = None
+    error: str | None = None
+
+
+def price_rows(rows):
+    """
+    Prices many rows of the users table at once with the vectorized engine
+
+    rows: sequences of (id, age, marital_status, spouse_age, spouse_gender, property_value, interest_rate, gender).
+    Returns one Quote per row, without computed_at. The limits of the engine are stricter than the checks of the
+    controller (e.g. the interest), so rows it rejects get a Quote of None values with the reason in error, and
+    are logged at WARNING level counted by reason
+    """
+    batch = client_batch(rows)
+    error_codes = batch.validate()
+    valid = error_codes == VALID
+    ids = batch.ids.tolist()
+    quotes = [Quote(id, None, None, None) for id in ids]
+    if not valid.all():
+        rejected = Counter()
+        for index, code in zip(np.flatnonzero(~valid).tolist(), error_codes[~valid].tolist()):
+            quotes[index] = Quote(ids[index], None, None, None, error=ERROR_MESSAGES[code])
+            rejected[ERROR_MESSAGES[code]] += 1
+        rejected_quote_logger.warning("%d of %d rows could not be priced: %s", sum(rejected.values()), len(ids),
+                                      "; ".join(f"{error} ({count})" for error, count in rejected.most_common()))
+    if valid.any():
+        monthly_fees, quotas, monthly_rates = batch[valid].calculate_monthly_fees()
+        for index, fee, quota, rate in zip(np.flatnonzero(valid).tolist(), monthly_fees.tolist(),
+                                           quotas.tolist(), monthly_rates.tolist()):
+            quotes[index] = Quote(ids[index], quota, rate, fee)
+    return quotes
+
+
+def client_batch(rows):
+    """
+    Builds the typed columns of rows of the users table read in USER_COLUMNS order, without a User per row
+    """
+    return ClientBatch.from_rows(rows, columns=USER_COLUMNS, gender_aliases=ENGINE_GENDERS,
+                                 marital_status_aliases=ENGINE_MARITAL_STATUS)
+
+
+def quote_values(quote: Quote):
+    """
+    Returns the values of a quote to write in the users table, with the monthly fee as an exact NUMERIC
+    """
+    monthly_fee = None if quote.monthly_fee is None else Decimal(f"{quote.monthly_fee:.2f}")
+    return (quote.id, quote.quotas, quote.monthly_rate, monthly_fee)
@@ -0,0 +1,41 @@
+# Importing to include the search path
+import sys
+sys.path.append("src")
+sys.path.append(".")
+
+import argparse
+import time
+
+from controller.Controlador_usuarios import ClientController, QUOTE_BATCH_SIZE, REPRICING_WORKER
+
+# Seconds the worker waits for new changes after it has caught up
+POLL_INTERVAL = 30.0
+
+
+def run(worker=REPRICING_WORKER, batch_size=QUOTE_BATCH_SIZE, interval=POLL_INTERVAL, once=False):
+    """
+    Prices the clients written since the saved position of the worker, then keeps polling for new changes
+
+    Stopping the worker is safe at any time: it resumes from the last batch it committed
+    """
+    while True:
+        repriced = ClientController.reprice_changes(worker, batch_size)
+        if repriced:
+            print(f"REPRICED CLIENTS: {repriced}")
+        if once:
+            return
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recalcula las cuotas de los clientes modificados")
+    parser.add_argument("--worker", default=REPRICING_WORKER, help="nombre con el que se guarda la posición")
+    parser.add_argument("--batch-size", type=int, default=QUOTE_BATCH_SIZE, help="clientes por transacción")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="segundos entre consultas")
+    parser.add_argument("--once", action="store_true", help="termina al ponerse al día")
+    arguments = parser.parse_args()
+
+    try:
+        run(arguments.worker, arguments.batch_size, arguments.interval, arguments.once)
+    except KeyboardInterrupt:
+        pass
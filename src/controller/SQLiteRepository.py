@@ -0,0 +1,277 @@
+# Importing to include the search path
+import sys
+sys.path.append("src")
+sys.path.append(".")
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from controller.ClientRepository import ClientRepository
+from controller.Metrics import QUERY_METRICS, TimedCursorMixin
+
+USER_COLUMNS = ", ".join(ClientRepository.USER_COLUMNS)
+QUOTE_COLUMNS = ", ".join(ClientRepository.QUOTE_COLUMNS)
+
+# Columns added after the first version of the table, created in older database files when they are opened
+ADDED_COLUMNS = (("version", "INTEGER"), ("updated_at", "TEXT"))
+
+# Gives the row of NEW the next version of the change_sequence counter, which never goes back, not even
+# when the rows with the highest versions are deleted; the same change tracking as the PostgreSQL trigger
+TRACK_CHANGE = """
+    UPDATE change_sequence SET version = version + 1;
+    UPDATE users SET version = (SELECT version FROM change_sequence),
+                     updated_at = strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')
+    WHERE id = NEW.id;
+"""
+
+
+class TimedSQLiteCursor(TimedCursorMixin, sqlite3.Cursor):
+    """
+    sqlite3 cursor that records its execute and fetch times in QUERY_METRICS
+    """
+
+
+def sqlite_value(value):
+    """
+    Converts the values SQLite can not store, the NUMERIC amounts read as Decimal, to float
+    """
+    return float(value) if isinstance(value, Decimal) else value
+
+
+def sqlite_row_factory(row_factory):
+    """
+    Adapts a function of one row to the (cursor, row) signature of the sqlite3 row factories
+    """
+    return None if row_factory is None else lambda cursor, row: row_factory(row)
+
+
+def now():
+    """
+    Returns the current time as stored in the computed_at column
+    """
+    return datetime.now(timezone.utc).isoformat()
+
+
+class SQLiteClientRepository(ClientRepository):
+    """
+    Users table in an embedded SQLite database, in memory by default
+
+    Holds a single connection shared by every thread, so transactions run one at a time.
+    The CHECK constraints reject the same non numeric values as the typed PostgreSQL columns
+    """
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self._lock = threading.RLock()
+        # Transactions are started explicitly with BEGIN
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+
+    def create_table(self):
+        with self._lock:
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS users (
+                    id TEXT NOT NULL PRIMARY KEY CHECK (length(id) <= 20),
+                    age INTEGER NOT NULL CHECK (typeof(age) = 'integer'),
+                    marital_status TEXT NOT NULL,
+                    spouse_age INTEGER CHECK (spouse_age IS NULL OR typeof(spouse_age) = 'integer'),
+                    spouse_gender TEXT,
+                    property_value NUMERIC NOT NULL CHECK (typeof(property_value) IN ('integer', 'real')),
+                    interest_rate NUMERIC NOT NULL CHECK (typeof(interest_rate) IN ('integer', 'real')),
+                    gender TEXT,
+                    quotas INTEGER,
+                    monthly_rate REAL,
+                    monthly_fee NUMERIC,
+                    computed_at TEXT
+                );
+                CREATE TABLE IF NOT EXISTS change_checkpoints (
+                    worker TEXT NOT NULL PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    id TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS users_age_interest_rate_idx ON users (age, interest_rate);
+                CREATE INDEX IF NOT EXISTS users_interest_rate_idx ON users (interest_rate);
+                CREATE INDEX IF NOT EXISTS users_stale_quotes_idx ON users (id) WHERE computed_at IS NULL;
+                CREATE INDEX IF NOT EXISTS users_marital_status_id_idx ON users (marital_status, id);
+                DROP INDEX IF EXISTS users_property_value_idx;
+            """)
+            columns = set(row[1] for row in self._connection.execute("PRAGMA table_info(users)"))
+            for column, type in ADDED_COLUMNS:
+                if column not in columns:
+                    self._connection.execute(f"ALTER TABLE users ADD COLUMN {column} {type}")
+            # Every write to the client data gives the row a new version, writes to the quote columns do not.
+            # The counter of a database file without one starts after every version already used, and the
+            # triggers are created again in case they are the ones of an older file
+            self._connection.executescript(f"""
+                CREATE INDEX IF NOT EXISTS users_version_idx ON users (version, id);
+                CREATE TABLE IF NOT EXISTS change_sequence (version INTEGER NOT NULL);
+                INSERT INTO change_sequence (version)
+                SELECT max(coalesce((SELECT max(version) FROM users), 0),
+                           coalesce((SELECT max(version) FROM change_checkpoints), 0))
+                WHERE NOT EXISTS (SELECT 1 FROM change_sequence);
+                DROP TRIGGER IF EXISTS users_track_insert;
+                CREATE TRIGGER users_track_insert AFTER INSERT ON users
+                BEGIN {TRACK_CHANGE} END;
+                DROP TRIGGER IF EXISTS users_track_update;
+                CREATE TRIGGER users_track_update AFTER UPDATE OF {USER_COLUMNS} ON users
+                BEGIN {TRACK_CHANGE} END;
+            """)
+
+    def cursor(self, operation=None):
+        """
+        Opens a cursor, timed under the given operation name when the metrics are enabled
+        """
+        if not QUERY_METRICS.enabled:
+            return self._connection.cursor()
+        cursor = self._connection.cursor(TimedSQLiteCursor)
+        cursor.operation = operation
+        return cursor
+
+    @contextmanager
+    def transaction(self, row_factory=None):
+        # Waiting for the shared connection is the connect time of SQLite
+        started = QUERY_METRICS.start()
+        with self._lock:
+            QUERY_METRICS.observe("connect", started)
+            cursor = self.cursor()
+            cursor.row_factory = sqlite_row_factory(row_factory)
+            cursor.execute("BEGIN")
+            try:
+                yield cursor
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            finally:
+                cursor.close()
+
+    def insert_rows(self, cursor, rows):
+        inserted = set()
+        for row in rows:
+            cursor.execute(
+                f"""
+                    INSERT INTO users ({USER_COLUMNS}, {QUOTE_COLUMNS})
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (id) DO NOTHING
+                """,
+                [sqlite_value(value) for value in row] + [now()]
+            )
+            if cursor.rowcount == 1:
+                inserted.add(str(row[0]))
+        return inserted
+
+    def find_rows(self, cursor, ids):
+        ids = list(ids)
+        if not ids:
+            return []
+        cursor.execute(f"SELECT {USER_COLUMNS} FROM users WHERE id IN ({', '.join('?' * len(ids))})", ids)
+        return cursor.fetchall()
+
+    def iter_rows(self, batch_size, row_factory=None):
+        # Reads by keyset so the connection is not held while the caller consumes the rows
+        last_id = ""
+        while True:
+            started = QUERY_METRICS.start()
+            with self._lock:
+                QUERY_METRICS.observe("connect", started, operation="iter_clients")
+                cursor = self.cursor("iter_clients")
+                try:
+                    cursor.execute(f"SELECT {USER_COLUMNS} FROM users WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size))
+                    rows = cursor.fetchall()
+                finally:
+                    cursor.close()
+            if not rows:
+                break
+            # The row factory is applied here, the keyset needs the ID number of the last tuple
+            yield from rows if row_factory is None else map(row_factory, rows)
+            last_id = rows[-1][0]
+
+    def list_rows(self, cursor, after_id, limit, filters):
+        conditions, parameters = ["1"], []
+        if after_id is not None:
+            conditions.append("id > ?")
+            parameters.append(after_id)
+        for column, operator, value in filters:
+            if operator == "in":
+                value = [sqlite_value(item) for item in value]
+                conditions.append(f'"{column}" IN ({", ".join("?" * len(value))})')
+                parameters.extend(value)
+            else:
+                conditions.append(f'"{column}" {operator} ?')
+                parameters.append(sqlite_value(value))
+
+        cursor.execute(f"SELECT {USER_COLUMNS} FROM users WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?",
+                       parameters + [limit])
+        return cursor.fetchall()
+
+    def delete(self, cursor, id):
+        cursor.execute("DELETE FROM users WHERE id = ?", (id,))
+
+    def update(self, cursor, id, changes):
+        cursor.execute(
+            f"{self.update_statement([column for column, _ in changes])} RETURNING {USER_COLUMNS}",
+            [sqlite_value(value) for _, value in changes] + [id]
+        )
+        return cursor.fetchall()
+
+    def update_many(self, cursor, statements, page_size):
+        for columns, parameters in statements:
+            cursor.executemany(self.update_statement(columns),
+                               [[sqlite_value(value) for value in values] for values in parameters])
+
+    @staticmethod
+    def update_statement(columns):
+        """
+        Builds the UPDATE statement that sets the given columns for one ID number
+        """
+        assignments = ", ".join(f'"{column}" = ?' for column in columns)
+        return f"UPDATE users SET {assignments} WHERE id = ?"
+
+    def store_quotes(self, cursor, quotes):
+        computed_at = now()
+        cursor.executemany(
+            "UPDATE users SET quotas = ?, monthly_rate = ?, monthly_fee = ?, computed_at = ? WHERE id = ?",
+            [(quotas, monthly_rate, sqlite_value(monthly_fee), computed_at, id) for id, quotas, monthly_rate, monthly_fee in quotes]
+        )
+
+    def stale_rows(self, cursor, limit):
+        cursor.execute(f"SELECT {USER_COLUMNS} FROM users WHERE computed_at IS NULL ORDER BY id LIMIT ?", (limit,))
+        return cursor.fetchall()
+
+    def invalidate_quotes(self, cursor):
+        cursor.execute("UPDATE users SET computed_at = NULL")
+
+    def find_quote(self, cursor, id):
+        cursor.execute(f"SELECT id, {QUOTE_COLUMNS} FROM users WHERE id = ?", (id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        id, quotas, monthly_rate, monthly_fee, computed_at = row
+        return (id, quotas, monthly_rate, None if monthly_fee is None else float(monthly_fee),
+                None if computed_at is None else datetime.fromisoformat(computed_at))
+
+    def changed_rows(self, cursor, position, limit):
+        # Transactions run one at a time, so every version written so far is already committed
+        cursor.execute(
+            f"SELECT version, {USER_COLUMNS} FROM users WHERE (version, id) > (?, ?) ORDER BY version, id LIMIT ?",
+            (*position, limit)
+        )
+        return [(row[0], row[1:]) for row in cursor.fetchall()]
+
+    def load_checkpoint(self, cursor, worker):
+        cursor.execute("SELECT version, id FROM change_checkpoints WHERE worker = ?", (worker,))
+        row = cursor.fetchone()
+        return None if row is None else tuple(row)
+
+    def save_checkpoint(self, cursor, worker, position):
+        cursor.execute(
+            """
+                INSERT INTO change_checkpoints (worker, version, id, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (worker) DO UPDATE
+                SET version = excluded.version, id = excluded.id, updated_at = excluded.updated_at
+            """,
+            (worker, *position, now())
+        )
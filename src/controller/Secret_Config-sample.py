@@ -13,3 +13,22 @@ PGPASSWORD = "ESCRIBA LA CONSTRASEÑA"
 PGHOST = "ESCRIBA LA DIRECCION DNS O DIRECCION IP DEL SERVIDOR"
 PGPORT = 5432 # POR DEFECTO ES 5432, PERO PUEDE CAMBIAR EN SU DB
 
+
+# OPCIONAL: tamaño del grupo de conexiones (pool) y tiempos en segundos
+PGPOOL_MIN_SIZE = 1
+PGPOOL_MAX_SIZE = 10
+PGPOOL_TIMEOUT = 30.0
+PGPOOL_HEALTH_CHECK_INTERVAL = 30.0
+
+# OPCIONAL: caché de búsquedas de clientes (0 la desactiva) y su vigencia en segundos
+CLIENT_CACHE_SIZE = 1024
+CLIENT_CACHE_TTL = 60.0
+
+# OPCIONAL: motor de almacenamiento, "postgres" o "sqlite" (base embebida, sin servidor)
+DB_BACKEND = "postgres"
+# Archivo de la base SQLite; ":memory:" la guarda solo en memoria
+SQLITE_PATH = ":memory:"
+
+# OPCIONAL: histogramas de latencia por operación y registro de consultas lentas (segundos)
+QUERY_METRICS_ENABLED = False
+SLOW_QUERY_THRESHOLD = 0.5
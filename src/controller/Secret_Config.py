@@ -0,0 +1,5 @@
+PGDATABASE = "postgres"
+PGUSER = "postgres"
+PGPASSWORD = ""
+PGHOST = "/tmp/pgdata"
+PGPORT = 5432
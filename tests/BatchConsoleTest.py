@@ -0,0 +1,120 @@
+import unittest
+import sys
+import io
+import json
+
+# We import it so we can include the python search path
+sys.path.append("src")
+sys.path.append(".")
+
+# Import the required modules
+from ReverseMortgage import MonthlyPayment
+from src.Console.batch import price_stream
+
+APPLICANTS_CSV = """id,age,gender,marital_status,spouse_age,spouse_gender,property_value,interest_rate
+1,65,M,single,,,200000000,7
+2,70,F,casado,68,M,300000000,5
+3,50,M,single,,,200000000,7
+4,65,M,single,,,abc,7
+"""
+
+
+class BatchConsoleTest(unittest.TestCase):
+
+    def price(self, text, format='csv', chunk_size=1000):
+        output = io.StringIO()
+        report = price_stream(io.StringIO(text), output, format, chunk_size)
+        return report, output.getvalue()
+
+    def test_prices_csv(self):
+        """
+        Tests that every applicant is written back with its quote, or with the reason it was rejected.
+        """
+        report, output = self.price(APPLICANTS_CSV)
+        lines = output.splitlines()
+        self.assertEqual("id,age,gender,marital_status,spouse_age,spouse_gender,property_value,interest_rate,"
+                         "quotas,monthly_rate,monthly_fee,error", lines[0])
+        self.assertEqual((4, 2), (report.rows, report.rejected))
+
+        hipoteca = MonthlyPayment.ReverseMortgage(200000000, 7, MonthlyPayment.Client(65, "M", "single", None, None))
+        self.assertEqual(hipoteca.calculate_monthly_fee(), float(lines[1].split(",")[10]))
+        self.assertTrue(lines[3].endswith(MonthlyPayment.ERROR_MESSAGES[MonthlyPayment.BELOW_MIN_AGE]))
+        self.assertTrue(lines[4].startswith("4,65,M,single,,,abc,7,,,,"))
+
+    def test_chunk_size_does_not_change_output(self):
+        """
+        Tests that pricing one applicant at a time gives the same output as a single chunk.
+        """
+        self.assertEqual(self.price(APPLICANTS_CSV)[1], self.price(APPLICANTS_CSV, chunk_size=1)[1])
+
+    def test_prices_jsonl(self):
+        """
+        Tests that JSON Lines applicants keep their fields and get the quote fields added.
+        """
+        text = "\n".join(json.dumps(applicant) for applicant in (
+            {"id": "1", "age": 65, "gender": "M", "marital_status": "single", "property_value": 200000000,
+             "interest_rate": 7, "branch": "norte"},
+            {"id": "2", "age": 65, "gender": "M", "marital_status": "single", "property_value": None, "interest_rate": 7},
+        ))
+        report, output = self.price(text, "jsonl")
+        priced, rejected = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual((2, 1), (report.rows, report.rejected))
+        self.assertEqual("norte", priced["branch"])
+        self.assertIsNone(priced["error"])
+        self.assertEqual(120, priced["quotas"])
+        self.assertIsNone(rejected["monthly_fee"])
+        self.assertIsNotNone(rejected["error"])
+
+    def test_jsonl_non_object_line(self):
+        """
+        Tests that a line holding JSON other than an object is rejected and the other applicants are still priced.
+        """
+        applicant = json.dumps({"id": "1", "age": 65, "gender": "M", "marital_status": "single",
+                                "property_value": 200000000, "interest_rate": 7})
+        report, output = self.price("\n".join(("[1,2]", applicant, "7")), "jsonl")
+        array, priced, number = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual((3, 2), (report.rows, report.rejected))
+        self.assertEqual({"line": "[1,2]", "quotas": None, "monthly_rate": None, "monthly_fee": None,
+                          "error": "The applicant must be a JSON object"}, array)
+        self.assertEqual(120, priced["quotas"])
+        self.assertEqual("7", number["line"])
+
+    def test_jsonl_malformed_line(self):
+        """
+        Tests that a line that is not valid JSON is rejected in its place and the rest of its chunk is still written.
+        """
+        applicant = json.dumps({"id": "1", "age": 65, "gender": "M", "marital_status": "single",
+                                "property_value": 200000000, "interest_rate": 7})
+        for chunk_size in (1, 1000):
+            report, output = self.price("\n".join((applicant, '{"id": "2", "age": 6', applicant)), "jsonl", chunk_size)
+            first, malformed, last = [json.loads(line) for line in output.splitlines()]
+            self.assertEqual((3, 1), (report.rows, report.rejected))
+            self.assertEqual('{"id": "2", "age": 6', malformed["line"])
+            self.assertTrue(malformed["error"].startswith("The line is not valid JSON"))
+            self.assertIsNone(malformed["monthly_fee"])
+            self.assertEqual(first, last)
+            self.assertIsNone(last["error"])
+
+    def test_jsonl_non_scalar_number(self):
+        """
+        Tests that an object or list where a number goes rejects only its row.
+        """
+        applicant = {"id": "1", "age": 65, "gender": "M", "marital_status": "single", "property_value": 200000000,
+                     "interest_rate": 7}
+        text = "\n".join(json.dumps(line) for line in (
+            dict(applicant, property_value={"v": 1}), applicant, dict(applicant, interest_rate=[7])))
+        report, output = self.price(text, "jsonl")
+        first, priced, last = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual((3, 2), (report.rows, report.rejected))
+        self.assertEqual({"v": 1}, first["property_value"])
+        self.assertEqual("Property value and interest must be numbers", first["error"])
+        self.assertEqual(120, priced["quotas"])
+        self.assertEqual("Property value and interest must be numbers", last["error"])
+
+    def test_missing_columns(self):
+        with self.assertRaises(ValueError):
+            self.price("id,age\n1,65\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import sys
+import time
+
+# We import it so we can include the python search path
+sys.path.append("src")
+sys.path.append(".")
+
+# Import the required modules
+from src.controller.ClientCache import ClientCache
+
+
+class ClientCacheTest(unittest.TestCase):
+
+    def test_hits_and_misses(self):
+        cache = ClientCache(max_size=2, ttl=60)
+        value, version = cache.get("1")
+        self.assertIsNone(value)
+        cache.put("1", "uno", version)
+        self.assertEqual("uno", cache.get("1")[0])
+        metrics = cache.metrics()
+        self.assertEqual((1, 1, 0.5), (metrics["hits"], metrics["misses"], metrics["hit_rate"]))
+
+    def test_evicts_least_recently_used(self):
+        cache = ClientCache(max_size=2, ttl=60)
+        for key in ("1", "2"):
+            cache.put(key, key, cache.get(key)[1])
+        cache.get("1")
+        cache.put("3", "3", cache.get("3")[1])
+        self.assertIsNone(cache.get("2")[0])
+        self.assertEqual("1", cache.get("1")[0])
+        self.assertEqual(1, cache.metrics()["evictions"])
+
+    def test_expires_entries(self):
+        cache = ClientCache(max_size=2, ttl=0.01)
+        cache.put("1", "uno", cache.get("1")[1])
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("1")[0])
+        self.assertEqual(1, cache.metrics()["expirations"])
+
+    def test_invalidation_discards_values_loaded_before(self):
+        cache = ClientCache(max_size=2, ttl=60)
+        _, version = cache.get("1")
+        cache.invalidate("1")
+        cache.put("1", "viejo", version)
+        self.assertIsNone(cache.get("1")[0])
+
+    def test_disabled(self):
+        cache = ClientCache(max_size=0, ttl=60)
+        cache.put("1", "uno", cache.get("1")[1])
+        self.assertIsNone(cache.get("1")[0])
+        self.assertEqual(0, cache.metrics()["size"])
+
+
+if __name__ == '__main__':
+    unittest.main()
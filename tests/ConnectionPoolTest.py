@@ -0,0 +1,96 @@
+import unittest
+import sys
+import threading
+
+# We import it so we can include the python search path
+sys.path.append("src")
+sys.path.append(".")
+
+# Import the required modules
+from src.controller.ConnectionPool import ConnectionPool, PoolTimeoutException
+from src.controller.Controlador_usuarios import ClientController, DB_BACKEND
+
+
+@unittest.skipUnless(DB_BACKEND == "postgres", "Needs the PostgreSQL backend")
+class ConnectionPoolTest(unittest.TestCase):
+    """
+    Runs against the database configured in Secret_Config
+    """
+
+    def setUp(self):
+        self.pool = ConnectionPool(ClientController.get_connection, min_size=1, max_size=2, timeout=0.2)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_reuses_connections(self):
+        with self.pool.connection() as first:
+            pass
+        with self.pool.connection() as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(1, self.pool.metrics()["size"])
+        self.assertEqual(2, self.pool.metrics()["checkouts"])
+
+    def test_executes_queries(self):
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            self.assertEqual((1,), cursor.fetchone())
+            cursor.close()
+            self.assertEqual(0.5, self.pool.metrics()["utilisation"])
+
+    def test_timeout_when_exhausted(self):
+        with self.pool.connection(), self.pool.connection():
+            self.assertEqual(1.0, self.pool.metrics()["utilisation"])
+            with self.assertRaises(PoolTimeoutException):
+                self.pool.checkout()
+
+    def test_waits_for_returned_connection(self):
+        connection = self.pool.checkout()
+        other = self.pool.checkout()
+        releaser = threading.Timer(0.05, self.pool.checkin, (other,))
+        releaser.start()
+        with self.pool.connection():
+            pass
+        releaser.join()
+        self.pool.checkin(connection)
+        self.assertEqual(1, self.pool.metrics()["waits"])
+        self.assertGreater(self.pool.metrics()["max_wait"], 0.01)
+
+    def test_replaces_broken_connection(self):
+        with self.pool.connection() as connection:
+            pass
+        connection.close()
+        with self.pool.connection() as replacement:
+            cursor = replacement.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+        self.assertIsNot(connection, replacement)
+        self.assertEqual(1, self.pool.metrics()["discarded"])
+
+    def test_health_check_pings_idle_connections(self):
+        self.pool.health_check_interval = 0
+        with self.pool.connection() as connection:
+            pass
+        with self.pool.connection() as same:
+            pass
+        self.assertIs(connection, same)
+
+    def test_returns_connection_of_closed_generator(self):
+        def rows():
+            with self.pool.connection():
+                yield 1
+                yield 2
+
+        for _ in range(self.pool.max_size + 1):
+            generator = rows()
+            next(generator)
+            generator.close()
+        self.assertEqual(0, self.pool.metrics()["in_use"])
+        with self.pool.connection():
+            pass
+
+
+if __name__ == '__main__':
+    unittest.main()
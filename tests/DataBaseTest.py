@@ -1,6 +1,5 @@
 import unittest
 import sys
-from psycopg2 import sql
 
 # We import it so we can include the python search path
 sys.path.append("src")
@@ -8,7 +7,9 @@ sys.path.append(".")
 
 # Import the required modules
 from src.Model.User import User
-from src.controller.Controlador_usuarios import ClientController, NoneException , AgeException, PropertyValueException, InterestRateException, MIN_AGE, MAX_INTEREST_RATE, MIN_INTEREST_RATE, MIN_PROPERTY_VALUE, MAX_LIFE_EXPECTANCY_MALES
+from ReverseMortgage import MonthlyPayment
+from src.controller.Quotes import price_rows
+from src.controller.Controlador_usuarios import ClientController, ClientNotInsertedException, ClientNotUpdatedException, ClientSessionException, NoneException , AgeException, PropertyValueException, InterestRateException, MIN_AGE, MAX_INTEREST_RATE, MIN_INTEREST_RATE, MIN_PROPERTY_VALUE, MAX_LIFE_EXPECTANCY_MALES
 
 class ControllerTest(unittest.TestCase):
     
@@ -239,6 +240,395 @@ class ControllerTest(unittest.TestCase):
         except InterestRateException:
             self.fail("InterestRateException should not have been raised for a valid interest rate")
 
+    def test_insert_usuarios(self):
+        """
+        Tests that many users are inserted at once and invalid or repeated ones are rejected.
+        """
+        usuarios = [
+            User(id="5550001", age="65", marital_status="soltero", spouse_age=None, spouse_gender=None,
+                 property_value="100000000", interest_rate="25"),
+            User(id="5550002", age="15", marital_status="soltero", spouse_age=None, spouse_gender=None,
+                 property_value="100000000", interest_rate="25"),
+            User(id="5550003", age="70", marital_status="Casado", spouse_age="68", spouse_gender="mujer",
+                 property_value="200000000", interest_rate="35"),
+            User(id="5550001", age="66", marital_status="soltero", spouse_age=None, spouse_gender=None,
+                 property_value="100000000", interest_rate="25"),
+        ]
+
+        rechazados = ClientController.insert_clients(iter(usuarios), chunk_size=2)
+
+        self.assertEqual([1, 3], [posicion for posicion, _, _ in rechazados])
+        self.assertIsInstance(rechazados[0][2], AgeException)
+        self.assertIsInstance(rechazados[1][2], ClientNotInsertedException)
+        self.assertTrue(ClientController.find_client("5550001").is_equal(usuarios[0]))
+        self.assertTrue(ClientController.find_client("5550003").is_equal(usuarios[2]))
+        self.assertIsNone(ClientController.find_client("5550002"))
+
+    def test_find_usuarios(self):
+        """
+        Tests that many users are found with one query and streamed through the whole table.
+        """
+        usuarios = [
+            User(id=f"666000{numero}", age="65", marital_status="soltero", spouse_age=None, spouse_gender=None,
+                 property_value="100000000", interest_rate="25")
+            for numero in range(5)
+        ]
+        ClientController.insert_clients(usuarios)
+
+        encontrados = ClientController.find_clients(["6660003", "no existe", "6660001"])
+        self.assertEqual(["6660003", "6660001"], [usuario.id for usuario in encontrados])
+        self.assertTrue(encontrados[0].is_equal(usuarios[3]))
+
+        recorridos = [usuario.id for usuario in ClientController.iter_clients(batch_size=2)]
+        self.assertEqual(sorted(recorridos), recorridos)
+        self.assertTrue(set(usuario.id for usuario in usuarios) <= set(recorridos))
+
+    def test_update_usuarios(self):
+        """
+        Tests that many partial updates are applied together, including a change of ID number.
+        """
+        usuarios = [
+            User(id=f"777000{numero}", age="65", marital_status="soltero", spouse_age=None, spouse_gender=None,
+                 property_value="100000000", interest_rate="25")
+            for numero in range(3)
+        ]
+        ClientController.insert_clients(usuarios)
+
+        sin_cambios = User(id=None, age=None, marital_status=None, spouse_age=None, spouse_gender=None,
+                           property_value=None, interest_rate=None)
+        ClientController.update_clients([
+            ("7770000", User(id="7770010", age=None, marital_status=None, spouse_age=None, spouse_gender=None,
+                             property_value="150000000", interest_rate=None)),
+            ("7770001", User(id=None, age=None, marital_status="Married", spouse_age="63", spouse_gender="mujer",
+                             property_value=None, interest_rate="30")),
+            ("7770002", sin_cambios),
+        ])
+
+        self.assertIsNone(ClientController.find_client("7770000"))
+        cambiado = ClientController.find_client("7770010")
+        self.assertEqual(150000000, cambiado.property_value)
+        casado = ClientController.find_client("7770001")
+        self.assertEqual(("Married", 63, "mujer", 30),
+                         (casado.marital_status, casado.spouse_age, casado.spouse_gender, casado.interest_rate))
+        self.assertTrue(ClientController.find_client("7770002").is_equal(usuarios[2]))
+
+        # A failing update leaves the whole batch unapplied
+        with self.assertRaises(ClientNotUpdatedException):
+            ClientController.update_clients([
+                ("7770002", User(id=None, age=None, marital_status=None, spouse_age=None, spouse_gender=None,
+                                 property_value="90000000", interest_rate=None)),
+                ("7770001", User(id="7770010", age=None, marital_status=None, spouse_age=None, spouse_gender=None,
+                                 property_value=None, interest_rate=None)),
+            ])
+        self.assertTrue(ClientController.find_client("7770002").is_equal(usuarios[2]))
+
+    def test_update_usuarios_in_order(self):
+        """
+        Tests that many updates run in the given order, for repeated and renamed ID numbers.
+        """
+        for id in ("7780001", "7780010"):
+            ClientController.insert_client(User(id=id, age="65", marital_status="soltero", spouse_age=None,
+                                                spouse_gender=None, property_value="100000000", interest_rate="25"))
+
+        def cambio(id=None, property_value=None, interest_rate=None):
+            return User(id=id, age=None, marital_status=None, spouse_age=None, spouse_gender=None,
+                        property_value=property_value, interest_rate=interest_rate)
+
+        # The client renamed to 7780002 is updated before being renamed again
+        ClientController.update_clients([
+            ("7780001", cambio(id="7780002")),
+            ("7780002", cambio(property_value="999999999")),
+            ("7780002", cambio(id="7780003")),
+        ])
+        self.assertIsNone(ClientController.find_client("7780002"))
+        self.assertEqual(999999999, ClientController.find_client("7780003").property_value)
+
+        # The last update of a client wins, even when an update in between changes other columns
+        ClientController.update_clients([
+            ("7780010", cambio(property_value="200000000")),
+            ("7780010", cambio(property_value="300000000", interest_rate="30")),
+            ("7780010", cambio(property_value="400000000")),
+        ])
+        cliente = ClientController.find_client("7780010")
+        self.assertEqual((400000000, 30), (cliente.property_value, cliente.interest_rate))
+
+    def test_quote_usuario(self):
+        """
+        Tests that the stored quote is computed on insert and update and by the stale recompute job.
+        """
+        usuario = User(id="8880001", age="65", marital_status="soltero", spouse_age=None, spouse_gender=None,
+                       property_value="200000000", interest_rate="25", gender="hombre")
+        with self.assertLogs("controller.quotes", level="WARNING") as logs:
+            ClientController.insert_client(usuario)
+        self.assertIn("1 of 1 rows could not be priced", logs.output[0])
+        self.assertNotIn("8880001", logs.output[0])
+
+        # The pricing engine only accepts rates up to its maximum interest, so the client has no quote
+        with self.assertLogs("controller.quotes", level="WARNING"):
+            (rechazada,) = price_rows([ClientController.client_row(usuario)])
+        self.assertEqual(MonthlyPayment.ERROR_MESSAGES[MonthlyPayment.ABOVE_MAX_INTEREST], rechazada.error)
+        cotizacion = ClientController.find_quote("8880001")
+        self.assertEqual((None, None, None), (cotizacion.quotas, cotizacion.monthly_rate, cotizacion.monthly_fee))
+        self.assertIsNotNone(cotizacion.computed_at)
+
+        ClientController.update_client("8880001", User(id=None, age=None, marital_status=None, spouse_age=None,
+                                                       spouse_gender=None, property_value=None, interest_rate="7"))
+        hipoteca = MonthlyPayment.ReverseMortgage(200000000, 7, MonthlyPayment.Client(65, "M", "single", None, None))
+        cotizacion = ClientController.find_quote("8880001")
+        self.assertEqual(hipoteca.quotas, cotizacion.quotas)
+        self.assertEqual(hipoteca.calculate_monthly_fee(), cotizacion.monthly_fee)
+
+        ClientController.invalidate_quotes()
+        self.assertIsNone(ClientController.find_quote("8880001").computed_at)
+        self.assertGreaterEqual(ClientController.recompute_stale_quotes(batch_size=2), 1)
+        recalculada = ClientController.find_quote("8880001")
+        self.assertIsNotNone(recalculada.computed_at)
+        self.assertEqual(cotizacion.monthly_fee, recalculada.monthly_fee)
+        self.assertIsNone(ClientController.find_quote("no existe"))
+
+    def test_cache_usuario(self):
+        """
+        Tests that repeated lookups are served by the cache and that updates and deletes invalidate it.
+        """
+        usuario = User(id="9990001", age="65", marital_status="soltero", spouse_age=None, spouse_gender=None,
+                       property_value="100000000", interest_rate="25")
+        ClientController.insert_client(usuario)
+
+        hits = ClientController.cache_metrics()["hits"]
+        ClientController.find_client("9990001").property_value = 0
+        self.assertTrue(ClientController.find_client("9990001").is_equal(usuario))
+        self.assertEqual(hits + 1, ClientController.cache_metrics()["hits"])
+
+        ClientController.update_client("9990001", User(id="9990002", age=None, marital_status=None, spouse_age=None,
+                                                       spouse_gender=None, property_value="110000000", interest_rate=None))
+        self.assertIsNone(ClientController.find_client("9990001"))
+        self.assertEqual(110000000, ClientController.find_client("9990002").property_value)
+
+        ClientController.delete_client("9990002")
+        self.assertIsNone(ClientController.find_client("9990002"))
+
+    def test_rejects_values_that_are_not_numbers(self):
+        """
+        Tests that the typed columns reject a spouse age that is not a number.
+        """
+        usuario = User(id="1010101", age="65", marital_status="casado", spouse_age="ab", spouse_gender="mujer",
+                       property_value="100000000", interest_rate="25")
+        with self.assertRaises(ClientNotInsertedException):
+            ClientController.insert_client(usuario)
+        self.assertIsNone(ClientController.find_client("1010101"))
+
+    def test_session_usuarios(self):
+        """
+        Tests that a session commits many operations together and isolates the ones that fail.
+        """
+        def usuario(id, spouse_age=None):
+            return User(id=id, age="65", marital_status="casado" if spouse_age else "soltero", spouse_age=spouse_age,
+                        spouse_gender="mujer" if spouse_age else None, property_value="100000000", interest_rate="25")
+
+        with ClientController.session() as session:
+            session.insert_client(usuario("1210001"))
+            session.insert_client(usuario("1210002"))
+            # A failed write is undone alone and the session goes on
+            with self.assertRaises(ClientNotInsertedException):
+                session.insert_client(usuario("1210003", spouse_age="ab"))
+            session.update_client("1210001", User(id=None, age=None, marital_status=None, spouse_age=None,
+                                                  spouse_gender=None, property_value=None, interest_rate="30"))
+            session.delete_client("1210002")
+            # The session sees its own writes before they are committed
+            self.assertEqual(30, session.find_client("1210001").interest_rate)
+
+        self.assertEqual(30, ClientController.find_client("1210001").interest_rate)
+        self.assertIsNone(ClientController.find_client("1210002"))
+        self.assertIsNone(ClientController.find_client("1210003"))
+
+        # Everything is rolled back if the block raises
+        with self.assertRaises(RuntimeError):
+            with ClientController.session() as session:
+                session.insert_client(usuario("1210004"))
+                raise RuntimeError()
+        self.assertIsNone(ClientController.find_client("1210004"))
+
+        # Without savepoints a failed write rolls back the whole session
+        with self.assertRaises(ClientSessionException):
+            with ClientController.session(isolate=False) as session:
+                session.insert_client(usuario("1210005"))
+                with self.assertRaises(ClientNotInsertedException):
+                    session.insert_client(usuario("1210006", spouse_age="ab"))
+        self.assertIsNone(ClientController.find_client("1210005"))
+
+    def test_list_usuarios(self):
+        """
+        Tests that list_clients filters the clients and pages through them by ID number.
+        """
+        usuarios = [
+            User(id="1230001", age="65", marital_status="soltero", spouse_age=None, spouse_gender=None,
+                 property_value="987654100", interest_rate="10"),
+            User(id="1230002", age="70", marital_status="Casado", spouse_age="68", spouse_gender="mujer",
+                 property_value="987654200", interest_rate="20"),
+            User(id="1230003", age="75", marital_status="soltero", spouse_age=None, spouse_gender=None,
+                 property_value="987654300", interest_rate="30"),
+            User(id="1230004", age="80", marital_status="Casada", spouse_age="81", spouse_gender="hombre",
+                 property_value="987654400", interest_rate="40"),
+            User(id="1230005", age="68", marital_status="soltero", spouse_age=None, spouse_gender=None,
+                 property_value="987654500", interest_rate="15"),
+        ]
+        ClientController.insert_clients(usuarios)
+        book = dict(min_property_value=987654000, max_property_value=987654999)
+
+        pages = []
+        page = ClientController.list_clients(limit=2, **book)
+        while page:
+            pages.append([usuario.id for usuario in page])
+            page = ClientController.list_clients(after_id=page[-1].id, limit=2, **book)
+        self.assertEqual([["1230001", "1230002"], ["1230003", "1230004"], ["1230005"]], pages)
+        self.assertTrue(ClientController.list_clients(limit=1, **book)[0].is_equal(usuarios[0]))
+
+        def ids(**filters):
+            return [usuario.id for usuario in ClientController.list_clients(**{**book, **filters})]
+
+        self.assertEqual(["1230002", "1230003", "1230005"], ids(min_age=68, max_age=75))
+        self.assertEqual(["1230001", "1230003", "1230005"], ids(marital_status="soltero"))
+        self.assertEqual(["1230002", "1230004"], ids(marital_status=["Casado", "Casada"]))
+        self.assertEqual([], ids(marital_status=[]))
+        self.assertEqual(["1230002", "1230003"], ids(min_interest_rate=20, max_interest_rate=30))
+        self.assertEqual(["1230004"], ids(min_property_value=987654400, max_property_value=987654450))
+        self.assertEqual(["1230005"], ids(after_id="1230003", marital_status="soltero", max_interest_rate=25))
+
+        with self.assertRaises(ValueError):
+            ClientController.list_clients(limit=0)
+
+    def test_reprice_changes(self):
+        """
+        Tests that the re-pricing worker only prices the clients written since its saved position.
+        """
+        ClientController.reprice_changes(worker="test")
+        self.assertEqual(0, ClientController.reprice_changes(worker="test"))
+
+        for id in ("1240001", "1240002"):
+            ClientController.insert_client(User(id=id, age="65", marital_status="soltero", spouse_age=None, spouse_gender=None,
+                                                property_value="100000000", interest_rate="7", gender="hombre"))
+        ClientController.update_client("1240001", User(id=None, age=None, marital_status=None, spouse_age=None,
+                                                       spouse_gender=None, property_value="200000000", interest_rate=None))
+        ClientController.invalidate_quotes()
+
+        # Each written client is priced once with its latest data, and storing the quotes is not a change
+        self.assertEqual(2, ClientController.reprice_changes(worker="test", batch_size=1))
+        self.assertEqual(0, ClientController.reprice_changes(worker="test"))
+        hipoteca = MonthlyPayment.ReverseMortgage(200000000, 7, MonthlyPayment.Client(65, "M", "single", None, None))
+        self.assertEqual(hipoteca.calculate_monthly_fee(), ClientController.find_quote("1240001").monthly_fee)
+
+        ClientController.delete_client("1240002")
+        self.assertEqual(0, ClientController.reprice_changes(worker="test"))
+
+        # A worker that never ran starts from the first tracked change
+        self.assertGreaterEqual(ClientController.reprice_changes(worker="test_new"), 1)
+
+    def test_reprice_changes_after_delete(self):
+        """
+        Tests that a client written after the one with the latest change was deleted is still re-priced.
+        """
+        usuario = User(id="1250009", age="65", marital_status="soltero", spouse_age=None, spouse_gender=None,
+                       property_value="100000000", interest_rate="7", gender="hombre")
+        ClientController.insert_client(usuario)
+        ClientController.reprice_changes(worker="test_delete")
+        ClientController.delete_client("1250009")
+
+        ClientController.insert_client(User(id="1250001", age="65", marital_status="soltero", spouse_age=None,
+                                            spouse_gender=None, property_value="100000000", interest_rate="7",
+                                            gender="hombre"))
+        self.assertEqual(1, ClientController.reprice_changes(worker="test_delete"))
+
+    def test_metrics_usuarios(self):
+        """
+        Tests that the operations record their latency by phase and that slow statements are logged redacted.
+        """
+        usuario = User(id="1220001", age="70", marital_status="soltero", spouse_age=None, spouse_gender=None,
+                       property_value="123456789", interest_rate="25")
+        ClientController.configure_metrics(enabled=True, slow_query_threshold=0)
+        try:
+            ClientController.insert_client(usuario)
+            ClientController.find_clients(["1220001"])
+            list(ClientController.iter_clients())
+        finally:
+            ClientController.configure_metrics(enabled=False, slow_query_threshold=0.5)
+
+        dump = ClientController.metrics_dump()
+        for operation, phase in (("insert_client", "connect"), ("insert_client", "execute"), ("insert_client", "total"),
+                                 ("find_clients", "fetch"), ("iter_clients", "fetch")):
+            self.assertIn(f'controller_latency_seconds_count{{operation="{operation}",phase="{phase}"}}', dump)
+        self.assertIn("controller_cache_hit_rate", dump)
+
+        slow_queries = ClientController.slow_queries()
+        self.assertTrue(slow_queries)
+        self.assertFalse(any("1220001" in slow_query.statement or "123456789" in slow_query.statement
+                             for slow_query in slow_queries))
+
+    def test_iter_usuarios_closed_early(self):
+        """
+        Tests that streams stopped before their end give their connection back to the pool.
+        """
+        for id in ("1270001", "1270002"):
+            ClientController.insert_client(User(id=id, age="66", marital_status="soltero", spouse_age=None,
+                                                spouse_gender=None, property_value="250000000", interest_rate="11"))
+
+        for _ in range(ClientController.pool_metrics().get("max_size", 1) + 1):
+            clientes = ClientController.iter_clients(batch_size=1)
+            next(clientes)
+            clientes.close()
+        self.assertEqual(0, ClientController.pool_metrics().get("in_use", 0))
+        self.assertIsNotNone(ClientController.find_client("1270001"))
+
+    def test_user_record(self):
+        """
+        Tests that a User parses its numeric fields once, compares by value and hashes by id.
+        """
+        usuario = User(id="1250001", age="70", marital_status="casado", spouse_age="68", spouse_gender="F",
+                       property_value="300000000", interest_rate="12.5", gender="M")
+        self.assertEqual((70, 68, 300000000.0, 12.5),
+                         (usuario.age, usuario.spouse_age, usuario.property_value, usuario.interest_rate))
+        with self.assertRaises(AttributeError):
+            usuario.quotas = 10
+
+        mismo = User("1250001", 70, "casado", 68, "F", 300000000, 12.5, "M")
+        self.assertEqual(usuario, mismo)
+        # Users are hashed by their id, which can not change, so they can be kept in sets and used as dict keys
+        self.assertEqual(hash(usuario), hash(mismo))
+        self.assertEqual(1, len({usuario, mismo}))
+        cuotas = {usuario: 10}
+        usuario.property_value = 400000000.0
+        self.assertEqual(10, cuotas[usuario])
+        with self.assertRaises(AttributeError):
+            usuario.id = "1250002"
+        self.assertNotEqual(usuario, User("1250002", 70, "casado", 68, "F", 300000000, 12.5, "M"))
+
+        # Only whole ages are parsed; other values are kept and rejected by the checks
+        self.assertEqual((70, 70), (User("1", 70.0, "soltero", None, None, 1, 1).age, User("1", " 70", "soltero", None, None, 1, 1).age))
+        for edad in ("ab", 70.9, "70.5"):
+            usuario = User("1250003", edad, "soltero", None, None, "300000000", "12.5")
+            self.assertEqual(edad, usuario.age)
+            with self.assertRaises(ValueError):
+                ClientController.verify_client(usuario)
+
+    def test_row_factory_usuarios(self):
+        """
+        Tests that the backends build the rows they read with the given row factory.
+        """
+        usuario = User(id="1260001", age="66", marital_status="soltero", spouse_age=None, spouse_gender=None,
+                       property_value="250000000", interest_rate="11")
+        ClientController.insert_client(usuario)
+
+        repository = ClientController.get_repository()
+        with repository.transaction(row_factory=User.from_row) as transaction:
+            found = repository.find_rows(transaction, ["1260001"])
+        self.assertIsInstance(found[0], User)
+        self.assertEqual(usuario, found[0])
+
+        with repository.transaction() as transaction:
+            self.assertIsInstance(repository.find_rows(transaction, ["1260001"])[0], tuple)
+
+        streamed = [client for client in repository.iter_rows(1, row_factory=User.from_row) if client.id == "1260001"]
+        self.assertEqual([usuario], streamed)
+
 
 if __name__ == '__main__':
     unittest.main()
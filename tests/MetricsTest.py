@@ -0,0 +1,70 @@
+import unittest
+import sys
+import time
+
+# We import it so we can include the python search path
+sys.path.append("src")
+sys.path.append(".")
+
+# Import the required modules
+from src.controller.Metrics import QueryMetrics, LatencyHistogram, redact_statement
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_histogram_quantiles(self):
+        histogram = LatencyHistogram()
+        for seconds in (0.0002, 0.0002, 0.0002, 0.3):
+            histogram.observe(seconds)
+        self.assertEqual(4, histogram.count)
+        self.assertEqual(0.00025, histogram.quantile(0.5))
+        self.assertEqual(0.5, histogram.quantile(0.99))
+        self.assertEqual(0.3, histogram.max)
+
+    def test_disabled_records_nothing(self):
+        metrics = QueryMetrics(enabled=False)
+        started = metrics.start()
+        self.assertIsNone(started)
+        metrics.observe("execute", started, "SELECT 1", operation="find_client")
+        self.assertEqual({}, metrics.snapshot())
+
+    def test_slow_queries_are_redacted(self):
+        metrics = QueryMetrics(enabled=True, slow_query_threshold=0)
+        metrics.observe("execute", metrics.start(), lambda: "SELECT * FROM users WHERE id = '1234567' AND age > 62",
+                        ("1234567",), operation="find_client")
+        metrics.observe("fetch", metrics.start(), operation="find_client")
+
+        slow_query, = metrics.slow_queries
+        self.assertEqual("SELECT * FROM users WHERE id = ? AND age > ?", slow_query.statement)
+        self.assertEqual(("find_client", 1), (slow_query.operation, slow_query.parameters))
+        self.assertNotIn("1234567", slow_query.statement)
+        self.assertEqual({("find_client", "execute"), ("find_client", "fetch")}, set(metrics.snapshot()))
+
+    def test_statement_text_is_only_built_for_slow_queries(self):
+        metrics = QueryMetrics(enabled=True, slow_query_threshold=60)
+        metrics.observe("execute", metrics.start(), lambda: self.fail("statement built for a fast query"))
+        self.assertEqual(0, len(metrics.slow_queries))
+
+    def test_dump(self):
+        metrics = QueryMetrics(enabled=True)
+        started = time.perf_counter()
+        metrics.observe("total", started, operation="insert_clients")
+        dump = metrics.dump()
+        self.assertIn('controller_latency_seconds_count{operation="insert_clients",phase="total"} 1', dump)
+        self.assertIn('controller_latency_seconds_bucket{operation="insert_clients",phase="total",le="+Inf"} 1', dump)
+        self.assertIn("controller_slow_queries 0", dump)
+
+        metrics.reset()
+        self.assertEqual({}, metrics.snapshot())
+
+    def test_redact_statement_exponents(self):
+        self.assertEqual("SELECT * FROM users WHERE property_value > ? AND interest_rate < ? AND id <> ?",
+                         redact_statement("SELECT * FROM users WHERE property_value > 1.5e10 AND interest_rate < 2E-1 "
+                                          "AND id <> 'e10'"))
+
+    def test_redact_statement_shortens(self):
+        self.assertTrue(redact_statement(b"SELECT " + b"x, " * 1000).endswith(" ..."))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import unittest
+import sys
+
+# We import it so we can include the python search path
+sys.path.append("src")
+sys.path.append(".")
+
+# Import the required modules
+from src.controller.Migrations import migrate, column_type, MigrationException, CHANGE_INDEXES, DROPPED_INDEXES, INDEXES, LIST_INDEXES, MIGRATIONS, QUOTE_INDEXES
+from src.controller.Controlador_usuarios import ClientController, DB_BACKEND
+
+
+@unittest.skipUnless(DB_BACKEND == "postgres", "Needs the PostgreSQL backend")
+class MigrationsTest(unittest.TestCase):
+    """
+    Runs against the database configured in Secret_Config, inside a schema of its own
+    """
+
+    def setUp(self):
+        self.connection = ClientController.get_connection()
+        self.cursor = self.connection.cursor()
+        self.cursor.execute("DROP SCHEMA IF EXISTS migrations_test CASCADE")
+        self.cursor.execute("CREATE SCHEMA migrations_test")
+        self.cursor.execute("SET search_path TO migrations_test")
+        # Users table as created before the typed columns
+        self.cursor.execute("""
+            CREATE TABLE Users (
+                id VARCHAR(20) NOT NULL PRIMARY KEY,
+                age VARCHAR(2) NOT NULL,
+                marital_status TEXT NOT NULL,
+                spouse_age VARCHAR(2),
+                spouse_gender TEXT,
+                property_value VARCHAR(20) NOT NULL,
+                interest_rate VARCHAR(4) NOT NULL
+            )
+        """)
+        self.cursor.execute("""
+            INSERT INTO users VALUES
+                ('1', '65', 'soltero', NULL, NULL, '100000000', '25'),
+                ('2', '70', 'casado', '68', 'mujer', '200000000', '35'),
+                ('3', '66', 'casada', '', 'hombre', '150000000.5', '7.25')
+        """)
+        self.connection.commit()
+
+    def tearDown(self):
+        self.connection.rollback()
+        self.cursor.execute("DROP SCHEMA migrations_test CASCADE")
+        self.connection.commit()
+        self.cursor.close()
+        self.connection.close()
+
+    def test_migrates_varchar_table(self):
+        self.assertEqual([version for version, _, _ in MIGRATIONS], migrate(self.connection, batch_size=2))
+
+        self.assertEqual("smallint", column_type(self.cursor, "users", "age"))
+        self.assertEqual("smallint", column_type(self.cursor, "users", "spouse_age"))
+        self.assertEqual("numeric", column_type(self.cursor, "users", "property_value"))
+        self.assertEqual("numeric", column_type(self.cursor, "users", "interest_rate"))
+
+        self.cursor.execute("SELECT id, age, spouse_age, property_value, interest_rate FROM users ORDER BY id")
+        rows = [(id, age, spouse_age, float(property_value), float(interest_rate))
+                for id, age, spouse_age, property_value, interest_rate in self.cursor.fetchall()]
+        self.assertEqual([("1", 65, None, 100000000.0, 25.0),
+                          ("2", 70, 68, 200000000.0, 35.0),
+                          ("3", 66, None, 150000000.5, 7.25)], rows)
+
+        self.assertEqual("timestamp with time zone", column_type(self.cursor, "users", "computed_at"))
+        self.cursor.execute("SELECT count(*) FROM users WHERE computed_at IS NULL")
+        self.assertEqual((3,), self.cursor.fetchone())
+
+        for name, _ in INDEXES + QUOTE_INDEXES + LIST_INDEXES + CHANGE_INDEXES:
+            self.cursor.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (name,))
+            self.assertEqual((True,), self.cursor.fetchone())
+
+        # Typed columns reject values that are not numbers
+        with self.assertRaises(Exception):
+            self.cursor.execute("INSERT INTO users VALUES ('4', 'ab', 'soltero', NULL, NULL, '1', '1')")
+
+    def test_rejects_values_that_are_not_numbers(self):
+        self.cursor.execute("""
+            INSERT INTO users VALUES
+                ('4', 'ab', 'soltero', NULL, NULL, '100000000', '25'),
+                ('5', '65', 'casado', 'x', 'mujer', '99999999999999999999', '7')
+        """)
+        self.connection.commit()
+        with self.assertRaisesRegex(MigrationException, "2 rows .* 4, 5"):
+            migrate(self.connection, batch_size=2)
+
+        # The failed run leaves no trigger behind and writes keep working on the legacy columns
+        self.assertEqual("character varying", column_type(self.cursor, "users", "age"))
+        self.cursor.execute("SELECT count(*) FROM pg_trigger WHERE tgrelid = 'users'::regclass AND NOT tgisinternal")
+        self.assertEqual((0,), self.cursor.fetchone())
+        self.cursor.execute("INSERT INTO users VALUES ('6', 'cd', 'soltero', NULL, NULL, '1', '1')")
+
+        # Once the rows are fixed the migration runs again from the start
+        self.cursor.execute("UPDATE users SET age = '66', spouse_age = NULL, property_value = '5' WHERE id IN ('4', '5', '6')")
+        self.connection.commit()
+        self.assertEqual([version for version, _, _ in MIGRATIONS], migrate(self.connection, batch_size=2))
+        self.cursor.execute("SELECT count(*) FROM users WHERE id IN ('4', '5', '6') AND age = 66")
+        self.assertEqual((3,), self.cursor.fetchone())
+
+    def test_drops_unused_indexes(self):
+        # Index created by the first version of the list_indexes migration
+        self.cursor.execute("CREATE INDEX users_property_value_idx ON users (property_value)")
+        self.connection.commit()
+        migrate(self.connection)
+        for name in DROPPED_INDEXES:
+            self.cursor.execute("SELECT to_regclass(%s)", (name,))
+            self.assertEqual((None,), self.cursor.fetchone())
+
+    def test_tracks_changes_after_migration(self):
+        migrate(self.connection)
+        self.cursor.execute("UPDATE users SET interest_rate = 30 WHERE id = '2'")
+        self.cursor.execute("UPDATE users SET quotas = 100 WHERE id = '3'")
+        self.cursor.execute("SELECT id FROM users WHERE version = txid_current() AND updated_at = now()")
+        self.assertEqual([("2",)], self.cursor.fetchall())
+
+    def test_nothing_pending_after_migration(self):
+        migrate(self.connection)
+        self.assertEqual([], migrate(self.connection))
+
+
+if __name__ == '__main__':
+    unittest.main()
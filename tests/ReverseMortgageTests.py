@@ -1,8 +1,17 @@
 # Unit testing library
 import unittest
 import sys
+import os
+import io
+import math
+import tempfile
 sys.path.append('src')
 from ReverseMortgage import MonthlyPayment
+from ReverseMortgage.MortalityTable import MortalityTable
+from ReverseMortgage import MonteCarlo
+from ReverseMortgage import Sensitivity
+from ReverseMortgage import Money
+from ReverseMortgage.ClientBatch import ClientBatch
 
 
 class MortgageCalcTest(unittest.TestCase):
@@ -282,5 +291,373 @@ class MortgageCalcTest(unittest.TestCase):
             reverse_mortgage = MonthlyPayment.ReverseMortgage(property_value, interest, client)
             reverse_mortgage.calculate_monthly_fee()
 
+class BatchMortgageCalcTest(unittest.TestCase):
+    # Same applicants as the normal and special cases of MortgageCalcTest
+    ages = [65, 75, 60, 74, 60, 70, 62, 71, 74, 79, 79, 76]
+    genders = ['M', 'F', 'M', 'F', 'F', 'M', 'F', 'M', 'M', 'F', 'F', 'F']
+    marital_statuses = ["Married", "Single", "Married", "Married", "Widowed", "Married",
+                        "Single", "Married", "Married", "Married", "Married", "Married"]
+    spouses_ages = [63, None, 70, 68, None, 60, None, 69, 71, 66, 79, 74]
+    spouses_genders = ['F', None, 'M', 'M', None, 'F', None, 'F', 'F', 'M', 'F', 'M']
+    property_values = [150000000, 300000000, 200000000, 500000000, 250000000, 100000000,
+                       760000000, 310000000, 800000000, 424000000, 280000000, 900000000]
+    interests = [5.5, 3.5, 6, 5.2, 7, 7.5, 0, 8, 5, 6.2, 3.3, 4.3]
+
+    def columns(self, **changes):
+        columns = {
+            'ages': list(self.ages),
+            'genders': list(self.genders),
+            'marital_statuses': list(self.marital_statuses),
+            'spouses_ages': list(self.spouses_ages),
+            'spouses_genders': list(self.spouses_genders),
+            'property_values': list(self.property_values),
+            'interests': list(self.interests),
+        }
+        for name, (row, value) in changes.items():
+            columns[name][row] = value
+        return columns
+
+    def testBatchMatchesScalar(self):
+        monthly_fees, quotas, monthly_rates = MonthlyPayment.calculate_monthly_fees(**self.columns())
+        for row in range(len(self.ages)):
+            client = MonthlyPayment.Client(self.ages[row], self.genders[row], self.marital_statuses[row],
+                                           self.spouses_ages[row], self.spouses_genders[row])
+            mortgage = MonthlyPayment.ReverseMortgage(self.property_values[row], self.interests[row], client)
+            self.assertEqual(mortgage.calculate_monthly_fee(), monthly_fees[row])
+            self.assertEqual(mortgage.quotas, quotas[row])
+            self.assertEqual(mortgage.monthly_rate, monthly_rates[row])
+
+    def testBatchZeroInterest(self):
+        monthly_fees, quotas, monthly_rates = MonthlyPayment.calculate_monthly_fees(**self.columns())
+        self.assertEqual(3518518.52, monthly_fees[6])
+        self.assertEqual(216, quotas[6])
+        self.assertEqual(0, monthly_rates[6])
+
+    def testBatchErrors(self):
+        cases = [
+            ({'interests': (3, -5)}, MonthlyPayment.NegativeInterest),
+            ({'interests': (3, 9)}, MonthlyPayment.AboveMaxInterest),
+            ({'property_values': (3, -250000000)}, MonthlyPayment.NegativePropertyValue),
+            ({'property_values': (3, 0)}, MonthlyPayment.PropertyZeroValue),
+            ({'ages': (3, -71)}, MonthlyPayment.NegativeAge),
+            ({'ages': (0, 75)}, MonthlyPayment.AboveMaxAge),
+            ({'genders': (4, 'X')}, MonthlyPayment.InvalidGender),
+            ({'marital_statuses': (1, 'Complicated')}, MonthlyPayment.InvalidMaritalStatus),
+            ({'ages': (1, 59)}, MonthlyPayment.InvalidAge),
+        ]
+        for changes, exception in cases:
+            with self.assertRaises(exception):
+                MonthlyPayment.calculate_monthly_fees(**self.columns(**changes))
+
+    def testBatchAgesFollowScalarRule(self):
+        # The age is changed in row 0 and the spouse's age in row 2, both of married applicants
+        for age in (65, 65.0, '65', True, None):
+            for row, name in ((0, 'ages'), (2, 'spouses_ages')):
+                columns = self.columns(**{name: (row, age)})
+                try:
+                    MonthlyPayment.Client(columns['ages'][row], columns['genders'][row], columns['marital_statuses'][row],
+                                          columns['spouses_ages'][row], columns['spouses_genders'][row])
+                    scalar_valid = True
+                except MonthlyPayment.ClientException:
+                    scalar_valid = False
+                error_code = int(MonthlyPayment.validate_batch(**columns)[row])
+                self.assertEqual(scalar_valid, error_code == MonthlyPayment.VALID, (age, name))
+                self.assertEqual(age == 65 and type(age) == int, scalar_valid, (age, name))
+
+    def testBatchValidation(self):
+        columns = self.columns(ages=(0, 80), genders=(4, 'X'), interests=(7, 9))
+        columns['spouses_ages'][2] = None
+        error_codes = MonthlyPayment.validate_batch(**columns)
+        self.assertEqual([MonthlyPayment.ABOVE_MAX_AGE, MonthlyPayment.INVALID_SPOUSE_AGE_VALUE,
+                          MonthlyPayment.INVALID_GENDER, MonthlyPayment.ABOVE_MAX_INTEREST],
+                         [int(error_codes[row]) for row in (0, 2, 4, 7)])
+        self.assertEqual(4, int((error_codes != MonthlyPayment.VALID).sum()))
+        report = MonthlyPayment.reject_report(error_codes)
+        self.assertEqual([0, 2, 4, 7], [row for row, _, _, _ in report])
+        self.assertEqual(['AboveMaxAge', 'InvalidAge', 'InvalidGender', 'AboveMaxInterest'], [name for _, _, name, _ in report])
+
+    def testSchedule(self):
+        client = MonthlyPayment.Client(62, 'F', "Single", None, None)
+        schedule = list(MonthlyPayment.ReverseMortgage(760000000, 0, client).schedule())
+        self.assertEqual(216, len(schedule))
+        self.assertEqual((1, 3518518.52, 0, 756481481.48), tuple(schedule[0]))
+        self.assertAlmostEqual(0, schedule[-1].balance, delta=1)
+
+    def testSchedulesMatchScalar(self):
+        monthly_fees, quotas, monthly_rates = MonthlyPayment.calculate_monthly_fees(**self.columns())
+        schedules = MonthlyPayment.calculate_schedules(self.property_values, monthly_fees, monthly_rates, quotas)
+        for row in range(len(self.ages)):
+            client = MonthlyPayment.Client(self.ages[row], self.genders[row], self.marital_statuses[row],
+                                           self.spouses_ages[row], self.spouses_genders[row])
+            mortgage = MonthlyPayment.ReverseMortgage(self.property_values[row], self.interests[row], client)
+            expected = [(month.payment, month.interest, month.balance) for month in mortgage.schedule()]
+            self.assertEqual(expected, [tuple(month) for month in schedules[row, :quotas[row]].tolist()])
+            self.assertFalse(schedules[row, quotas[row]:].any())
+
+    def testSolvePropertyValues(self):
+        monthly_fees, quotas, _ = MonthlyPayment.calculate_monthly_fees(**self.columns())
+        property_values = MonthlyPayment.solve_property_values(monthly_fees, self.interests, quotas)
+        for expected, solved in zip(self.property_values, property_values):
+            self.assertAlmostEqual(1, solved / expected, places=7)
+
+    def testSolveInterests(self):
+        monthly_fees, quotas, _ = MonthlyPayment.calculate_monthly_fees(**self.columns())
+        solution = MonthlyPayment.solve_interests(monthly_fees, self.property_values, quotas, tolerance=0.005)
+        self.assertTrue(solution.converged.all())
+        self.assertTrue((abs(solution.residuals) <= 0.005).all())
+        for expected, solved in zip(self.interests, solution.interests):
+            self.assertAlmostEqual(expected, solved, places=5)
+
+    def testSolveInterestsOutOfRange(self):
+        # A fee above the one given by the maximum interest has no solution
+        solution = MonthlyPayment.solve_interests([3492364.69, 5000000], 310000000, 132, tolerance=0.005)
+        self.assertEqual([True, False], solution.converged.tolist())
+        self.assertAlmostEqual(8, solution.interests[0], places=5)
+        self.assertTrue(math.isnan(solution.interests[1]))
+
+
+class ConstructionTest(unittest.TestCase):
+    def testSlots(self):
+        client = MonthlyPayment.Client(65, 'M', "Married", 63, 'F')
+        mortgage = MonthlyPayment.ReverseMortgage(150000000, 5.5, client)
+        self.assertFalse(hasattr(client, '__dict__'))
+        self.assertFalse(hasattr(mortgage, '__dict__'))
+        self.assertEqual((63, 'F', 17), (client.minor_age, client.minor_gender, client.estimated_years_of_life))
+
+    def testFeeIsCached(self):
+        client = MonthlyPayment.Client(65, 'M', "Married", 63, 'F')
+        mortgage = MonthlyPayment.ReverseMortgage(150000000, 5.5, client)
+        self.assertIn('Monthly Fee: $1,122,501.78', repr(mortgage))
+        self.assertIs(mortgage.calculate_monthly_fee(), mortgage.calculate_monthly_fee())
+
+    def testFeeFollowsChangedInputs(self):
+        mortgage = MonthlyPayment.ReverseMortgage(150000000, 5.5, MonthlyPayment.Client(65, 'M', "Married", 63, 'F'))
+        mortgage.calculate_monthly_fee()
+        mortgage.property_value = 300000000
+        mortgage.interest = 7
+        mortgage.client = MonthlyPayment.Client(70, 'F', "Single", None, None)
+        fresh = MonthlyPayment.ReverseMortgage(300000000, 7, MonthlyPayment.Client(70, 'F', "Single", None, None))
+        self.assertEqual(fresh.calculate_monthly_fee(), mortgage.calculate_monthly_fee())
+        self.assertEqual((fresh.quotas, fresh.monthly_rate), (mortgage.quotas, mortgage.monthly_rate))
+        with self.assertRaises(MonthlyPayment.NegativeInterest):
+            mortgage.interest = -1
+        self.assertEqual(7, mortgage.interest)
+
+    def testPropertyValueCheckedOnFee(self):
+        client = MonthlyPayment.Client(74, 'F', "Divorced", None, None)
+        mortgage = MonthlyPayment.ReverseMortgage(0, 6.8, client)
+        with self.assertRaises(MonthlyPayment.PropertyZeroValue):
+            mortgage.calculate_monthly_fee()
+
+    def testAnnuityFactorCache(self):
+        MonthlyPayment.annuity_factor.cache_clear()
+        for property_value in (150000000, 300000000):
+            client = MonthlyPayment.Client(65, 'M', "Married", 63, 'F')
+            MonthlyPayment.ReverseMortgage(property_value, 5.5, client).calculate_monthly_fee()
+        stats = MonthlyPayment.annuity_cache_stats()
+        self.assertEqual((1, 1, 0.5, 1), (stats['hits'], stats['misses'], stats['hit_rate'], stats['size']))
+
+
+class MortalityTableTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Gompertz law of mortality, females die at 60% of the male rate
+        cls.ages = list(range(0, 111))
+        cls.male_qx = [min(1.0, 0.0001 * 1.094 ** age) for age in cls.ages]
+        cls.female_qx = [min(1.0, 0.00006 * 1.094 ** age) for age in cls.ages]
+        cls.table = MortalityTable(cls.ages, cls.male_qx, cls.female_qx)
+
+    @staticmethod
+    def expectancy(qx, age):
+        survivors, years = 1.0, 0.5
+        for probability in qx[age:-1]:
+            survivors *= 1 - probability
+            years += survivors
+        return years
+
+    def testLifeExpectancy(self):
+        self.assertAlmostEqual(self.expectancy(self.male_qx, 65), self.table.life_expectancy(65, 'M'))
+        self.assertAlmostEqual(self.expectancy(self.female_qx, 70), self.table.life_expectancy(70, 'f'))
+
+    def testJointLifeExpectancy(self):
+        joint = self.table.joint_life_expectancy([65, 70], ['M', 'F'], [62, 70], ['F', 'M'])
+        self.assertGreater(joint[0], self.table.life_expectancy(62, 'F'))
+        self.assertAlmostEqual(joint[1], self.table.joint_life_expectancy(70, 'M', 70, 'F'))
+
+    def testFromCsv(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'life_table.csv')
+            with open(path, 'w') as file:
+                file.write('age,gender,qx\n')
+                for age, male, female in zip(self.ages, self.male_qx, self.female_qx):
+                    file.write(f'{age},M,{male!r}\n{age},F,{female!r}\n')
+            table = MortalityTable.from_csv(path)
+        self.assertEqual(self.table.life_expectancy(66, 'M'), table.life_expectancy(66, 'M'))
+
+    def testClientWithTable(self):
+        client = MonthlyPayment.Client(65, 'M', "Married", 63, 'F', mortality_table=self.table)
+        mortgage = MonthlyPayment.ReverseMortgage(150000000, 5.5, client)
+        self.assertEqual(self.table.joint_life_expectancy(65, 'M', 63, 'F'), client.estimated_years_of_life)
+        self.assertEqual(round(client.estimated_years_of_life * 12), mortgage.quotas)
+
+    def testBatchWithTable(self):
+        batch = BatchMortgageCalcTest
+        monthly_fees, quotas, _ = MonthlyPayment.calculate_monthly_fees(
+            batch.ages, batch.genders, batch.marital_statuses, batch.spouses_ages, batch.spouses_genders,
+            batch.property_values, batch.interests, mortality_table=self.table)
+        for row in range(len(batch.ages)):
+            client = MonthlyPayment.Client(batch.ages[row], batch.genders[row], batch.marital_statuses[row],
+                                           batch.spouses_ages[row], batch.spouses_genders[row], self.table)
+            mortgage = MonthlyPayment.ReverseMortgage(batch.property_values[row], batch.interests[row], client)
+            self.assertEqual(mortgage.quotas, quotas[row])
+            self.assertEqual(mortgage.calculate_monthly_fee(), monthly_fees[row])
+
+
+class MonteCarloTest(unittest.TestCase):
+    def setUp(self):
+        client = MonthlyPayment.Client(65, 'M', "Married", 63, 'F')
+        self.mortgage = MonthlyPayment.ReverseMortgage(150000000, 5.5, client)
+
+    def testReproducibleAcrossWorkers(self):
+        single = MonteCarlo.simulate_terminal_ltv(self.mortgage, paths=3000, seed=7, max_workers=1)
+        pooled = MonteCarlo.simulate_terminal_ltv(self.mortgage, paths=3000, seed=7, max_workers=2)
+        self.assertEqual(3000, len(single.terminal_ltv))
+        self.assertTrue((single.terminal_ltv == pooled.terminal_ltv).all())
+        self.assertEqual(single.percentiles, pooled.percentiles)
+
+    def testDeterministicScenario(self):
+        scenario = MonteCarlo.MarketScenario(rate_volatility=0, appreciation=0, appreciation_volatility=0)
+        result = MonteCarlo.simulate_terminal_ltv(self.mortgage, paths=10, scenario=scenario, max_workers=1)
+        # Without shocks the loan grows to the property value compounded over all the quotas
+        expected = (1 + self.mortgage.monthly_rate) ** self.mortgage.quotas
+        self.assertAlmostEqual(expected, result.percentiles[50], places=4)
+
+
+class SensitivityTest(unittest.TestCase):
+    def testGridMatchesScalar(self):
+        grid = Sensitivity.fee_grid([0, 3.5, 8], [100000000, 310000000], [60, 71, 74], gender='M')
+        self.assertEqual((3, 2, 3), grid.fees.shape)
+        for interest in grid.interests:
+            for property_value in grid.property_values:
+                for age in grid.ages:
+                    client = MonthlyPayment.Client(int(age), 'M', "Single", None, None)
+                    mortgage = MonthlyPayment.ReverseMortgage(property_value, interest, client)
+                    self.assertEqual(mortgage.calculate_monthly_fee(), grid.fee(interest, property_value, age))
+
+    def testGridCouple(self):
+        grid = Sensitivity.fee_grid([5.5], [150000000], [65], marital_status="Married", spouses_age=63, spouses_gender='F')
+        self.assertEqual(1122501.78, grid.fee(5.5, 150000000, 65))
+
+    def testGridErrors(self):
+        with self.assertRaises(MonthlyPayment.AboveMaxInterest):
+            Sensitivity.fee_grid([5, 9], [100000000], [65])
+        with self.assertRaises(MonthlyPayment.PropertyZeroValue):
+            Sensitivity.fee_grid([5], [0], [65])
+        with self.assertRaises(MonthlyPayment.AboveMaxAge):
+            Sensitivity.fee_grid([5], [100000000], [65, 75])
+
+
+class MoneyTest(unittest.TestCase):
+    def testToCents(self):
+        self.assertEqual(112250178, Money.to_cents(1122501.78))
+        self.assertEqual([112250178, 1, -250], Money.to_cents([1122501.78, 0.005000001, -2.5]).tolist())
+        self.assertEqual(1122501.78, Money.from_cents(112250178))
+        self.assertEqual('-$1,122,501.78', Money.format_cents(-112250178))
+
+    def testFeesInCents(self):
+        batch = BatchMortgageCalcTest
+        columns = (batch.ages, batch.genders, batch.marital_statuses, batch.spouses_ages, batch.spouses_genders,
+                   batch.property_values, batch.interests)
+        monthly_fees, _, _ = MonthlyPayment.calculate_monthly_fees(*columns)
+        monthly_fees_cents, _, _ = Money.calculate_monthly_fees_cents(*columns)
+        self.assertEqual(Money.to_cents(monthly_fees).tolist(), monthly_fees_cents.tolist())
+
+    def testScheduleInCents(self):
+        client = MonthlyPayment.Client(65, 'M', "Married", 63, 'F')
+        mortgage = MonthlyPayment.ReverseMortgage(150000000, 5.5, client)
+        rows = list(Money.schedule_cents(mortgage))
+        self.assertEqual((1, 112250178, 67075484, 14954825306), tuple(rows[0]))
+        block = Money.calculate_schedules_cents([150000000], [112250178], [mortgage.monthly_rate], [mortgage.quotas])
+        self.assertEqual([tuple(row)[1:] for row in rows], [tuple(row) for row in block[0].tolist()])
+
+    def testReconcile(self):
+        report = Money.reconcile([0.1, 0.2, 0.3], [10, 21, 30])
+        self.assertEqual([1], report.rows.tolist())
+        self.assertEqual((20, 21), (report.float_cents[0], report.exact_cents[0]))
+        self.assertEqual(-1, report.drift_cents)
+        self.assertIn('Rows with differences: 1', report.summary())
+
+
+
+class ClientBatchTest(unittest.TestCase):
+    def batch(self):
+        batch = BatchMortgageCalcTest
+        return ClientBatch.from_columns([str(row) for row in range(len(batch.ages))], batch.ages, batch.genders,
+                                        batch.marital_statuses, batch.spouses_ages, batch.spouses_genders,
+                                        batch.property_values, batch.interests)
+
+    def testTypedColumns(self):
+        clients = self.batch()
+        self.assertEqual(12, len(clients))
+        self.assertEqual(('int8', 'int8', 'int8', 'float64'), (clients.ages.dtype.name, clients.genders.dtype.name,
+                                                              clients.marital_statuses.dtype.name, clients.interests.dtype.name))
+        self.assertEqual([0, 1, 0], clients.genders[:3].tolist())
+        self.assertLess(clients.nbytes, 40 * len(clients))
+
+    def testMatchesColumns(self):
+        batch = BatchMortgageCalcTest
+        expected = MonthlyPayment.calculate_monthly_fees(**BatchMortgageCalcTest().columns())
+        for result, expected_result in zip(self.batch().calculate_monthly_fees(), expected):
+            self.assertEqual(expected_result.tolist(), result.tolist())
+
+        table = MortalityTable(range(0, 111), [min(1.0, 0.0001 * 1.094 ** age) for age in range(0, 111)],
+                               [min(1.0, 0.00006 * 1.094 ** age) for age in range(0, 111)])
+        _, quotas, _ = self.batch().calculate_monthly_fees(mortality_table=table)
+        self.assertEqual(MonthlyPayment.calculate_monthly_fees(
+            batch.ages, batch.genders, batch.marital_statuses, batch.spouses_ages, batch.spouses_genders,
+            batch.property_values, batch.interests, mortality_table=table)[1].tolist(), quotas.tolist())
+
+    def testValidation(self):
+        columns = BatchMortgageCalcTest().columns(ages=(0, 80), genders=(4, 'X'), interests=(7, 9))
+        columns['spouses_ages'][2] = None
+        columns['ages'][5] = 'setenta'
+        clients = ClientBatch.from_columns(range(12), **columns)
+        self.assertEqual(MonthlyPayment.validate_batch(**columns).tolist(), clients.validate().tolist())
+        self.assertEqual(MonthlyPayment.INVALID_AGE_CODE, clients.ages[5])
+        with self.assertRaises(MonthlyPayment.AboveMaxAge):
+            clients.calculate_monthly_fees()
+
+        valid = clients[clients.validate() == MonthlyPayment.VALID]
+        self.assertEqual(['1', '3', '6', '8', '9', '10', '11'], valid.ids.tolist())
+
+    def testTypedColumnsAreNotCopied(self):
+        clients = self.batch()
+        again = ClientBatch(*clients.columns())
+        for column, same in zip(clients.columns(), again.columns()):
+            self.assertTrue(same is column)
+
+    def testFromRowsAndCsv(self):
+        aliases = {'gender_aliases': {'hombre': 'M', 'mujer': 'F'},
+                   'marital_status_aliases': {'casado': 'married', 'soltera': 'single'}}
+        rows = [('1', 65, 'Casado', 63, 'mujer', 150000000, 5.5, 'hombre'),
+                ('2', 75, 'soltera', None, None, 300000000, 3.5, 'mujer')]
+        from_rows = ClientBatch.from_rows(rows, **aliases)
+
+        csv_file = io.StringIO('id,age,gender,marital_status,spouse_age,spouse_gender,property_value,interest_rate\n'
+                               '1,65,hombre,Casado,63,mujer,150000000,5.5\n'
+                               '2,75,mujer,soltera,,,300000000,3.5\n')
+        from_csv = ClientBatch.from_csv(csv_file, **aliases)
+
+        expected = MonthlyPayment.calculate_monthly_fees([65, 75], ['M', 'F'], ['Married', 'Single'], [63, None], ['F', None],
+                                                         [150000000, 300000000], [5.5, 3.5])[0].tolist()
+        self.assertEqual(expected, from_rows.calculate_monthly_fees()[0].tolist())
+        self.assertEqual(expected, from_csv.calculate_monthly_fees()[0].tolist())
+        self.assertEqual(['1', '2'], from_csv.ids.tolist())
+        self.assertEqual(0, len(ClientBatch.from_rows([])))
+
+        with self.assertRaises(ValueError):
+            ClientBatch.from_csv(io.StringIO('id,age\n1,65\n'))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+import sys
+
+# We import it so we can include the python search path
+sys.path.append("src")
+sys.path.append(".")
+
+# Import the required modules
+import tests.DataBaseTest as DataBaseTest
+from src.controller.Controlador_usuarios import ClientController
+from src.controller.SQLiteRepository import SQLiteClientRepository
+
+
+class SQLiteControllerTest(DataBaseTest.ControllerTest):
+    """
+    Runs every test of the controller against an in-memory SQLite database, whatever backend is configured
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.previous_repository = ClientController.repository
+        repository = SQLiteClientRepository(":memory:")
+        repository.create_table()
+        ClientController.use_repository(repository)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        ClientController.use_repository(cls.previous_repository)
+
+
+if __name__ == '__main__':
+    unittest.main()